@@ -1,4 +1,6 @@
 from flask import Flask, request, jsonify
+import click
+import sys
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token
@@ -6,6 +8,12 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from services.events import broker
+from services.ratelimit import limiter
+from services.dbpool import TimedQueuePool
+from services import metrics, querystats
+from services.profiling import profiler
+from services.tracing import tracer
 
 # Load environment variables
 load_dotenv()
@@ -14,7 +22,7 @@ load_dotenv()
 db = SQLAlchemy()
 jwt = JWTManager()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     print("DB URL from env:", os.getenv("DATABASE_URL"))
 
@@ -26,43 +34,302 @@ def create_app():
         # Fix postgres:// to postgresql:// for SQLAlchemy 1.4+
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///ecommerce.db'
+    # sql or memory; see services/storage.py
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'sql')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-string')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    app.config['EVENT_BUFFER_SIZE'] = int(os.environ.get('EVENT_BUFFER_SIZE', 1000))
+    app.config['EVENT_SUBSCRIBER_QUEUE_SIZE'] = int(os.environ.get('EVENT_SUBSCRIBER_QUEUE_SIZE', 256))
+    app.config['EVENT_HEARTBEAT_SECONDS'] = int(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15))
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['RATE_LIMIT_STORAGE_URL'] = os.environ.get('RATE_LIMIT_STORAGE_URL', 'memory://')
+    app.config['DB_POOL_WAIT_SHED_SECONDS'] = float(os.environ.get('DB_POOL_WAIT_SHED_SECONDS', 0.5))
+    # Budgets are looked up by endpoint, then blueprint, then 'default'.
+    # rate is tokens per second, burst the bucket size, concurrency the
+    # number of in-flight requests allowed per caller.
+    app.config['RATE_LIMITS'] = {
+        'default': {'rate': 50, 'burst': 100},
+        'products.get_products': {'rate': 10, 'burst': 30, 'concurrency': 4},
+        'orders.create_order': {'rate': 1, 'burst': 5, 'concurrency': 2},
+        'orders': {'rate': 10, 'burst': 20, 'concurrency': 4},
+        'cart': {'rate': 10, 'burst': 20, 'concurrency': 4},
+        'auth': {'rate': 2, 'burst': 10},
+        'events': {'rate': 0.5, 'burst': 5},
+        'exports': {'rate': 0.2, 'burst': 5, 'concurrency': 1}
+    }
+    app.config['RATE_LIMIT_EXEMPT'] = ['health_check', 'metrics.metrics']
+    app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+    app.config['IDEMPOTENCY_WAIT_SECONDS'] = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+    app.config['BULK_STATUS_CHUNK_SIZE'] = int(os.environ.get('BULK_STATUS_CHUNK_SIZE', 1000))
+    app.config['BULK_STATUS_MAX_ORDERS'] = int(os.environ.get('BULK_STATUS_MAX_ORDERS', 50000))
+    app.config['ORDER_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 90))
+    app.config['ORDER_ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+    app.config['ORDER_ARCHIVE_INTERVAL_SECONDS'] = int(os.environ.get('ORDER_ARCHIVE_INTERVAL_SECONDS', 0))
+    app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR', os.path.join(app.root_path, 'exports'))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    app.config['TOP_SELLERS_REFRESH_SECONDS'] = float(os.environ.get('TOP_SELLERS_REFRESH_SECONDS', 60))
+    app.config['TOP_SELLERS_MAX_K'] = int(os.environ.get('TOP_SELLERS_MAX_K', 100))
+    app.config['RECOMMENDATIONS_TOP_N'] = int(os.environ.get('RECOMMENDATIONS_TOP_N', 20))
+    app.config['RECOMMENDATIONS_LAG_SECONDS'] = float(os.environ.get('RECOMMENDATIONS_LAG_SECONDS', 60))
+    app.config['RECOMMENDATIONS_REFRESH_SECONDS'] = float(os.environ.get('RECOMMENDATIONS_REFRESH_SECONDS', 0))
+    app.config['FACET_INDEX_TTL_SECONDS'] = float(os.environ.get('FACET_INDEX_TTL_SECONDS', 30))
+    app.config['SUGGEST_INDEX_TTL_SECONDS'] = float(os.environ.get('SUGGEST_INDEX_TTL_SECONDS', 300))
+    app.config['CART_TTL_DAYS'] = float(os.environ.get('CART_TTL_DAYS', 30))
+    app.config['CART_COMPACTION_BATCH_SIZE'] = int(os.environ.get('CART_COMPACTION_BATCH_SIZE', 500))
+    app.config['CART_COMPACTION_ARCHIVE'] = os.environ.get('CART_COMPACTION_ARCHIVE', 'false').lower() == 'true'
+    app.config['CART_COMPACTION_INTERVAL_SECONDS'] = float(os.environ.get('CART_COMPACTION_INTERVAL_SECONDS', 0))
+    # Checkout stock decrements are group-committed per SKU; see services/stock_reservations.py
+    app.config['STOCK_RESERVATION_WINDOW_MS'] = float(os.environ.get('STOCK_RESERVATION_WINDOW_MS', 2))
+    app.config['STOCK_RESERVATION_MAX_BATCH'] = int(os.environ.get('STOCK_RESERVATION_MAX_BATCH', 256))
+    app.config['STOCK_RESERVATION_TIMEOUT_SECONDS'] = float(os.environ.get('STOCK_RESERVATION_TIMEOUT_SECONDS', 5))
+    # Stock holds older than this belong to checkouts that died before their order committed
+    app.config['STOCK_HOLD_LEAK_SECONDS'] = float(os.environ.get('STOCK_HOLD_LEAK_SECONDS', 600))
+    app.config['SLOW_QUERY_SECONDS'] = float(os.environ.get('SLOW_QUERY_SECONDS', 0.2))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    app.config['QUERY_STATS_HEADERS'] = os.environ.get('QUERY_STATS_HEADERS', 'false').lower() == 'true'
+    # Statement budgets per endpoint; requests over budget are logged
+    app.config['QUERY_BUDGETS'] = {
+        'products.get_products': 3,
+        'products.get_product': 2,
+        'orders.get_order': 4,
+        'orders.get_order_by_number': 4,
+        'cart.get_cart_items': 3,
+        'analytics.get_metrics': 7
+    }
+    app.config['TRACING_EXPORTER'] = os.environ.get('TRACING_EXPORTER', 'none')  # none, json, otlp
+    app.config['TRACING_FILE'] = os.environ.get('TRACING_FILE', os.path.join(app.root_path, 'traces', 'spans.ndjson'))
+    app.config['TRACING_OTLP_ENDPOINT'] = os.environ.get('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    app.config['TRACING_SERVICE_NAME'] = os.environ.get('TRACING_SERVICE_NAME', 'ecommerce-api')
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_INTERVAL_SECONDS'] = float(os.environ.get('PROFILE_INTERVAL_SECONDS', 0.001))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.root_path, 'profiles'))
+    app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 200))
+    # Overrides such as a test database; everything below sees them
+    app.config.update(config or {})
+    if app.config['STORAGE_BACKEND'] == 'memory':
+        # Only the SQL-only features (idempotency keys, analytics, ...) use the database then
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+        # Time pool checkouts so load can be shed when the pool is saturated
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': TimedQueuePool}
     
     # Initialize extensions with app
     db.init_app(app)
     jwt.init_app(app)
+    broker.init_app(app)
+    tracer.init_app(app)
+    metrics.init_app(app, db)
+    querystats.init_app(app, db)
+    limiter.init_app(app)
+    profiler.init_app(app)
     CORS(app, origins=["*"])
     
     # Import models after db initialization
     from models.user import User
     from models.product import Product
     from models.order import Order, OrderItem
-    from models.cart import CartItem
+    from models.cart import CartItem, CartActivity
+    from models.idempotency import IdempotencyRecord
+    from models.archive import ArchivedOrder, ArchivedOrderItem, ArchiveStat, ArchivedCartItem
+    from models.sales import SalesCounter
+    from models.recommendation import ProductPair, ProductRecommendation, RecommendationState
+    from models.facet import ProductFacetCount
+    from models.reservation import StockHold
+    
+    # Keeps product_facet_counts in step with product writes
+    from services import facets
+    facets.init_app(app)
+    from services.stock_reservations import stock_reserver
+    stock_reserver.init_app(app)
+    from services import storage
+    storage.init_app(app)
     
     # Create database tables
     with app.app_context():
         db.create_all()
     
+    # Typeahead prefix index, built now and kept current on product writes
+    from services import suggest
+    suggest.init_app(app)
+    
     # Import and register routes
     from routes.auth import auth_bp
     from routes.products import products_bp
     from routes.orders import orders_bp
     from routes.cart import cart_bp
     from routes.analytics import analytics_bp
+    from routes.events import events_bp
+    from routes.profiles import profiles_bp
+    from routes.exports import exports_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(products_bp, url_prefix='/api/products')
     app.register_blueprint(orders_bp, url_prefix='/api/orders')
     app.register_blueprint(cart_bp, url_prefix='/api/cart')
     app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
+    app.register_blueprint(exports_bp, url_prefix='/api/exports')
+    
+    # Background archival is opt-in; run it in one process only
+    if app.config['ORDER_ARCHIVE_INTERVAL_SECONDS'] > 0:
+        from services.archival import start_archiver
+        start_archiver(app)
+    
+    if app.config['CART_COMPACTION_INTERVAL_SECONDS'] > 0:
+        from services.cart_compaction import start_cart_compactor
+        start_cart_compactor(app)
+    
+    if app.config['RECOMMENDATIONS_REFRESH_SECONDS'] > 0:
+        from services.recommendations import start_recommender
+        start_recommender(app)
     
     # Health check endpoint
     @app.route('/api/health')
     def health_check():
         return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
     
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys():
+        """Delete expired idempotency records"""
+        from services.idempotency import purge_expired
+        print(f"Purged {purge_expired()} expired idempotency keys")
+    
+    @app.cli.command('archive-orders')
+    @click.option('--older-than-days', type=int, default=None, help='Archive closed orders older than this')
+    @click.option('--batch-size', type=int, default=None)
+    @click.option('--max-batches', type=int, default=None)
+    def archive_orders_command(older_than_days, batch_size, max_batches):
+        """Move closed orders to the archive tables"""
+        from services.archival import archive_orders
+        moved = archive_orders(
+            older_than_days if older_than_days is not None else app.config['ORDER_ARCHIVE_AFTER_DAYS'],
+            batch_size or app.config['ORDER_ARCHIVE_BATCH_SIZE'],
+            max_batches
+        )
+        print(f"Archived {moved} orders")
+    
+    @app.cli.command('reconcile-stock')
+    @click.option('--older-than', type=float, default=None, help='Seconds after which a stock hold counts as leaked')
+    def reconcile_stock(older_than):
+        """Put back stock reserved by checkouts that died before their order committed"""
+        from services.stock_reservations import stock_reserver
+        holds, units = stock_reserver.reconcile(
+            older_than if older_than is not None else app.config['STOCK_HOLD_LEAK_SECONDS']
+        )
+        print(f"Put back {units} units from {holds} leaked checkouts")
+    
+    @app.cli.command('rebuild-sales-counters')
+    def rebuild_sales_counters():
+        """Recompute top-seller counters from the last 30 days of orders"""
+        from services.sales import rebuild_counters
+        print(f"Rebuilt {rebuild_counters()} sales counter rows")
+    
+    @app.cli.command('prune-sales-counters')
+    def prune_sales_counters():
+        """Delete sales counter buckets older than the largest window"""
+        from services.sales import prune_counters
+        print(f"Pruned {prune_counters()} sales counter rows")
+    
+    @app.cli.command('build-recommendations')
+    @click.option('--full', is_flag=True, help='Recompute from every order instead of folding in new ones')
+    def build_recommendations(full):
+        """Update frequently-bought-together rankings"""
+        from services.recommendations import build_full, refresh
+        top_n = app.config['RECOMMENDATIONS_TOP_N']
+        lag = app.config['RECOMMENDATIONS_LAG_SECONDS']
+        pairs = build_full(top_n, lag) if full else refresh(top_n, lag)
+        print(f"{'Built' if full else 'Refreshed'} {pairs} product pairs")
+    
+    @app.cli.command('rebuild-facet-counts')
+    def rebuild_facet_counts():
+        """Recompute unfiltered product facet counts from the products table"""
+        from services.facets import rebuild_counts
+        print(f"Rebuilt {rebuild_counts()} facet counts")
+    
+    @app.cli.command('migrate-uuid-keys')
+    def migrate_uuid_keys():
+        """Convert string id columns to native UUID storage (run with the app stopped)"""
+        from services.key_migration import migrate_to_native
+        print(f"Converted {migrate_to_native()} id columns; now run with UUID_KEY_STORAGE=native")
+    
+    @app.cli.command('compact-carts')
+    @click.option('--ttl-days', type=float, default=None, help='Remove carts idle for longer than this')
+    @click.option('--batch-size', type=int, default=None, help='Carts per transaction')
+    @click.option('--archive/--no-archive', default=None, help='Copy items to cart_items_archive first')
+    @click.option('--max-batches', type=int, default=None)
+    @click.option('--pause', type=float, default=0, help='Seconds to sleep between batches')
+    def compact_carts_command(ttl_days, batch_size, archive, max_batches, pause):
+        """Remove abandoned carts in bounded batches"""
+        from services.cart_compaction import compact_carts
+        report = compact_carts(
+            ttl_days if ttl_days is not None else app.config['CART_TTL_DAYS'],
+            batch_size or app.config['CART_COMPACTION_BATCH_SIZE'],
+            app.config['CART_COMPACTION_ARCHIVE'] if archive is None else archive,
+            max_batches,
+            pause
+        )
+        print(f"Reclaimed {report['rows']} cart rows from {report['carts']} idle carts in "
+              f"{report['batches']} batches ({report['seconds']}s, {report['backfilled']} carts backfilled)")
+    
+    @app.cli.command('create-missing-indexes')
+    def create_missing_indexes():
+        """Create model indexes missing from existing tables (create_all skips those tables)"""
+        inspector = db.inspect(db.engine)
+        created = []
+        for table in db.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(db.engine)
+                    created.append(index.name)
+        print(f"Created {len(created)} indexes" + (f": {', '.join(created)}" if created else ''))
+    
+    @app.cli.command('create-missing-columns')
+    def create_missing_columns():
+        """Add model columns missing from existing tables, such as the version counters"""
+        from sqlalchemy.schema import CreateColumn
+        inspector = db.inspect(db.engine)
+        tables = set(inspector.get_table_names())
+        added = []
+        with db.engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                if table.name not in tables:
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    if not column.nullable and column.server_default is None:
+                        print(f'Skipping {table.name}.{column.name}: NOT NULL without a server default', file=sys.stderr)
+                        continue
+                    definition = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} ADD COLUMN {definition}')
+                    added.append(f'{table.name}.{column.name}')
+        print(f"Added {len(added)} columns" + (f": {', '.join(added)}" if added else ''))
+
+    @app.cli.command('bulk-transition-orders')
+    @click.argument('status')
+    @click.option('--file', 'ids_file', type=click.File('r'), default='-', help='File of order ids, one per line (default stdin)')
+    def bulk_transition_orders(status, ids_file):
+        """Move orders listed one per line to STATUS"""
+        from models.order import Order
+        from services.order_transitions import bulk_transition, cancel_orders
+        if status not in Order.STATUSES:
+            raise click.BadParameter(f'must be one of {", ".join(Order.STATUSES)}')
+        order_ids = [line.strip() for line in ids_file if line.strip()]
+        if status == 'cancelled':
+            results = cancel_orders(order_ids, app.config['BULK_STATUS_CHUNK_SIZE'])
+        else:
+            results = bulk_transition(order_ids, status, app.config['BULK_STATUS_CHUNK_SIZE'])
+        summary = {}
+        for result in results:
+            summary[result['outcome']] = summary.get(result['outcome'], 0) + 1
+            if result['outcome'] != 'updated':
+                print(f"{result['orderId']}\t{result['outcome']}", file=sys.stderr)
+        print(', '.join(f'{outcome}: {count}' for outcome, count in sorted(summary.items())))
+    
     return app
 
 if __name__ == '__main__':
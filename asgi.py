@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point
+
+Serves the read-heavy product, order and analytics endpoints natively on
+the event loop with async SQLAlchemy sessions, and hands every other
+request to the regular Flask app through a WSGI adapter. The native
+views read the database directly, so with STORAGE_BACKEND=memory they
+are left out and Flask serves those endpoints from its storage too.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import os
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from app import create_app
+from routes.async_views import routes
+from services.async_db import async_db
+
+flask_app = create_app()
+native_routes = routes if flask_app.config['STORAGE_BACKEND'] != 'memory' else []
+if native_routes:
+    async_db.init_app(flask_app)
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    if native_routes:
+        await async_db.dispose()
+
+app = Starlette(
+    routes=native_routes + [Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.environ.get('WSGI_WORKERS', 10))))],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port, backlog=4096)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sync (WSGI) and async (ASGI) serving modes
+
+Starts each server, opens many concurrent keep-alive connections with a
+small asyncio HTTP/1.1 client, and reports throughput and latency
+percentiles for the read endpoints served natively in asgi.py.
+
+    python bench_async.py --connections 1000 --duration 20
+    python bench_async.py --sync-url http://127.0.0.1:5000 --async-url http://127.0.0.1:5001
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+from loadtest import percentile
+
+SYNC_CMD = [sys.executable, '-c',
+            'import os; from app import create_app; '
+            'create_app().run(host="127.0.0.1", port=int(os.environ["PORT"]), threaded=True)']
+ASYNC_CMD = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}',
+             '--no-access-log', '--backlog', '4096']
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response with a Content-Length body"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value.strip())
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def connection_loop(host, port, paths, headers, deadline, timeout, latencies, failures):
+    """One keep-alive connection issuing requests back to back"""
+    index = 0
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            path = paths[index % len(paths)]
+            index += 1
+            request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n{headers}\r\n'
+            start = time.perf_counter()
+            writer.write(request.encode())
+            await writer.drain()
+            status = await asyncio.wait_for(read_response(reader), timeout)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                failures.append(status)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            failures.append('error')
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def drive(base_url, paths, token, connections, duration, timeout):
+    parts = urlsplit(base_url)
+    headers = f'Authorization: Bearer {token}\r\n' if token else ''
+    latencies, failures = [], []
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*[
+        connection_loop(parts.hostname, parts.port, paths, headers, deadline, timeout, latencies, failures)
+        for _ in range(connections)
+    ])
+    elapsed = time.monotonic() - started
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'rps': round(len(values) / elapsed, 1),
+        'failures': len(failures),
+        'p50Ms': round(percentile(values, 50) * 1000, 2),
+        'p95Ms': round(percentile(values, 95) * 1000, 2),
+        'p99Ms': round(percentile(values, 99) * 1000, 2)
+    }
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'{base_url}/api/health', timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {base_url} did not start')
+
+
+def admin_token(base_url):
+    """Log in as the seeded admin so authenticated reads can be benchmarked"""
+    request = urllib.request.Request(
+        f'{base_url}/api/auth/login',
+        data=json.dumps({'username': 'admin', 'password': 'admin123'}).encode(),
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.load(response)['access_token']
+    except OSError:
+        return None
+
+
+def start_server(command, port):
+    env = dict(os.environ, PORT=str(port), RATE_LIMIT_ENABLED='false')
+    command = [part.replace('{port}', str(port)) for part in command]
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def bench_mode(name, base_url, command, port, args):
+    process = None
+    if base_url is None:
+        base_url = f'http://127.0.0.1:{port}'
+        process = start_server(command, port)
+    try:
+        wait_until_up(base_url)
+        token = admin_token(base_url)
+        paths = ['/api/products', '/api/products?inStock=true']
+        if token:
+            paths += ['/api/orders?status=pending', '/api/analytics/metrics']
+        print(f'{name}: {args.connections} connections for {args.duration}s against {base_url}', file=sys.stderr)
+        return asyncio.run(drive(base_url, paths, token, args.connections, args.duration, args.timeout))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sync and async serving modes')
+    parser.add_argument('--connections', type=int, default=500, help='Concurrent keep-alive connections')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+    parser.add_argument('--sync-url', help='Use an already running sync server')
+    parser.add_argument('--async-url', help='Use an already running async server')
+    parser.add_argument('--output', help='Write the JSON results here')
+    args = parser.parse_args()
+
+    results = {
+        'sync': bench_mode('sync', args.sync_url, SYNC_CMD, 5101, args),
+        'async': bench_mode('async', args.async_url, ASYNC_CMD, 5102, args)
+    }
+
+    print(f"{'mode':<8} {'rps':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'failures':>9}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['rps']:>10} {result['p50Ms']:>9} {result['p95Ms']:>9} "
+              f"{result['p99Ms']:>9} {result['failures']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
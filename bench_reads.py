@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Core read path against the ORM for the hot list endpoints
+
+Loads each list the way the endpoints used to (ORM instances, then
+to_dict) and the way they do now (services/reads.py), and reports
+rows/sec for each. Both paths produce identical JSON, which is checked
+before timing. Runs against the configured database; seed it first,
+e.g. with a single customer owning 10k+ orders:
+
+    python generate_data.py --reset --users 1 --products 20000 --orders 20000 --carts 1
+    python bench_reads.py --repeat 5
+"""
+import argparse
+import json
+import sys
+import time
+
+from app import create_app, db
+
+
+def orm_products():
+    from models.product import Product
+    return [product.to_dict() for product in Product.query.filter_by(is_active=True).all()]
+
+
+def orm_orders(customer_id):
+    from models.order import Order
+    query = Order.query.options(db.selectinload(Order.items))
+    if customer_id:
+        query = query.filter_by(customer_id=customer_id)
+    return [order.to_dict() for order in query.order_by(Order.created_at.desc()).all()]
+
+
+def orm_cart(user_id):
+    from models.cart import CartItem
+    return [item.to_dict() for item in CartItem.query.filter_by(user_id=user_id).all()]
+
+
+def core_products():
+    from services.reads import product_list
+    return product_list({})[0]
+
+
+def core_orders(customer_id):
+    from services.reads import order_list
+    return order_list(customer_id=customer_id)
+
+
+def core_cart(user_id):
+    from services.reads import cart_list
+    return cart_list(user_id)
+
+
+def timed(load, repeat):
+    """Best-of-repeat seconds and row count, each run on a fresh session"""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        db.session.remove()
+        started = time.perf_counter()
+        rows = len(load())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    db.session.remove()
+    return best, rows
+
+
+def busiest(column):
+    """The key with the most rows in a column, e.g. the customer with most orders"""
+    return db.session.query(column).group_by(column).order_by(db.func.count().desc()).limit(1).scalar()
+
+
+def fill_cart(user_id, count):
+    """Give a cart count rows over the existing products; returns the ids added"""
+    from models.cart import CartItem
+    from models.product import Product
+    product_ids = [product_id for product_id, in db.session.query(Product.id).all()]
+    items = [CartItem(user_id=user_id, product_id=product_ids[i % len(product_ids)], quantity=1) for i in range(count)]
+    db.session.add_all(items)
+    db.session.commit()
+    return [item.id for item in items]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ORM and Core read paths')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best is reported')
+    parser.add_argument('--all-orders', action='store_true', help='List every order instead of the busiest customer\'s')
+    parser.add_argument('--cart-items', type=int, default=10000,
+                        help='Temporarily top the busiest cart up to this many rows')
+    parser.add_argument('--output', help='Write the JSON results here')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        from models.order import Order
+        from models.cart import CartItem
+        customer_id = None if args.all_orders else busiest(Order.customer_id)
+        cart_user = busiest(CartItem.user_id) or busiest(Order.customer_id)
+        existing = CartItem.query.filter_by(user_id=cart_user).count()
+        added = fill_cart(cart_user, args.cart_items - existing) if args.cart_items > existing else []
+
+        cases = [
+            ('products', orm_products, core_products),
+            ('orders', lambda: orm_orders(customer_id), lambda: core_orders(customer_id)),
+            ('cart', lambda: orm_cart(cart_user), lambda: core_cart(cart_user))
+        ]
+
+        results = {}
+        try:
+            for name, orm_load, core_load in cases:
+                if json.dumps(orm_load(), sort_keys=True) != json.dumps(core_load(), sort_keys=True):
+                    print(f'{name}: ORM and Core output differ', file=sys.stderr)
+                    sys.exit(1)
+                orm_seconds, rows = timed(orm_load, args.repeat)
+                core_seconds, _ = timed(core_load, args.repeat)
+                results[name] = {
+                    'rows': rows,
+                    'ormRowsPerSec': round(rows / orm_seconds) if orm_seconds else None,
+                    'coreRowsPerSec': round(rows / core_seconds) if core_seconds else None,
+                    'speedup': round(orm_seconds / core_seconds, 2) if core_seconds else None
+                }
+        finally:
+            if added:
+                CartItem.query.filter(CartItem.id.in_(added)).delete(synchronize_session=False)
+                db.session.commit()
+
+    print(f"{'list':<10} {'rows':>8} {'ORM rows/s':>12} {'Core rows/s':>12} {'speedup':>8}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['rows']:>8} {result['ormRowsPerSec']:>12} {result['coreRowsPerSec']:>12} "
+              f"{result['speedup']:>7}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
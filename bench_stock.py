@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark checkout stock decrements on hot SKUs
+
+Creates temporary products with ample stock and has many threads
+reserve one unit at a time, spread round-robin over --skus products,
+in two ways:
+
+  row lock      every reservation is its own conditional UPDATE and
+                commit, as checkout used to do. All writers of a SKU
+                queue on its row lock, so per-SKU throughput is capped
+                at about one reservation per commit latency.
+  group commit  reservations go through services.stock_reservations,
+                which applies each batch as one UPDATE per SKU and one
+                commit, once per --window-ms value.
+
+Reports reservations/sec in total and per SKU, plus the mean batch
+size. Runs against the configured database; the benchmark products are
+deleted afterwards.
+
+    python bench_stock.py --skus 1 --workers 64 --reservations 5000
+    python bench_stock.py --skus 1,4,16 --window-ms 0,2,5 --output stock.json
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from app import create_app, db
+
+
+def run_workers(app, workers, count, reserve):
+    """Call reserve(i) for i in range(count) from a pool of threads; returns (seconds, granted)"""
+    lock = threading.Lock()
+    state = {'next': 0, 'granted': 0}
+
+    def work():
+        with app.app_context():
+            while True:
+                with lock:
+                    index = state['next']
+                    if index >= count:
+                        return
+                    state['next'] += 1
+                if reserve(index):
+                    with lock:
+                        state['granted'] += 1
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, state['granted']
+
+
+def histogram_totals(histogram):
+    totals = {}
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith(('_count', '_sum')):
+                totals[sample.name.rsplit('_', 1)[1]] = sample.value
+    return totals.get('count', 0), totals.get('sum', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skus', default='1', help='Comma-separated numbers of hot SKUs to spread load over')
+    parser.add_argument('--workers', type=int, default=64, help='Concurrent checkout threads')
+    parser.add_argument('--reservations', type=int, default=5000, help='Reservations per run')
+    parser.add_argument('--window-ms', default='0,2,5', help='Comma-separated group commit windows to try')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        from models.product import Product
+        from services.stock_reservations import stock_reserver, change_stock
+        from services.metrics import STOCK_BATCH_SIZE
+
+        results = []
+        for sku_count in [int(value) for value in args.skus.split(',')]:
+            tag = uuid.uuid4().hex[:8]
+            products = [
+                Product(name=f'Bench {tag} {i}', description='Stock benchmark', sku=f'BENCH-{tag}-{i}',
+                        price=Decimal('1.00'), stock_quantity=args.reservations * 10, category='Benchmark',
+                        image_url='', is_active=True)
+                for i in range(sku_count)
+            ]
+            db.session.add_all(products)
+            db.session.commit()
+            product_ids = [product.id for product in products]
+            db.session.remove()
+
+            try:
+                def row_lock(index):
+                    with db.engine.begin() as connection:
+                        return change_stock(connection, product_ids[index % sku_count], -1, datetime.utcnow()) is not None
+
+                seconds, granted = run_workers(app, args.workers, args.reservations, row_lock)
+                results.append({'skus': sku_count, 'mode': 'row lock', 'windowMs': None, 'seconds': seconds,
+                                'granted': granted, 'meanBatch': 1.0})
+
+                for window_ms in [float(value) for value in args.window_ms.split(',')]:
+                    stock_reserver.window = window_ms / 1000
+                    batches_before, reserved_before = histogram_totals(STOCK_BATCH_SIZE)
+
+                    def group_commit(index):
+                        stock_reserver.reserve([(product_ids[index % sku_count], 1)])
+                        return True
+
+                    seconds, granted = run_workers(app, args.workers, args.reservations, group_commit)
+                    batches_after, reserved_after = histogram_totals(STOCK_BATCH_SIZE)
+                    batches = batches_after - batches_before
+                    results.append({'skus': sku_count, 'mode': 'group commit', 'windowMs': window_ms,
+                                    'seconds': seconds, 'granted': granted,
+                                    'meanBatch': (reserved_after - reserved_before) / batches if batches else None})
+            finally:
+                stock_reserver.window = app.config['STOCK_RESERVATION_WINDOW_MS'] / 1000
+                for product in Product.query.filter(Product.id.in_(product_ids)).all():
+                    db.session.delete(product)
+                db.session.commit()
+
+    for result in results:
+        result['perSecond'] = round(result['granted'] / result['seconds'])
+        result['perSkuPerSecond'] = round(result['granted'] / result['seconds'] / result['skus'])
+
+    print(f"{'skus':>5} {'mode':<13} {'window':>7} {'granted':>8} {'res/s':>8} {'res/s/sku':>10} {'batch':>7}")
+    for result in results:
+        window = f"{result['windowMs']:g}ms" if result['windowMs'] is not None else '-'
+        batch = f"{result['meanBatch']:.1f}" if result['meanBatch'] else '-'
+        print(f"{result['skus']:>5} {result['mode']:<13} {window:>7} {result['granted']:>8} "
+              f"{result['perSecond']:>8} {result['perSkuPerSecond']:>10} {batch:>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data generator for benchmarking
+
+Produces a seeded dataset of users, products, orders, order items and carts
+with realistic shapes (Zipfian product popularity, diurnal order bursts)
+and bulk loads it with COPY on PostgreSQL or executemany elsewhere.
+
+    python generate_data.py --users 1000000 --products 100000 --orders 3000000
+"""
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import random
+import sys
+import time
+import uuid
+from array import array
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+
+CATEGORIES = ['Electronics', 'Sports', 'Clothing', 'Furniture', 'Books', 'Home', 'Toys', 'Beauty', 'Garden', 'Grocery']
+ADJECTIVES = ['Premium', 'Classic', 'Ultra', 'Compact', 'Professional', 'Eco', 'Smart', 'Deluxe', 'Essential', 'Portable']
+NOUNS = {
+    'Electronics': ['Headphones', 'Laptop', 'Smartphone', 'Speaker', 'Monitor', 'Camera'],
+    'Sports': ['Running Shoes', 'Yoga Mat', 'Dumbbell Set', 'Bike Helmet', 'Tennis Racket'],
+    'Clothing': ['T-Shirt', 'Jacket', 'Jeans', 'Sweater', 'Sneakers'],
+    'Furniture': ['Office Chair', 'Standing Desk', 'Bookshelf', 'Sofa', 'Lamp'],
+    'Books': ['Cookbook', 'Novel', 'Field Guide', 'Atlas', 'Workbook'],
+    'Home': ['Blender', 'Kettle', 'Towel Set', 'Cookware Set', 'Vacuum'],
+    'Toys': ['Puzzle', 'Building Blocks', 'Board Game', 'Plush Bear', 'Drone'],
+    'Beauty': ['Face Cream', 'Shampoo', 'Perfume', 'Hair Dryer', 'Makeup Kit'],
+    'Garden': ['Hose', 'Planter', 'Pruning Shears', 'Lawn Chair', 'Grill'],
+    'Grocery': ['Coffee Beans', 'Olive Oil', 'Tea Sampler', 'Granola', 'Spice Rack']
+}
+FIRST_NAMES = ['James', 'Mary', 'Wei', 'Priya', 'Carlos', 'Fatima', 'Olga', 'Kenji', 'Amara', 'Liam', 'Sofia', 'Noah']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kowalski', 'Okafor', 'Tanaka', 'Nguyen', 'Silva', 'Müller']
+STREETS = ['Main St', 'Oak Ave', 'Maple Rd', 'Cedar Ln', 'Park Blvd', 'Lake Dr']
+
+# Relative order volume per hour of day, peaking at lunch and in the evening
+HOURLY_WEIGHTS = [2, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 12, 14, 12, 10, 9, 10, 12, 15, 18, 17, 13, 8, 4]
+
+
+class WeightedSampler:
+    """Sample indexes from fixed weights with a binary search over the CDF"""
+
+    def __init__(self, weights, rng):
+        self.cumulative = array('d', itertools.accumulate(weights))
+        self.total = self.cumulative[-1]
+        self.rng = rng
+
+    def sample(self):
+        return bisect.bisect_right(self.cumulative, self.rng.random() * self.total)
+
+
+class BulkLoader:
+    """Write rows in chunks through COPY on PostgreSQL, executemany otherwise"""
+
+    def __init__(self, engine, chunk_size):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.use_copy = engine.dialect.name == 'postgresql'
+        self.counts = {}
+
+    def load(self, table, columns, rows):
+        """Stream an iterable of row tuples into a table"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._flush(table, columns, chunk)
+                chunk = []
+        if chunk:
+            self._flush(table, columns, chunk)
+
+    def _flush(self, table, columns, chunk):
+        if self.use_copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in chunk:
+                writer.writerow(['\\N' if value is None else value for value in row])
+            buffer.seek(0)
+            connection = self.engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer
+                )
+                connection.commit()
+            finally:
+                connection.close()
+        else:
+            target = db.metadata.tables[table]
+            with self.engine.begin() as connection:
+                connection.execute(target.insert(), [dict(zip(columns, row)) for row in chunk])
+        self.counts[table] = self.counts.get(table, 0) + len(chunk)
+
+
+class DatasetGenerator:
+    """Seeded generator for every table in the schema"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = datetime(2025, 1, 1) if args.fixed_clock else datetime.utcnow().replace(microsecond=0)
+        # Orders and carts refer back to every user and product, so keep
+        # those as packed arrays rather than millions of tuples: ids as 16
+        # bytes each, names as indexes into the word lists, prices in cents
+        self.user_ids = bytearray()
+        self.user_names = array('H')
+        self.product_ids = bytearray()
+        self.product_words = array('B')
+        self.product_cents = array('q')
+
+    def new_id(self):
+        """Deterministic UUID4-shaped id drawn from the seeded RNG"""
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    @staticmethod
+    def packed_id(ids, index):
+        return str(uuid.UUID(bytes=bytes(ids[index * 16:index * 16 + 16])))
+
+    def user(self, index):
+        """(id, full name, email) of the index-th user"""
+        name = self.user_names[index]
+        first_name, last_name = FIRST_NAMES[name // len(LAST_NAMES)], LAST_NAMES[name % len(LAST_NAMES)]
+        return self.packed_id(self.user_ids, index), f'{first_name} {last_name}', f'user{index}@example.com'
+
+    def product(self, index):
+        """(id, name, sku, price) of the index-th product"""
+        category, adjective, noun = self.product_words[index * 3:index * 3 + 3]
+        category = CATEGORIES[category]
+        return (self.packed_id(self.product_ids, index), f'{ADJECTIVES[adjective]} {NOUNS[category][noun]} {index}',
+                f'{category[:3].upper()}-{index:08d}', Decimal(self.product_cents[index]).scaleb(-2))
+
+    def user_rows(self):
+        password_hash = generate_password_hash('password123')
+        start = self.now - timedelta(days=self.args.days * 2)
+        span = int((self.now - start).total_seconds())
+        for i in range(self.args.users):
+            user_id = self.new_id()
+            first_name = self.rng.choice(FIRST_NAMES)
+            last_name = self.rng.choice(LAST_NAMES)
+            email = f'user{i}@example.com'
+            self.user_ids += uuid.UUID(user_id).bytes
+            self.user_names.append(FIRST_NAMES.index(first_name) * len(LAST_NAMES) + LAST_NAMES.index(last_name))
+            created_at = start + timedelta(seconds=self.rng.randrange(span))
+            yield (user_id, f'user{i}', email, password_hash, first_name, last_name,
+                   'admin' if i == 0 else 'customer', created_at)
+
+    def product_rows(self):
+        start = self.now - timedelta(days=self.args.days * 2)
+        span = int((self.now - start).total_seconds())
+        for i in range(self.args.products):
+            product_id = self.new_id()
+            category = CATEGORIES[int(self.rng.paretovariate(1.2)) % len(CATEGORIES)]
+            adjective = self.rng.choice(ADJECTIVES)
+            noun = self.rng.choice(NOUNS[category])
+            name = f'{adjective} {noun} {i}'
+            sku = f'{category[:3].upper()}-{i:08d}'
+            price = Decimal(round(self.rng.lognormvariate(3.5, 1.0), 2)).quantize(Decimal('0.01')) + Decimal('0.99')
+            original_price = (price * Decimal('1.25')).quantize(Decimal('0.01')) if self.rng.random() < 0.2 else None
+            stock = 0 if self.rng.random() < 0.05 else int(self.rng.expovariate(1 / 80))
+            rating = Decimal(str(round(min(5.0, max(1.0, self.rng.gauss(4.2, 0.5))), 1)))
+            created_at = start + timedelta(seconds=self.rng.randrange(span))
+            self.product_ids += uuid.UUID(product_id).bytes
+            self.product_words.extend((CATEGORIES.index(category), ADJECTIVES.index(adjective), NOUNS[category].index(noun)))
+            self.product_cents.append(int(price * 100))
+            yield (product_id, name, f'{name} for everyday use.', sku, price, original_price, stock, category,
+                   f'https://picsum.photos/seed/{i}/400/300', rating, True, created_at, created_at)
+
+    def order_timestamp(self, day_sampler, hour_sampler):
+        day = day_sampler.sample()
+        moment = self.now - timedelta(days=self.args.days - day)
+        return moment.replace(hour=hour_sampler.sample(), minute=self.rng.randrange(60), second=self.rng.randrange(60))
+
+    def order_status(self, created_at):
+        age = (self.now - created_at).days
+        roll = self.rng.random()
+        if roll < 0.05:
+            return 'cancelled'
+        if age > 14:
+            return 'delivered'
+        if age > 5:
+            return 'delivered' if roll < 0.6 else 'shipped'
+        if age > 1:
+            return 'shipped' if roll < 0.5 else 'processing'
+        return 'processing' if roll < 0.3 else 'pending'
+
+    def order_rows(self, items_out):
+        """Yield order rows, appending their item rows to items_out"""
+        product_sampler = WeightedSampler(
+            (1 / (rank + 1) ** self.args.zipf_s for rank in range(len(self.product_cents))), self.rng
+        )
+        # Steady growth over the period with extra weekend traffic
+        day_sampler = WeightedSampler(
+            [(1 + day / self.args.days) * (1.3 if day % 7 in (5, 6) else 1) for day in range(self.args.days)], self.rng
+        )
+        hour_sampler = WeightedSampler(HOURLY_WEIGHTS, self.rng)
+        # One counter per day of history
+        daily_numbers = {}
+
+        for _ in range(self.args.orders):
+            order_id = self.new_id()
+            customer_id, customer_name, customer_email = self.user(self.rng.randrange(len(self.user_names)))
+            created_at = self.order_timestamp(day_sampler, hour_sampler)
+            date_str = created_at.strftime('%Y%m%d')
+            daily_numbers[date_str] = daily_numbers.get(date_str, 0) + 1
+
+            total = Decimal('0')
+            line_count = 1 + min(int(self.rng.expovariate(1 / (self.args.items_per_order - 1)) + 0.5), 20) \
+                if self.args.items_per_order > 1 else 1
+            chosen = set()
+            for _ in range(line_count):
+                index = product_sampler.sample()
+                if index in chosen:
+                    continue
+                chosen.add(index)
+                product_id, name, sku, price = self.product(index)
+                quantity = 1 if self.rng.random() < 0.8 else self.rng.randint(2, 4)
+                line_total = price * quantity
+                total += line_total
+                items_out.append((self.new_id(), order_id, product_id, name, sku, quantity, price, line_total))
+
+            yield (order_id, f'ORD-{date_str}-{str(daily_numbers[date_str]).zfill(3)}', customer_id,
+                   customer_name, customer_email, self.order_status(created_at), total,
+                   f'{self.rng.randint(1, 9999)} {self.rng.choice(STREETS)}', created_at, created_at)
+
+    def cart_rows(self):
+        span = self.args.days * 86400
+        for _ in range(self.args.carts):
+            user_id = self.packed_id(self.user_ids, self.rng.randrange(len(self.user_names)))
+            chosen = set()
+            for _ in range(self.rng.randint(1, 5)):
+                chosen.add(self.rng.randrange(len(self.product_cents)))
+            created_at = self.now - timedelta(seconds=self.rng.randrange(span))
+            for index in chosen:
+                yield (self.new_id(), user_id, self.packed_id(self.product_ids, index), self.rng.randint(1, 3), created_at)
+
+
+def generate(args):
+    app = create_app()
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+
+        loader = BulkLoader(db.engine, args.chunk_size)
+        generator = DatasetGenerator(args)
+        started = time.monotonic()
+
+        def step(label, table, columns, rows):
+            step_start = time.monotonic()
+            loader.load(table, columns, rows)
+            print(f'{label}: {loader.counts.get(table, 0)} rows in {time.monotonic() - step_start:.1f}s', file=sys.stderr)
+
+        step('users', 'users',
+             ['id', 'username', 'email', 'password_hash', 'first_name', 'last_name', 'role', 'created_at'],
+             generator.user_rows())
+        step('products', 'products',
+             ['id', 'name', 'description', 'sku', 'price', 'original_price', 'stock_quantity', 'category',
+              'image_url', 'rating', 'is_active', 'created_at', 'updated_at'],
+             generator.product_rows())
+
+        # Orders and their items are generated together, one chunk at a time
+        order_columns = ['id', 'order_number', 'customer_id', 'customer_name', 'customer_email', 'status',
+                         'total_amount', 'shipping_address', 'created_at', 'updated_at']
+        item_columns = ['id', 'order_id', 'product_id', 'product_name', 'product_sku', 'quantity',
+                        'unit_price', 'total_price']
+        step_start = time.monotonic()
+        items = []
+        orders = []
+        for row in generator.order_rows(items):
+            orders.append(row)
+            if len(orders) >= args.chunk_size:
+                loader.load('orders', order_columns, orders)
+                loader.load('order_items', item_columns, items)
+                orders.clear()
+                items.clear()
+        loader.load('orders', order_columns, orders)
+        loader.load('order_items', item_columns, items)
+        print(f"orders: {loader.counts.get('orders', 0)} rows, order_items: {loader.counts.get('order_items', 0)} "
+              f'rows in {time.monotonic() - step_start:.1f}s', file=sys.stderr)
+
+        step('cart_items', 'cart_items', ['id', 'user_id', 'product_id', 'quantity', 'created_at'],
+             generator.cart_rows())
+
+        # Bulk loads bypass the ORM hooks that maintain facet counts
+        from services.facets import rebuild_counts
+        rebuild_counts()
+
+        total_rows = sum(loader.counts.values())
+        elapsed = time.monotonic() - started
+        print(f'Loaded {total_rows} rows in {elapsed:.1f}s ({total_rows / elapsed:,.0f} rows/s)', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic dataset')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--carts', type=int, default=5000, help='Number of users with an open cart')
+    parser.add_argument('--items-per-order', type=float, default=2.5, help='Mean order lines per order')
+    parser.add_argument('--days', type=int, default=365, help='Span of order history in days')
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='Zipf exponent for product popularity')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per COPY/executemany batch')
+    parser.add_argument('--fixed-clock', action='store_true', help='Anchor timestamps to 2025-01-01 for reproducibility')
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate all tables first')
+    args = parser.parse_args()
+
+    if args.users < 1 or args.products < 1:
+        parser.error('--users and --products must be at least 1')
+
+    generate(args)
+
+
+if __name__ == '__main__':
+    main()
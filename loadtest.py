@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Load testing harness for the Flask API
+
+Drives a weighted mix of storefront and admin traffic from many concurrent
+virtual users and reports throughput, latency percentiles and error rates
+per route as JSON.
+
+    python loadtest.py run --start-server --users 50 --duration 60 --output run.json
+    python loadtest.py compare baseline.json run.json --threshold 10
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+SEARCH_TERMS = ['pro', 'wireless', 'shoe', 'laptop', 'phone', 'desk', 'shirt', 'chair']
+
+# Scenario name -> weight, picked per iteration of a virtual user
+MIXES = {
+    'default': {'browse': 50, 'search': 20, 'add_to_cart': 15, 'checkout': 10, 'admin': 5},
+    'browse': {'browse': 70, 'search': 30},
+    'checkout': {'browse': 20, 'add_to_cart': 40, 'checkout': 40},
+    'admin': {'admin': 100}
+}
+
+
+class Stats:
+    """Thread-safe latency and error collection per route"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def record(self, route, elapsed, status):
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][str(status)] += 1
+            if status == 'error' or status >= 500 or status == 429:
+                self.errors[route] += 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, statuses, duration):
+    """Build the report block for one route or the whole run"""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        'requests': count,
+        'rps': round(count / duration, 2) if duration else 0,
+        'errors': errors,
+        'errorRate': round(errors / count, 4) if count else 0,
+        'p50Ms': round(percentile(values, 50) * 1000, 2),
+        'p95Ms': round(percentile(values, 95) * 1000, 2),
+        'p99Ms': round(percentile(values, 99) * 1000, 2),
+        'maxMs': round(values[-1] * 1000, 2) if values else 0,
+        'statuses': dict(statuses)
+    }
+
+
+class VirtualUser:
+    """One simulated shopper (or admin) with its own session"""
+
+    def __init__(self, base_url, stats, credentials, products, admin_headers, timeout):
+        self.base_url = base_url
+        self.stats = stats
+        self.session = requests.Session()
+        self.user_id = credentials['id']
+        self.session.headers['Authorization'] = f"Bearer {credentials['token']}"
+        self.products = products
+        self.admin_headers = admin_headers
+        self.timeout = timeout
+        self.cart = {}
+
+    def call(self, method, path, route, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        self.stats.record(route, time.perf_counter() - start, status)
+        return response
+
+    def browse(self):
+        self.call('GET', '/products', 'GET /api/products')
+        if self.products:
+            product = random.choice(self.products)
+            self.call('GET', f"/products/{product['id']}", 'GET /api/products/<id>')
+
+    def search(self):
+        term = random.choice(SEARCH_TERMS)
+        self.call('GET', f'/products?search={term}', 'GET /api/products?search')
+
+    def add_to_cart(self):
+        if not self.products:
+            return
+        product = random.choice(self.products)
+        self.call('POST', '/cart', 'POST /api/cart', json={
+            'userId': self.user_id,
+            'productId': product['id'],
+            'quantity': 1
+        })
+        self.cart[product['id']] = self.cart.get(product['id'], 0) + 1
+        self.call('GET', f'/cart/{self.user_id}', 'GET /api/cart/<user_id>')
+
+    def checkout(self):
+        if not self.cart:
+            self.add_to_cart()
+        items = [{'productId': product_id, 'quantity': quantity} for product_id, quantity in self.cart.items()]
+        self.call('POST', '/orders', 'POST /api/orders', json={
+            'order': {'shippingAddress': '1 Load Test Way'},
+            'items': items,
+            'clearCart': True
+        }, headers={'Idempotency-Key': str(uuid.uuid4())})
+        self.cart = {}
+        self.call('GET', '/orders', 'GET /api/orders')
+
+    def admin(self):
+        headers = self.admin_headers
+        self.call('GET', '/orders', 'GET /api/orders (admin)', headers=headers)
+        self.call('GET', '/analytics/metrics', 'GET /api/analytics/metrics', headers=headers)
+        self.call('GET', '/products/low-stock', 'GET /api/products/low-stock', headers=headers)
+
+    def run(self, mix, deadline, think_time):
+        scenarios = list(mix.keys())
+        weights = list(mix.values())
+        while time.monotonic() < deadline:
+            getattr(self, random.choices(scenarios, weights)[0])()
+            if think_time:
+                time.sleep(random.uniform(0, think_time))
+
+
+def post_with_retry(url, payload, attempts=10):
+    """POST that backs off on 429 so setup survives rate limiting"""
+    for _ in range(attempts):
+        response = requests.post(url, json=payload, timeout=30)
+        if response.status_code != 429:
+            return response
+        time.sleep(float(response.headers.get('Retry-After', 1)))
+    return response
+
+
+def login_or_register(base_url, username, role='customer'):
+    """Return id and token for a user, registering it on first use"""
+    password = f'{username}-pw'
+    response = post_with_retry(f'{base_url}/auth/login', {'username': username, 'password': password})
+    if response.status_code != 200:
+        response = post_with_retry(f'{base_url}/auth/register', {
+            'username': username,
+            'email': f'{username}@loadtest.example.com',
+            'password': password,
+            'firstName': 'Load',
+            'lastName': 'Tester',
+            'role': role
+        })
+    if response.status_code not in (200, 201):
+        raise RuntimeError(f'Could not authenticate {username}: {response.text}')
+    result = response.json()
+    return {'id': result['user']['id'], 'token': result['access_token']}
+
+
+def start_server(port):
+    """Run the app in a background thread, like test_api.py"""
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    from app import create_app
+    app = create_app()
+    thread = threading.Thread(
+        target=lambda: app.run(host='127.0.0.1', port=port, debug=False, use_reloader=False, threaded=True),
+        daemon=True
+    )
+    thread.start()
+    time.sleep(2)
+
+
+def run(args):
+    if args.start_server:
+        start_server(args.port)
+        base_url = f'http://127.0.0.1:{args.port}/api'
+    else:
+        base_url = args.base_url.rstrip('/')
+
+    random.seed(args.seed)
+    mix = MIXES[args.mix]
+
+    print(f'Preparing {args.users} virtual users against {base_url}...', file=sys.stderr)
+    admin = login_or_register(base_url, 'loadtest-admin', role='admin')
+    admin_headers = {'Authorization': f"Bearer {admin['token']}"}
+    users = [login_or_register(base_url, f'loadtest-user-{i}') for i in range(args.users)]
+    products = requests.get(f'{base_url}/products', timeout=30).json()
+    products = [product for product in products if product.get('stockQuantity', 0) > 0] or products
+
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    vus = [VirtualUser(base_url, stats, user, products, admin_headers, args.timeout) for user in users]
+    threads = [threading.Thread(target=vu.run, args=(mix, deadline, args.think_time)) for vu in vus]
+
+    print(f'Running {args.mix} mix for {args.duration}s...', file=sys.stderr)
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    all_statuses = defaultdict(int)
+    for statuses in stats.statuses.values():
+        for status, count in statuses.items():
+            all_statuses[status] += count
+
+    report = {
+        'config': {
+            'baseUrl': base_url,
+            'users': args.users,
+            'duration': args.duration,
+            'mix': args.mix,
+            'thinkTime': args.think_time,
+            'seed': args.seed
+        },
+        'elapsed': round(elapsed, 2),
+        'total': summarize(all_latencies, sum(stats.errors.values()), all_statuses, elapsed),
+        'routes': {
+            route: summarize(values, stats.errors[route], stats.statuses[route], elapsed)
+            for route, values in sorted(stats.latencies.items())
+        }
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f'Report written to {args.output}', file=sys.stderr)
+    else:
+        print(output)
+
+    total = report['total']
+    print(f"{total['requests']} requests, {total['rps']} rps, p95 {total['p95Ms']}ms, "
+          f"error rate {total['errorRate']:.2%}", file=sys.stderr)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = []
+    print(f"{'route':<40} {'p95 base':>10} {'p95 new':>10} {'change':>8} {'rps base':>9} {'rps new':>9}")
+
+    routes = ['total'] + sorted(set(baseline['routes']) & set(candidate['routes']))
+    for route in routes:
+        before = baseline['total'] if route == 'total' else baseline['routes'][route]
+        after = candidate['total'] if route == 'total' else candidate['routes'][route]
+
+        change = ((after['p95Ms'] - before['p95Ms']) / before['p95Ms'] * 100) if before['p95Ms'] else 0.0
+        print(f"{route:<40} {before['p95Ms']:>10} {after['p95Ms']:>10} {change:>7.1f}% "
+              f"{before['rps']:>9} {after['rps']:>9}")
+
+        if change > args.threshold:
+            regressions.append(f'{route}: p95 {before["p95Ms"]}ms -> {after["p95Ms"]}ms')
+        if after['errorRate'] - before['errorRate'] > args.error_threshold:
+            regressions.append(f'{route}: error rate {before["errorRate"]:.2%} -> {after["errorRate"]:.2%}')
+
+    if regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+
+    print('\nNo regressions')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Flask API')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Drive load and write a report')
+    run_parser.add_argument('--base-url', default='http://127.0.0.1:5000/api')
+    run_parser.add_argument('--start-server', action='store_true', help='Start a local server in-process')
+    run_parser.add_argument('--port', type=int, default=5001)
+    run_parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    run_parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    run_parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    run_parser.add_argument('--think-time', type=float, default=0.0, help='Max random pause between iterations')
+    run_parser.add_argument('--timeout', type=float, default=10)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two reports for regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=10, help='Allowed p95 increase in percent')
+    compare_parser.add_argument('--error-threshold', type=float, default=0.01, help='Allowed error rate increase')
+
+    args = parser.parse_args()
+    return run(args) if args.command == 'run' else compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+from app import db
+from models.types import UUIDKey
+from models.order import Order, OrderItem
+
+class ArchivedOrder(db.Model):
+    """Closed orders moved out of the hot orders table"""
+    __tablename__ = 'orders_archive'
+    
+    id = db.Column(UUIDKey, primary_key=True)
+    order_number = db.Column(db.String(50), unique=True, nullable=False)
+    customer_id = db.Column(UUIDKey, nullable=False, index=True)
+    customer_name = db.Column(db.String(200), nullable=False)
+    customer_email = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    total_amount = db.Column(db.Numeric(10, 2), nullable=False)
+    shipping_address = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # Relationships
+    items = db.relationship('ArchivedOrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    
+    to_dict = Order.to_dict
+    
+    def __repr__(self):
+        return f'<ArchivedOrder {self.order_number}>'
+
+class ArchivedOrderItem(db.Model):
+    __tablename__ = 'order_items_archive'
+    
+    id = db.Column(UUIDKey, primary_key=True)
+    order_id = db.Column(UUIDKey, db.ForeignKey('orders_archive.id'), nullable=False, index=True)
+    product_id = db.Column(UUIDKey, nullable=False)
+    product_name = db.Column(db.String(200), nullable=False)
+    product_sku = db.Column(db.String(50), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Numeric(10, 2), nullable=False)
+    total_price = db.Column(db.Numeric(10, 2), nullable=False)
+    
+    to_dict = OrderItem.to_dict
+    
+    def __repr__(self):
+        return f'<ArchivedOrderItem {self.product_name} x{self.quantity}>'
+
+class ArchiveStat(db.Model):
+    """Running totals of archived orders per status, so metrics skip the archive"""
+    __tablename__ = 'orders_archive_stats'
+    
+    status = db.Column(db.String(20), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ArchiveStat {self.status} {self.order_count}>'
+
+class ArchivedCartItem(db.Model):
+    """Items of carts compacted after going idle, kept for abandoned cart analysis"""
+    __tablename__ = 'cart_items_archive'
+    
+    id = db.Column(UUIDKey, primary_key=True)
+    user_id = db.Column(UUIDKey, nullable=False, index=True)
+    product_id = db.Column(UUIDKey, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    abandoned_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<ArchivedCartItem {self.user_id} {self.product_id} x{self.quantity}>'
@@ -1,12 +1,13 @@
 from app import db
+from models.types import UUIDKey, new_id
 from datetime import datetime
 
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(__import__('uuid').uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    id = db.Column(UUIDKey, primary_key=True, default=new_id)
+    user_id = db.Column(UUIDKey, db.ForeignKey('users.id'), nullable=False, index=True)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
@@ -26,4 +27,14 @@ class CartItem(db.Model):
         return cart_dict
     
     def __repr__(self):
-        return f'<CartItem {self.product.name if self.product else self.product_id} x{self.quantity}>'
\ No newline at end of file
+        return f'<CartItem {self.product.name if self.product else self.product_id} x{self.quantity}>'
+
+class CartActivity(db.Model):
+    """When each user's cart was last changed; drives abandoned cart compaction"""
+    __tablename__ = 'cart_activity'
+    
+    user_id = db.Column(UUIDKey, primary_key=True)
+    touched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<CartActivity {self.user_id} {self.touched_at}>'
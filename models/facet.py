@@ -0,0 +1,12 @@
+from app import db
+
+class ProductFacetCount(db.Model):
+    """Number of active products per facet value, kept current on every product write"""
+    __tablename__ = 'product_facet_counts'
+    
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ProductFacetCount {self.facet}={self.value} {self.count}>'
@@ -0,0 +1,28 @@
+from app import db
+from models.types import UUIDKey, new_id
+from datetime import datetime
+
+class IdempotencyRecord(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),
+    )
+    
+    id = db.Column(UUIDKey, primary_key=True, default=new_id)
+    user_id = db.Column(UUIDKey, nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    response_etag = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def is_expired(self):
+        """Check if the stored response is past its TTL"""
+        return self.expires_at <= datetime.utcnow()
+    
+    def __repr__(self):
+        return f'<IdempotencyRecord {self.key} {self.status}>'
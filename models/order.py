@@ -1,12 +1,27 @@
 from app import db
+from models.types import UUIDKey, new_id
 from datetime import datetime
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_status_created_at', 'status', 'created_at'),
+    )
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(__import__('uuid').uuid4()))
+    STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+    CLOSED_STATUSES = ['delivered', 'cancelled']
+    # Shipped orders may still be cancelled, but their stock has left the warehouse
+    TRANSITIONS = {
+        'pending': {'processing', 'cancelled'},
+        'processing': {'shipped', 'cancelled'},
+        'shipped': {'delivered', 'cancelled'},
+        'delivered': set(),
+        'cancelled': set()
+    }
+    
+    id = db.Column(UUIDKey, primary_key=True, default=new_id)
     order_number = db.Column(db.String(50), unique=True, nullable=False)
-    customer_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    customer_id = db.Column(UUIDKey, db.ForeignKey('users.id'), nullable=False)
     customer_name = db.Column(db.String(200), nullable=False)
     customer_email = db.Column(db.String(120), nullable=False)
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, shipped, delivered, cancelled
@@ -14,6 +29,10 @@ class Order(db.Model):
     shipping_address = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped on every write; ORM updates fail with StaleDataError if it moved (see services/concurrency.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
@@ -30,7 +49,8 @@ class Order(db.Model):
             'totalAmount': str(self.total_amount),
             'shippingAddress': self.shipping_address,
             'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat()
+            'updatedAt': self.updated_at.isoformat(),
+            'version': self.version
         }
         
         if include_items:
@@ -44,6 +64,11 @@ class Order(db.Model):
         self.updated_at = datetime.utcnow()
         db.session.commit()
     
+    @classmethod
+    def can_transition(cls, source, target):
+        """Check if an order may move from one status to another"""
+        return target in cls.TRANSITIONS.get(source, set())
+    
     @staticmethod
     def generate_order_number():
         """Generate unique order number"""
@@ -60,9 +85,9 @@ class Order(db.Model):
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(__import__('uuid').uuid4()))
-    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    id = db.Column(UUIDKey, primary_key=True, default=new_id)
+    order_id = db.Column(UUIDKey, db.ForeignKey('orders.id'), nullable=False)
+    product_id = db.Column(UUIDKey, db.ForeignKey('products.id'), nullable=False)
     product_name = db.Column(db.String(200), nullable=False)
     product_sku = db.Column(db.String(50), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
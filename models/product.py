@@ -1,10 +1,11 @@
 from app import db
+from models.types import UUIDKey, new_id
 from datetime import datetime
 
 class Product(db.Model):
     __tablename__ = 'products'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(__import__('uuid').uuid4()))
+    id = db.Column(UUIDKey, primary_key=True, default=new_id)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     sku = db.Column(db.String(50), unique=True, nullable=False)
@@ -17,6 +18,20 @@ class Product(db.Model):
     is_active = db.Column(db.Boolean, nullable=False, default=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped on every write; ORM updates fail with StaleDataError if it moved (see services/concurrency.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
+    
+    # Listing sorts walk these in order; see services/catalog.py
+    __table_args__ = (
+        db.Index('ix_products_active_price', 'is_active', 'price', 'id'),
+        db.Index('ix_products_active_category_price', 'is_active', 'category', 'price', 'id'),
+        db.Index('ix_products_active_rating', 'is_active', 'rating', 'id'),
+        db.Index('ix_products_active_category_rating', 'is_active', 'category', 'rating', 'id'),
+        db.Index('ix_products_active_created_at', 'is_active', 'created_at', 'id'),
+        db.Index('ix_products_active_category_created_at', 'is_active', 'category', 'created_at', 'id'),
+    )
     
     # Relationships
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
@@ -37,7 +52,8 @@ class Product(db.Model):
             'rating': str(self.rating),
             'isActive': self.is_active,
             'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat()
+            'updatedAt': self.updated_at.isoformat(),
+            'version': self.version
         }
     
     def update_stock(self, quantity):
@@ -0,0 +1,33 @@
+from app import db
+from models.types import UUIDKey
+
+class ProductPair(db.Model):
+    """How many orders contained both products (one direction of a symmetric pair)"""
+    __tablename__ = 'product_pairs'
+    
+    product_id = db.Column(UUIDKey, primary_key=True)
+    related_id = db.Column(UUIDKey, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ProductPair {self.product_id} {self.related_id} {self.order_count}>'
+
+class ProductRecommendation(db.Model):
+    """Top-N co-purchased products per product, ranked"""
+    __tablename__ = 'product_recommendations'
+    
+    product_id = db.Column(UUIDKey, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_id = db.Column(UUIDKey, nullable=False)
+    order_count = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<ProductRecommendation {self.product_id} #{self.rank} {self.related_id}>'
+
+class RecommendationState(db.Model):
+    """Watermark of orders already folded into product_pairs"""
+    __tablename__ = 'recommendation_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    processed_until = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,22 @@
+from app import db
+from models.types import UUIDKey, new_id
+from datetime import datetime
+
+class StockHold(db.Model):
+    """Stock granted to a checkout whose order has not committed yet
+
+    The stock reserver writes these in the same transaction as the
+    decrement, and the order's transaction deletes them, so any left
+    behind belong to a checkout that died in between. See
+    `flask reconcile-stock`.
+    """
+    __tablename__ = 'stock_holds'
+    
+    id = db.Column(UUIDKey, primary_key=True, default=new_id)
+    hold_id = db.Column(UUIDKey, nullable=False, index=True)  # One per checkout
+    product_id = db.Column(UUIDKey, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<StockHold {self.hold_id} {self.product_id} {self.quantity}>'
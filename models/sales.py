@@ -0,0 +1,18 @@
+from app import db
+
+class SalesCounter(db.Model):
+    """Units and revenue sold per product or category in one hourly bucket"""
+    __tablename__ = 'sales_counters'
+    
+    scope = db.Column(db.String(16), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_sales_counters_bucket', 'bucket'),
+    )
+    
+    def __repr__(self):
+        return f'<SalesCounter {self.scope}:{self.key} {self.bucket} {self.units}>'
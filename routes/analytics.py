@@ -1,10 +1,8 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.order import Order
-from models.product import Product
-from models.user import User
-from app import db
-from sqlalchemy import func
+from services.storage import storage
+from services.querystats import snapshots
+from services.tracing import tracer
 
 analytics_bp = Blueprint('analytics', __name__)
 
@@ -14,30 +12,44 @@ def get_metrics():
     """Get analytics metrics (admin only)"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
         if current_user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        # Order metrics
-        total_orders = Order.query.count()
-        total_revenue = db.session.query(func.sum(Order.total_amount)).scalar() or 0
-        pending_orders = Order.query.filter_by(status='pending').count()
-        completed_orders = Order.query.filter_by(status='delivered').count()
+        with tracer.span('analytics.order_metrics'):
+            metrics = storage.order_metrics()
         
         # Low stock products
-        low_stock_products = Product.query.filter(
-            Product.is_active == True,
-            Product.stock_quantity <= 10
-        ).count()
+        with tracer.span('analytics.low_stock'):
+            low_stock_products = storage.low_stock_count()
         
         return jsonify({
-            'totalOrders': total_orders,
-            'totalRevenue': float(total_revenue),
-            'pendingOrders': pending_orders,
-            'completedOrders': completed_orders,
+            **metrics,
+            'totalRevenue': float(metrics['totalRevenue']),
             'lowStockCount': low_stock_products
         }), 200
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/query-stats', methods=['GET'])
+@jwt_required()
+def get_query_stats():
+    """Get per-route SQL statement counts (admin only)"""
+    try:
+        current_user_id = get_jwt_identity()
+        current_user = storage.get_user(current_user_id)
+        
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        budgets = current_app.config.get('QUERY_BUDGETS', {})
+        routes = snapshots.snapshot()
+        for endpoint, route in routes.items():
+            route['budget'] = budgets.get(endpoint)
+        
+        return jsonify(routes), 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
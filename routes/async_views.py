@@ -0,0 +1,214 @@
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from models.product import Product
+from models.order import Order
+from models.archive import ArchivedOrder, ArchiveStat
+from models.user import User
+from services.async_db import async_db, AuthError
+from services.catalog import listing_statement, paginate
+from services.concurrency import etag
+from services.storage import storage
+
+def error(message, status):
+    return JSONResponse({'error': message}, status_code=status)
+
+async def current_user(session, request):
+    """Load the user behind the request's access token"""
+    return await session.get(User, async_db.identity(request))
+
+async def get_products(request):
+    """Get products with optional filtering, sorting and keyset pagination"""
+    try:
+        try:
+            statement, limit = listing_statement(request.query_params, columns=Product.__table__.c)
+        except ValueError as e:
+            return error(str(e), 400)
+        
+        # Plain rows, no ORM instances; see services/reads.py
+        async with async_db.session() as session:
+            rows = (await session.execute(statement)).all()
+        rows, next_cursor = paginate(rows, request.query_params, limit)
+        result = [Product.to_dict(row) for row in rows]
+        
+        if request.query_params.get('facets') != 'true':
+            headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+            return JSONResponse(result, headers=headers)
+        
+        # The facet index is shared with the Flask side and built with its session
+        facets = await async_db.run_sync(lambda: storage.product_facets(
+            request.query_params, ttl_seconds=async_db.app.config['FACET_INDEX_TTL_SECONDS']
+        ))
+        return JSONResponse({'products': result, 'facets': facets, 'nextCursor': next_cursor})
+        
+    except Exception as e:
+        return error(str(e), 500)
+
+async def get_product(request):
+    """Get specific product"""
+    try:
+        async with async_db.session() as session:
+            product = await session.get(Product, request.path_params['product_id'])
+        if not product or not product.is_active:
+            return error('Product not found', 404)
+        
+        # The version for If-Match on later writes, as versioned_response sends it
+        return JSONResponse(product.to_dict(), headers={'ETag': etag(product)})
+        
+    except Exception as e:
+        return error(str(e), 500)
+
+async def get_low_stock_products(request):
+    """Get low stock products (admin only)"""
+    try:
+        async with async_db.session() as session:
+            user = await current_user(session, request)
+            if not user or user.role != 'admin':
+                return error('Admin access required', 403)
+            
+            threshold = int(request.query_params.get('threshold', 10))
+            products = (await session.scalars(select(Product).where(
+                Product.is_active == True,
+                Product.stock_quantity <= threshold
+            ))).all()
+        
+        result = []
+        for product in products:
+            product_dict = product.to_dict()
+            product_dict['lowStock'] = product.is_low_stock(threshold)
+            product_dict['outOfStock'] = product.is_out_of_stock()
+            result.append(product_dict)
+        
+        return JSONResponse(result)
+        
+    except AuthError as e:
+        return JSONResponse({'msg': e.message}, status_code=e.status)
+    except Exception as e:
+        return error(str(e), 500)
+
+async def get_orders(request):
+    """Get orders with optional filtering"""
+    try:
+        async with async_db.session() as session:
+            user = await current_user(session, request)
+            
+            status = request.query_params.get('status')
+            customer_id = request.query_params.get('customerId')
+            include_archived = request.query_params.get('includeArchived') == 'true'
+            
+            # Regular users can only see their own orders
+            if user.role != 'admin':
+                customer_id = user.id
+            
+            orders = []
+            for model in ((Order, ArchivedOrder) if include_archived else (Order,)):
+                query = select(model).options(selectinload(model.items))
+                if customer_id:
+                    query = query.where(model.customer_id == customer_id)
+                if status:
+                    query = query.where(model.status == status)
+                orders.extend((await session.scalars(query.order_by(model.created_at.desc()))).all())
+        
+        if include_archived:
+            orders.sort(key=lambda order: order.created_at, reverse=True)
+        return JSONResponse([order.to_dict() for order in orders])
+        
+    except AuthError as e:
+        return JSONResponse({'msg': e.message}, status_code=e.status)
+    except Exception as e:
+        return error(str(e), 500)
+
+async def find_order(request, column, value):
+    """Look an order up by a unique column in the hot table, then the archive"""
+    async with async_db.session() as session:
+        user = await current_user(session, request)
+        
+        for model in (Order, ArchivedOrder):
+            order = (await session.scalars(
+                select(model).options(selectinload(model.items)).where(getattr(model, column) == value)
+            )).first()
+            if order is not None:
+                break
+    if not order:
+        return error('Order not found', 404)
+    
+    # Users can only see their own orders, admins can see all
+    if user.role != 'admin' and order.customer_id != user.id:
+        return error('Access denied', 403)
+    
+    return JSONResponse(order.to_dict(), headers={'ETag': etag(order)})
+
+async def get_order(request):
+    """Get specific order"""
+    try:
+        return await find_order(request, 'id', request.path_params['order_id'])
+    except AuthError as e:
+        return JSONResponse({'msg': e.message}, status_code=e.status)
+    except Exception as e:
+        return error(str(e), 500)
+
+async def get_order_by_number(request):
+    """Get order by order number"""
+    try:
+        return await find_order(request, 'order_number', request.path_params['order_number'])
+    except AuthError as e:
+        return JSONResponse({'msg': e.message}, status_code=e.status)
+    except Exception as e:
+        return error(str(e), 500)
+
+async def get_metrics(request):
+    """Get analytics metrics (admin only)"""
+    try:
+        async with async_db.session() as session:
+            user = await current_user(session, request)
+            if user.role != 'admin':
+                return error('Admin access required', 403)
+            
+            # Order metrics in a single pass over orders
+            totals = (await session.execute(select(
+                func.count(Order.id),
+                func.sum(Order.total_amount),
+                func.count(Order.id).filter(Order.status == 'pending'),
+                func.count(Order.id).filter(Order.status == 'delivered')
+            ))).one()
+            archived = (await session.scalars(select(ArchiveStat))).all()
+            
+            # Low stock products
+            low_stock_products = await session.scalar(select(func.count(Product.id)).where(
+                Product.is_active == True,
+                Product.stock_quantity <= 10
+            ))
+        
+        total_orders, total_revenue, pending_orders, completed_orders = totals
+        total_revenue = total_revenue or 0
+        
+        # Archived orders are closed, so they only add to the totals
+        for stat in archived:
+            total_orders += stat.order_count
+            total_revenue += stat.total_amount
+            if stat.status == 'delivered':
+                completed_orders += stat.order_count
+        
+        return JSONResponse({
+            'totalOrders': total_orders,
+            'totalRevenue': float(total_revenue),
+            'pendingOrders': pending_orders,
+            'completedOrders': completed_orders,
+            'lowStockCount': low_stock_products
+        })
+        
+    except AuthError as e:
+        return JSONResponse({'msg': e.message}, status_code=e.status)
+    except Exception as e:
+        return error(str(e), 500)
+
+routes = [
+    Route('/api/products', get_products, methods=['GET']),
+    Route('/api/products/low-stock', get_low_stock_products, methods=['GET']),
+    Route('/api/products/{product_id}', get_product, methods=['GET']),
+    Route('/api/orders', get_orders, methods=['GET']),
+    Route('/api/orders/number/{order_number}', get_order_by_number, methods=['GET']),
+    Route('/api/orders/{order_id}', get_order, methods=['GET']),
+    Route('/api/analytics/metrics', get_metrics, methods=['GET'])
+]
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models.user import User
-from app import db
+from werkzeug.security import generate_password_hash
+from services.tracing import tracer
+from services.storage import storage
 import re
 
 auth_bp = Blueprint('auth', __name__)
@@ -28,27 +29,30 @@ def register():
             return jsonify({'error': 'Invalid email format'}), 400
         
         # Check if user already exists
-        if User.query.filter_by(username=data['username']).first():
-            return jsonify({'error': 'Username already exists'}), 409
-        
-        if User.query.filter_by(email=data['email']).first():
-            return jsonify({'error': 'Email already exists'}), 409
+        with tracer.span('auth.check_existing'):
+            if storage.get_user_by_username(data['username']):
+                return jsonify({'error': 'Username already exists'}), 409
+            
+            if storage.get_user_by_email(data['email']):
+                return jsonify({'error': 'Email already exists'}), 409
         
         # Create new user
-        user = User(
-            username=data['username'],
-            email=data['email'],
-            first_name=data['firstName'],
-            last_name=data['lastName'],
-            role=data.get('role', 'customer')
-        )
-        user.set_password(data['password'])
-        
-        db.session.add(user)
-        db.session.commit()
+        with tracer.span('auth.hash_password'):
+            password_hash = generate_password_hash(data['password'])
+        
+        with tracer.span('auth.insert_user'):
+            user = storage.create_user(
+                username=data['username'],
+                email=data['email'],
+                password_hash=password_hash,
+                first_name=data['firstName'],
+                last_name=data['lastName'],
+                role=data.get('role', 'customer')
+            )
         
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        with tracer.span('auth.issue_token'):
+            access_token = create_access_token(identity=user.id)
         
         return jsonify({
             'message': 'User created successfully',
@@ -57,7 +61,7 @@ def register():
         }), 201
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/login', methods=['POST'])
@@ -70,13 +74,18 @@ def login():
             return jsonify({'error': 'Username and password are required'}), 400
         
         # Find user
-        user = User.query.filter_by(username=data['username']).first()
+        with tracer.span('auth.lookup_user'):
+            user = storage.get_user_by_username(data['username'])
+        
+        with tracer.span('auth.check_password'):
+            valid = user is not None and user.check_password(data['password'])
         
-        if not user or not user.check_password(data['password']):
+        if not valid:
             return jsonify({'error': 'Invalid username or password'}), 401
         
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        with tracer.span('auth.issue_token'):
+            access_token = create_access_token(identity=user.id)
         
         return jsonify({
             'message': 'Login successful',
@@ -93,7 +102,7 @@ def get_current_user():
     """Get current user info"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = storage.get_user(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -1,9 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.cart import CartItem
-from models.product import Product
-from models.user import User
-from app import db
+from services.idempotency import idempotent
+from services.tracing import tracer
+from services import recommendations
+from services.storage import storage, requires_history
 
 cart_bp = Blueprint('cart', __name__)
 
@@ -13,20 +13,44 @@ def get_cart_items(user_id):
     """Get cart items for a user"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
         # Users can only access their own cart, admins can access any cart
         if current_user.role != 'admin' and current_user_id != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        cart_items = CartItem.query.filter_by(user_id=user_id).all()
-        return jsonify([item.to_dict() for item in cart_items]), 200
+        with tracer.span('cart.load_items', user_id=user_id):
+            result = storage.cart_items(user_id)
         
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@cart_bp.route('/<user_id>/recommendations', methods=['GET'])
+@jwt_required()
+@requires_history
+def get_cart_recommendations(user_id):
+    """Get products frequently bought with what is in the cart"""
+    try:
+        current_user_id = get_jwt_identity()
+        current_user = storage.get_user(current_user_id)
+        
+        # Users can only access their own cart, admins can access any cart
+        if current_user.role != 'admin' and current_user_id != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        limit = min(int(request.args.get('limit', 10)), current_app.config['RECOMMENDATIONS_TOP_N'])
+        return jsonify(recommendations.for_cart(user_id, limit)), 200
+        
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def add_to_cart():
     """Add item to cart"""
     try:
@@ -48,32 +72,17 @@ def add_to_cart():
             return jsonify({'error': 'Quantity must be positive'}), 400
         
         # Check if product exists
-        product = Product.query.get(product_id)
+        with tracer.span('cart.lookup_product', product_id=product_id):
+            product = storage.get_product(product_id)
         if not product or not product.is_active:
             return jsonify({'error': 'Product not found'}), 404
         
-        # Check if item already in cart
-        existing_item = CartItem.query.filter_by(
-            user_id=user_id,
-            product_id=product_id
-        ).first()
-        
-        if existing_item:
-            existing_item.quantity += quantity
-            db.session.commit()
-            return jsonify(existing_item.to_dict()), 200
-        else:
-            cart_item = CartItem(
-                user_id=user_id,
-                product_id=product_id,
-                quantity=quantity
-            )
-            db.session.add(cart_item)
-            db.session.commit()
-            return jsonify(cart_item.to_dict()), 201
+        # Adds to the existing line if the product is already in the cart
+        cart_item, created = storage.add_to_cart(user_id, product_id, quantity)
+        return jsonify(cart_item.to_dict()), 201 if created else 200
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/<user_id>/<product_id>', methods=['PUT'])
@@ -93,21 +102,17 @@ def update_cart_quantity(user_id, product_id):
         if quantity is None or quantity <= 0:
             return jsonify({'error': 'Invalid quantity'}), 400
         
-        cart_item = CartItem.query.filter_by(
-            user_id=user_id,
-            product_id=product_id
-        ).first()
+        cart_item = storage.get_cart_item(user_id, product_id)
         
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
         
-        cart_item.quantity = quantity
-        db.session.commit()
+        cart_item = storage.update_cart_quantity(cart_item, quantity)
         
         return jsonify(cart_item.to_dict()), 200
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/<user_id>/<product_id>', methods=['DELETE'])
@@ -121,21 +126,17 @@ def remove_from_cart(user_id, product_id):
         if current_user_id != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        cart_item = CartItem.query.filter_by(
-            user_id=user_id,
-            product_id=product_id
-        ).first()
+        cart_item = storage.get_cart_item(user_id, product_id)
         
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
         
-        db.session.delete(cart_item)
-        db.session.commit()
+        storage.remove_from_cart(cart_item)
         
         return '', 204
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/<user_id>', methods=['DELETE'])
@@ -149,11 +150,10 @@ def clear_cart(user_id):
         if current_user_id != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        CartItem.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
+        storage.clear_cart(user_id)
         
         return '', 204
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,73 @@
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.storage import storage
+from services.events import broker, format_sse
+import queue
+
+events_bp = Blueprint('events', __name__)
+
+def parse_list(value):
+    """Split a comma separated query parameter into a set"""
+    if not value:
+        return None
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+@events_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """Server-Sent Events stream of order and inventory changes"""
+    try:
+        current_user_id = get_jwt_identity()
+        current_user = storage.get_user(current_user_id)
+
+        if not current_user:
+            return jsonify({'error': 'User not found'}), 404
+
+        filters = {
+            'topics': parse_list(request.args.get('topics')),
+            'statuses': parse_list(request.args.get('status')),
+            'product_ids': parse_list(request.args.get('productId')),
+            'customer_id': request.args.get('customerId')
+        }
+
+        # Customers only ever see changes to their own orders
+        if current_user.role != 'admin':
+            filters['customer_id'] = current_user_id
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+        heartbeat = current_app.config.get('EVENT_HEARTBEAT_SECONDS', 15)
+        subscription, replay = broker.subscribe(filters, last_event_id)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        try:
+            yield f"retry: {heartbeat * 1000}\n\n"
+
+            if replay is None:
+                # Too far behind the replay buffer, client must refetch
+                yield "event: reset\ndata: {}\n\n"
+            else:
+                for event in replay:
+                    yield format_sse(event)
+
+            while not subscription.overflowed:
+                try:
+                    event = subscription.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -0,0 +1,129 @@
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.storage import storage, requires_history
+from services.exports import FORMATS, export_rows, encode, export_jobs, public_job
+from datetime import datetime
+
+exports_bp = Blueprint('exports', __name__)
+
+def parse_date(value):
+    """Parse an ISO date or datetime query parameter"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+def export_params(source):
+    """Validate kind, format and date range shared by streaming and job exports"""
+    fmt = source.get('format', 'csv')
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}')
+    
+    start = parse_date(source.get('from'))
+    end = parse_date(source.get('to'))
+    if start and end and start >= end:
+        raise ValueError('from must be before to')
+    
+    return fmt, start, end
+
+def require_admin():
+    user = storage.get_user(get_jwt_identity())
+    return user if user and user.role == 'admin' else None
+
+@exports_bp.route('/<kind>', methods=['GET'])
+@jwt_required()
+@requires_history
+def stream_export(kind):
+    """Stream orders or sales for a date range as CSV, NDJSON or Parquet (admin only)"""
+    try:
+        if not require_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        if kind not in ('orders', 'sales'):
+            return jsonify({'error': 'Export not found'}), 404
+        
+        try:
+            fmt, start, end = export_params(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if fmt == 'parquet':
+            try:
+                import pyarrow
+            except ImportError:
+                return jsonify({'error': 'Parquet export requires pyarrow'}), 400
+        
+        header, rows = export_rows(kind, start, end, current_app.config['EXPORT_BATCH_SIZE'])
+        mimetype, extension = FORMATS[fmt]
+        filename = f"{kind}-{start.date() if start else 'all'}-{end.date() if end else 'now'}.{extension}"
+        
+        return Response(stream_with_context(encode(fmt, header, rows)), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@exports_bp.route('/<kind>/jobs', methods=['POST'])
+@jwt_required()
+@requires_history
+def create_export_job(kind):
+    """Run an export in the background, writing to a local file (admin only)"""
+    try:
+        user = require_admin()
+        if not user:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        if kind not in ('orders', 'sales'):
+            return jsonify({'error': 'Export not found'}), 404
+        
+        try:
+            fmt, start, end = export_params(request.get_json() or {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        job = export_jobs.start(current_app._get_current_object(), kind, fmt, start, end, user.id)
+        return jsonify(public_job(job)), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@exports_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+@requires_history
+def get_export_job(job_id):
+    """Get background export status (admin only)"""
+    try:
+        if not require_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        job = export_jobs.get(job_id)
+        if not job:
+            return jsonify({'error': 'Export job not found'}), 404
+        
+        return jsonify(public_job(job)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@exports_bp.route('/jobs/<job_id>/download', methods=['GET'])
+@jwt_required()
+@requires_history
+def download_export_job(job_id):
+    """Download a finished background export (admin only)"""
+    try:
+        if not require_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        job = export_jobs.get(job_id)
+        if not job:
+            return jsonify({'error': 'Export job not found'}), 404
+        
+        if job['status'] != 'completed':
+            return jsonify({'error': f"Export is {job['status']}"}), 409
+        
+        mimetype, _ = FORMATS[job['format']]
+        return send_file(job['path'], mimetype=mimetype, as_attachment=True)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.order import Order, OrderItem
-from models.product import Product
-from models.user import User
-from models.cart import CartItem
-from app import db
+from models.order import Order
+from services.idempotency import idempotent
+from services.metrics import ORDERS_CREATED, ORDER_STATUS_CHANGES, STOCK_OUT_REJECTIONS
+from services.events import publish_order, publish_stock_levels
+from services.tracing import tracer
+from services.storage import storage
+from services.concurrency import VersionConflict, requested_version, versioned_response, conflict_response
+from services.stock_reservations import InsufficientStock
+from sqlalchemy.orm.exc import StaleDataError
 from decimal import Decimal
 
 orders_bp = Blueprint('orders', __name__)
@@ -15,28 +19,18 @@ def get_orders():
     """Get orders with optional filtering"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
         status = request.args.get('status')
         customer_id = request.args.get('customerId')
+        include_archived = request.args.get('includeArchived') == 'true'
         
-        if current_user.role == 'admin':
-            # Admin can see all orders
-            query = Order.query
-            
-            if status:
-                query = query.filter_by(status=status)
-            if customer_id:
-                query = query.filter_by(customer_id=customer_id)
-        else:
-            # Regular users can only see their own orders
-            query = Order.query.filter_by(customer_id=current_user_id)
-            
-            if status:
-                query = query.filter_by(status=status)
-        
-        orders = query.order_by(Order.created_at.desc()).all()
-        return jsonify([order.to_dict() for order in orders]), 200
+        # Regular users can only see their own orders
+        if current_user.role != 'admin':
+            customer_id = current_user_id
+        
+        orders = storage.list_orders(customer_id=customer_id, status=status, include_archived=include_archived)
+        return jsonify(orders), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -47,9 +41,9 @@ def get_order(order_id):
     """Get specific order"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
-        order = Order.query.get(order_id)
+        order = storage.get_order(order_id, include_archived=True)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
@@ -57,7 +51,7 @@ def get_order(order_id):
         if current_user.role != 'admin' and order.customer_id != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        return jsonify(order.to_dict()), 200
+        return versioned_response(order)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -68,9 +62,9 @@ def get_order_by_number(order_number):
     """Get order by order number"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
-        order = Order.query.filter_by(order_number=order_number).first()
+        order = storage.get_order_by_number(order_number)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
@@ -78,18 +72,19 @@ def get_order_by_number(order_number):
         if current_user.role != 'admin' and order.customer_id != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        return jsonify(order.to_dict()), 200
+        return versioned_response(order)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_order():
     """Create new order"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
         data = request.get_json()
         order_data = data.get('order')
@@ -105,85 +100,71 @@ def create_order():
         total_amount = Decimal('0')
         validated_items = []
         
-        for item in items_data:
-            product = Product.query.get(item.get('productId'))
-            if not product or not product.is_active:
-                return jsonify({'error': f'Product {item.get("productId")} not found'}), 400
-            
-            quantity = item.get('quantity', 1)
-            if quantity <= 0:
-                return jsonify({'error': 'Invalid quantity'}), 400
-            
-            if product.stock_quantity < quantity:
-                return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
-            
-            item_total = product.price * quantity
-            total_amount += item_total
-            
-            validated_items.append({
-                'product': product,
-                'quantity': quantity,
-                'unit_price': product.price,
-                'total_price': item_total
-            })
-        
-        # Create order
-        order = Order(
-            order_number=Order.generate_order_number(),
-            customer_id=current_user_id,
-            customer_name=f"{current_user.first_name} {current_user.last_name}",
-            customer_email=current_user.email,
-            status=order_data.get('status', 'pending'),
-            total_amount=total_amount,
-            shipping_address=order_data['shippingAddress']
-        )
-        
-        db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items and update stock
-        for item_data in validated_items:
-            product = item_data['product']
-            
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=product.id,
-                product_name=product.name,
-                product_sku=product.sku,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                total_price=item_data['total_price']
+        with tracer.span('checkout.validate', item_count=len(items_data)):
+            for item in items_data:
+                product = storage.get_product(item.get('productId'))
+                if not product or not product.is_active:
+                    return jsonify({'error': f'Product {item.get("productId")} not found'}), 400
+                
+                quantity = item.get('quantity', 1)
+                if quantity <= 0:
+                    return jsonify({'error': 'Invalid quantity'}), 400
+                
+                if product.stock_quantity < quantity:
+                    STOCK_OUT_REJECTIONS.inc()
+                    return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
+                
+                item_total = product.price * quantity
+                total_amount += item_total
+                
+                validated_items.append({
+                    'product': product,
+                    'quantity': quantity,
+                    'unit_price': product.price,
+                    'total_price': item_total
+                })
+        
+        # Stock is reserved per SKU with the order; nothing is written if a line cannot be reserved
+        try:
+            order, stock_levels = storage.create_order(
+                current_user,
+                validated_items,
+                total_amount,
+                order_data['shippingAddress'],
+                status=order_data.get('status', 'pending'),
+                clear_cart=data.get('clearCart', False)
             )
-            
-            db.session.add(order_item)
-            
-            # Update product stock
-            product.stock_quantity -= item_data['quantity']
-        
-        # Clear user's cart if specified
-        if data.get('clearCart', False):
-            CartItem.query.filter_by(user_id=current_user_id).delete()
+        except InsufficientStock as e:
+            STOCK_OUT_REJECTIONS.inc()
+            name = next(item_data['product'].name for item_data in validated_items if item_data['product'].id == e.product_id)
+            return jsonify({'error': f'Insufficient stock for {name}'}), 400
         
-        db.session.commit()
+        ORDERS_CREATED.inc()
+        publish_order('order.created', order)
+        publish_stock_levels(stock_levels)
         
-        return jsonify(order.to_dict()), 201
+        return versioned_response(order, 201)
         
+    except TimeoutError as e:
+        storage.rollback()
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<order_id>/status', methods=['PUT'])
 @jwt_required()
+@idempotent
 def update_order_status(order_id):
     """Update order status (admin only)"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
         if current_user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        order = Order.query.get(order_id)
+        order = storage.get_order(order_id)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
@@ -193,27 +174,80 @@ def update_order_status(order_id):
         if not status:
             return jsonify({'error': 'Status is required'}), 400
         
-        valid_statuses = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
-        if status not in valid_statuses:
+        if status not in Order.STATUSES:
+            return jsonify({'error': 'Invalid status'}), 400
+        
+        previous = order.status
+        order = storage.update_order_status(order, status, requested_version(data))
+        if status != previous:
+            if status != 'cancelled':
+                # Cancellations are counted where the stock is restored
+                ORDER_STATUS_CHANGES.labels(status).inc()
+            publish_order('order.status_changed', order)
+        
+        return versioned_response(order)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (VersionConflict, StaleDataError):
+        storage.rollback()
+        return conflict_response(Order, storage.get_order(order_id))
+    except Exception as e:
+        storage.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@orders_bp.route('/bulk/status', methods=['PUT'])
+@jwt_required()
+@idempotent
+def bulk_update_order_status():
+    """Update the status of many orders at once (admin only)"""
+    try:
+        current_user_id = get_jwt_identity()
+        current_user = storage.get_user(current_user_id)
+        
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        data = request.get_json()
+        status = data.get('status')
+        order_ids = data.get('orderIds')
+        
+        if not status:
+            return jsonify({'error': 'Status is required'}), 400
+        
+        if status not in Order.STATUSES:
             return jsonify({'error': 'Invalid status'}), 400
         
-        order.update_status(status)
+        if not isinstance(order_ids, list) or len(order_ids) == 0:
+            return jsonify({'error': 'orderIds must be a non-empty list'}), 400
+        
+        max_orders = current_app.config.get('BULK_STATUS_MAX_ORDERS', 50000)
+        if len(order_ids) > max_orders:
+            return jsonify({'error': f'At most {max_orders} orders per request'}), 400
+        
+        chunk_size = current_app.config.get('BULK_STATUS_CHUNK_SIZE', 1000)
+        results = storage.transition_orders(order_ids, status, chunk_size)
+        
+        summary = {}
+        for result in results:
+            summary[result['outcome']] = summary.get(result['outcome'], 0) + 1
         
-        return jsonify(order.to_dict()), 200
+        return jsonify({'status': status, 'summary': summary, 'results': results}), 200
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<order_id>/cancel', methods=['POST'])
 @jwt_required()
+@idempotent
 def cancel_order(order_id):
     """Cancel order"""
     try:
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = storage.get_user(current_user_id)
         
-        order = Order.query.get(order_id)
+        order = storage.get_order(order_id)
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
@@ -221,20 +255,19 @@ def cancel_order(order_id):
         if current_user.role != 'admin' and order.customer_id != current_user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        if order.status in ['delivered', 'cancelled']:
+        if not Order.can_transition(order.status, 'cancelled'):
             return jsonify({'error': 'Cannot cancel this order'}), 400
         
-        # Restore stock for cancelled orders
-        if order.status in ['pending', 'processing']:
-            for item in order.items:
-                product = Product.query.get(item.product_id)
-                if product:
-                    product.stock_quantity += item.quantity
+        outcome, stock = storage.cancel_order(order)
+        if outcome['outcome'] != 'updated':
+            return jsonify({'error': 'Order was changed by another request'}), 409
         
-        order.update_status('cancelled')
+        order = storage.get_order(order_id)
+        publish_order('order.cancelled', order)
+        publish_stock_levels(stock)
         
-        return jsonify(order.to_dict()), 200
+        return versioned_response(order)
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
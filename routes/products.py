@@ -1,40 +1,97 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.product import Product
-from models.user import User
-from app import db
+from services.events import publish_stock
+from services.sales import WINDOWS, top_sellers
+from services import recommendations
+from services.storage import storage, requires_history
+from services.suggest import suggest_index, DEFAULT_LIMIT, MAX_LIMIT
+from services.concurrency import VersionConflict, requested_version, versioned_response, conflict_response
+from sqlalchemy.orm.exc import StaleDataError
 from decimal import Decimal
 
 products_bp = Blueprint('products', __name__)
 
 @products_bp.route('', methods=['GET'])
 def get_products():
-    """Get all products with optional filtering"""
+    """Get products with optional filtering, sorting and keyset pagination"""
     try:
-        category = request.args.get('category')
-        search = request.args.get('search')
-        in_stock = request.args.get('inStock')
+        try:
+            result, next_cursor = storage.list_products(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        query = Product.query.filter_by(is_active=True)
+        if request.args.get('facets') != 'true':
+            response = jsonify(result)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response, 200
         
-        if category:
-            query = query.filter_by(category=category)
+        facets = storage.product_facets(request.args, ttl_seconds=current_app.config['FACET_INDEX_TTL_SECONDS'])
+        return jsonify({'products': result, 'facets': facets, 'nextCursor': next_cursor}), 200
         
-        if search:
-            query = query.filter(
-                db.or_(
-                    Product.name.ilike(f'%{search}%'),
-                    Product.description.ilike(f'%{search}%'),
-                    Product.category.ilike(f'%{search}%')
-                )
-            )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/top-sellers', methods=['GET'])
+@requires_history
+def get_top_sellers():
+    """Get best selling products over a trailing window, optionally within a category"""
+    try:
+        window = request.args.get('window', '7d')
+        if window not in WINDOWS:
+            return jsonify({'error': f'window must be one of {", ".join(WINDOWS)}'}), 400
+        
+        limit = min(int(request.args.get('limit', 10)), current_app.config['TOP_SELLERS_MAX_K'])
+        products = top_sellers.top_products(
+            window,
+            limit,
+            category=request.args.get('category'),
+            refresh_seconds=current_app.config['TOP_SELLERS_REFRESH_SECONDS'],
+            max_k=current_app.config['TOP_SELLERS_MAX_K']
+        )
+        return jsonify({'window': window, 'products': products}), 200
+        
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/top-categories', methods=['GET'])
+@requires_history
+def get_top_categories():
+    """Get best selling categories over a trailing window"""
+    try:
+        window = request.args.get('window', '7d')
+        if window not in WINDOWS:
+            return jsonify({'error': f'window must be one of {", ".join(WINDOWS)}'}), 400
+        
+        limit = min(int(request.args.get('limit', 10)), current_app.config['TOP_SELLERS_MAX_K'])
+        categories = top_sellers.top_categories(
+            window,
+            limit,
+            refresh_seconds=current_app.config['TOP_SELLERS_REFRESH_SECONDS'],
+            max_k=current_app.config['TOP_SELLERS_MAX_K']
+        )
+        return jsonify({'window': window, 'categories': categories}), 200
         
-        if in_stock == 'true':
-            query = query.filter(Product.stock_quantity > 0)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/suggest', methods=['GET'])
+def suggest_products():
+    """Get typeahead suggestions for a partial search query"""
+    try:
+        limit = max(min(int(request.args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT), 1)
+        query = request.args.get('q', '')
         
-        products = query.all()
-        return jsonify([product.to_dict() for product in products]), 200
+        suggest_index.ensure_fresh(current_app.config['SUGGEST_INDEX_TTL_SECONDS'])
+        return jsonify({'query': query, 'suggestions': suggest_index.suggest(query, limit)}), 200
         
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -42,12 +99,25 @@ def get_products():
 def get_product(product_id):
     """Get specific product"""
     try:
-        product = Product.query.get(product_id)
+        product = storage.get_product(product_id)
         if not product or not product.is_active:
             return jsonify({'error': 'Product not found'}), 404
         
-        return jsonify(product.to_dict()), 200
+        return versioned_response(product)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@products_bp.route('/<product_id>/bought-together', methods=['GET'])
+@requires_history
+def get_bought_together(product_id):
+    """Get products most often ordered together with this one"""
+    try:
+        limit = min(int(request.args.get('limit', 10)), current_app.config['RECOMMENDATIONS_TOP_N'])
+        return jsonify(recommendations.for_product(product_id, limit)), 200
         
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -57,7 +127,7 @@ def create_product():
     """Create new product (admin only)"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = storage.get_user(user_id)
         
         if not user or user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
@@ -71,29 +141,26 @@ def create_product():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Check if SKU already exists
-        if Product.query.filter_by(sku=data['sku']).first():
+        if storage.get_product_by_sku(data['sku']):
             return jsonify({'error': 'SKU already exists'}), 409
         
         # Create product
-        product = Product(
-            name=data['name'],
-            description=data['description'],
-            sku=data['sku'],
-            price=Decimal(str(data['price'])),
-            original_price=Decimal(str(data['originalPrice'])) if data.get('originalPrice') else None,
-            stock_quantity=data.get('stockQuantity', 0),
-            category=data['category'],
-            image_url=data['imageUrl'],
-            rating=Decimal(str(data.get('rating', 0)))
-        )
-        
-        db.session.add(product)
-        db.session.commit()
+        product = storage.create_product({
+            'name': data['name'],
+            'description': data['description'],
+            'sku': data['sku'],
+            'price': Decimal(str(data['price'])),
+            'original_price': Decimal(str(data['originalPrice'])) if data.get('originalPrice') else None,
+            'stock_quantity': data.get('stockQuantity', 0),
+            'category': data['category'],
+            'image_url': data['imageUrl'],
+            'rating': Decimal(str(data.get('rating', 0)))
+        })
         
         return jsonify(product.to_dict()), 201
         
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<product_id>', methods=['PUT'])
@@ -102,43 +169,52 @@ def update_product(product_id):
     """Update product (admin only)"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = storage.get_user(user_id)
         
         if not user or user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        product = Product.query.get(product_id)
+        product = storage.get_product(product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
         data = request.get_json()
         
         # Update fields
+        changes = {}
         if 'name' in data:
-            product.name = data['name']
+            changes['name'] = data['name']
         if 'description' in data:
-            product.description = data['description']
+            changes['description'] = data['description']
         if 'price' in data:
-            product.price = Decimal(str(data['price']))
+            changes['price'] = Decimal(str(data['price']))
         if 'originalPrice' in data:
-            product.original_price = Decimal(str(data['originalPrice'])) if data['originalPrice'] else None
+            changes['original_price'] = Decimal(str(data['originalPrice'])) if data['originalPrice'] else None
         if 'stockQuantity' in data:
-            product.stock_quantity = data['stockQuantity']
+            changes['stock_quantity'] = data['stockQuantity']
         if 'category' in data:
-            product.category = data['category']
+            changes['category'] = data['category']
         if 'imageUrl' in data:
-            product.image_url = data['imageUrl']
+            changes['image_url'] = data['imageUrl']
         if 'rating' in data:
-            product.rating = Decimal(str(data['rating']))
+            changes['rating'] = Decimal(str(data['rating']))
         if 'isActive' in data:
-            product.is_active = data['isActive']
+            changes['is_active'] = data['isActive']
+        
+        product = storage.update_product(product, changes, requested_version(data))
         
-        db.session.commit()
+        if 'stockQuantity' in data:
+            publish_stock(product)
         
-        return jsonify(product.to_dict()), 200
+        return versioned_response(product)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (VersionConflict, StaleDataError):
+        storage.rollback()
+        return conflict_response(Product, storage.get_product(product_id))
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<product_id>/stock', methods=['PUT'])
@@ -147,12 +223,12 @@ def update_product_stock(product_id):
     """Update product stock (admin only)"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = storage.get_user(user_id)
         
         if not user or user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        product = Product.query.get(product_id)
+        product = storage.get_product(product_id)
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
@@ -162,12 +238,18 @@ def update_product_stock(product_id):
         if quantity is None or quantity < 0:
             return jsonify({'error': 'Invalid quantity'}), 400
         
-        product.update_stock(quantity)
+        product = storage.update_stock(product, quantity, requested_version(data))
+        publish_stock(product)
         
-        return jsonify(product.to_dict()), 200
+        return versioned_response(product)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (VersionConflict, StaleDataError):
+        storage.rollback()
+        return conflict_response(Product, storage.get_product(product_id))
     except Exception as e:
-        db.session.rollback()
+        storage.rollback()
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/low-stock', methods=['GET'])
@@ -176,16 +258,13 @@ def get_low_stock_products():
     """Get low stock products (admin only)"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = storage.get_user(user_id)
         
         if not user or user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
         threshold = int(request.args.get('threshold', 10))
-        products = Product.query.filter(
-            Product.is_active == True,
-            Product.stock_quantity <= threshold
-        ).all()
+        products = storage.low_stock_products(threshold)
         
         result = []
         for product in products:
@@ -0,0 +1,45 @@
+from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.storage import storage
+from services.profiling import profiler
+
+profiles_bp = Blueprint('profiles', __name__)
+
+@profiles_bp.route('', methods=['GET'])
+@jwt_required()
+def list_profiles():
+    """List recent request profiles (admin only)"""
+    try:
+        user_id = get_jwt_identity()
+        user = storage.get_user(user_id)
+        
+        if not user or user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        endpoint = request.args.get('endpoint')
+        limit = int(request.args.get('limit', 50))
+        
+        return jsonify(profiler.list_profiles(endpoint, limit)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@profiles_bp.route('/<name>', methods=['GET'])
+@jwt_required()
+def get_profile(name):
+    """Download a profile in collapsed stack format (admin only)"""
+    try:
+        user_id = get_jwt_identity()
+        user = storage.get_user(user_id)
+        
+        if not user or user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        path = profiler.path_for(name)
+        if not path:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
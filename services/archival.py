@@ -0,0 +1,123 @@
+"""
+Archival of closed orders
+
+Delivered and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS are
+moved in batches from orders/order_items to orders_archive and
+order_items_archive, keeping the hot tables small. Per-status totals of
+everything archived are kept in orders_archive_stats so aggregates stay
+correct without reading the archive.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import insert, delete, select, func
+from app import db
+from models.order import Order, OrderItem
+from models.archive import ArchivedOrder, ArchivedOrderItem, ArchiveStat
+
+logger = logging.getLogger(__name__)
+
+ORDER_COLUMNS = [column.name for column in Order.__table__.columns if column.name in ArchivedOrder.__table__.columns]
+ITEM_COLUMNS = [column.name for column in OrderItem.__table__.columns if column.name in ArchivedOrderItem.__table__.columns]
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch of closed orders, returning how many were moved"""
+    query = db.session.query(Order.id).filter(
+        Order.status.in_(Order.CLOSED_STATUSES),
+        Order.created_at < cutoff
+    ).order_by(Order.created_at).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Let concurrent archivers work on disjoint batches
+        query = query.with_for_update(skip_locked=True)
+    ids = [order_id for order_id, in query.all()]
+    if not ids:
+        db.session.rollback()
+        return 0
+
+    order_table = Order.__table__
+    item_table = OrderItem.__table__
+
+    totals = db.session.execute(
+        select(order_table.c.status, func.count(), func.sum(order_table.c.total_amount))
+        .where(order_table.c.id.in_(ids))
+        .group_by(order_table.c.status)
+    ).all()
+
+    db.session.execute(insert(ArchivedOrder.__table__).from_select(
+        ORDER_COLUMNS, select(*[order_table.c[name] for name in ORDER_COLUMNS]).where(order_table.c.id.in_(ids))
+    ))
+    db.session.execute(insert(ArchivedOrderItem.__table__).from_select(
+        ITEM_COLUMNS, select(*[item_table.c[name] for name in ITEM_COLUMNS]).where(item_table.c.order_id.in_(ids))
+    ))
+    db.session.execute(delete(item_table).where(item_table.c.order_id.in_(ids)))
+    db.session.execute(delete(order_table).where(order_table.c.id.in_(ids)))
+
+    for status, count, amount in totals:
+        stat = db.session.get(ArchiveStat, status, with_for_update=True)
+        if stat is None:
+            stat = ArchiveStat(status=status, order_count=0, total_amount=0)
+            db.session.add(stat)
+        stat.order_count += count
+        stat.total_amount += amount or 0
+
+    db.session.commit()
+    return len(ids)
+
+
+def archive_orders(older_than_days=90, batch_size=1000, max_batches=None):
+    """Archive closed orders in batches, one transaction per batch"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            count = archive_batch(cutoff, batch_size)
+        except Exception:
+            db.session.rollback()
+            raise
+        if not count:
+            break
+        moved += count
+        batches += 1
+    return moved
+
+
+def find_order(order_id=None, order_number=None):
+    """Look an order up by id or number in the hot table, then the archive"""
+    for model in (Order, ArchivedOrder):
+        if order_id is not None:
+            order = db.session.get(model, order_id)
+        else:
+            order = model.query.filter_by(order_number=order_number).first()
+        if order is not None:
+            return order
+    return None
+
+
+def archived_totals():
+    """Archived order count and revenue per status"""
+    return {stat.status: (stat.order_count, stat.total_amount) for stat in ArchiveStat.query.all()}
+
+
+def start_archiver(app):
+    """Run archive_orders periodically in a daemon thread"""
+    interval = app.config['ORDER_ARCHIVE_INTERVAL_SECONDS']
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    moved = archive_orders(
+                        app.config['ORDER_ARCHIVE_AFTER_DAYS'],
+                        app.config['ORDER_ARCHIVE_BATCH_SIZE']
+                    )
+                    if moved:
+                        logger.info('Archived %d closed orders', moved)
+                except Exception:
+                    logger.exception('Order archival failed')
+
+    thread = threading.Thread(target=run, name='order-archiver', daemon=True)
+    thread.start()
+    return stop
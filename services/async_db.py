@@ -0,0 +1,88 @@
+"""
+Async database access and auth for the ASGI serving mode
+
+Reuses the Flask-SQLAlchemy models with an AsyncEngine so read-heavy
+endpoints can run on the event loop instead of tying up worker threads.
+"""
+import jwt as pyjwt
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+
+class AuthError(Exception):
+    """Raised when a request does not carry a usable access token"""
+
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def async_database_url(url):
+    """Swap a sync driver for its asyncio counterpart"""
+    scheme, rest = url.split('://', 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+class AsyncDatabase:
+    """Owns the async engine and session factory for one app"""
+
+    def __init__(self):
+        self.app = None
+        self.engine = None
+        self.sessionmaker = None
+        self.jwt_secret = None
+
+    def init_app(self, app):
+        """Build the async engine from the Flask app's configuration"""
+        self.app = app
+        url = async_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        options = {}
+        if not url.startswith('sqlite'):
+            options.update(
+                pool_size=app.config.get('ASYNC_DB_POOL_SIZE', 20),
+                max_overflow=app.config.get('ASYNC_DB_MAX_OVERFLOW', 20)
+            )
+        self.engine = create_async_engine(url, **options)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.jwt_secret = app.config['JWT_SECRET_KEY']
+
+    def session(self):
+        return self.sessionmaker()
+
+    async def run_sync(self, function):
+        """Call function in a worker thread inside the Flask app context, for code built on db.session"""
+        def call():
+            with self.app.app_context():
+                return function()
+        return await run_in_threadpool(call)
+
+    def identity(self, request):
+        """Decode the bearer token the same way flask-jwt-extended issues it"""
+        header = request.headers.get('Authorization', '')
+        if not header:
+            raise AuthError('Missing Authorization Header')
+        parts = header.split()
+        if len(parts) != 2 or parts[0] != 'Bearer':
+            raise AuthError("Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", 422)
+        try:
+            claims = pyjwt.decode(parts[1], self.jwt_secret, algorithms=['HS256'])
+        except pyjwt.ExpiredSignatureError:
+            raise AuthError('Token has expired')
+        except pyjwt.InvalidTokenError as e:
+            raise AuthError(str(e), 422)
+        if claims.get('type') != 'access':
+            raise AuthError('Only non-refresh tokens are allowed', 422)
+        return claims['sub']
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,136 @@
+"""
+Abandoned cart compaction
+
+Every cart write records the time in cart_activity (one row per user,
+indexed on touched_at). Carts idle for longer than CART_TTL_DAYS are
+removed in batches of CART_COMPACTION_BATCH_SIZE carts, one short
+transaction each. On PostgreSQL the batch rows are locked with SKIP
+LOCKED, so concurrent compactors never block each other. A cart touched
+mid-batch waits for the batch to commit and then starts a new cart. If
+CART_COMPACTION_ARCHIVE is set, the items are first copied to
+cart_items_archive.
+
+Carts created before activity tracking are picked up on each run: they
+get an activity row stamped with their newest item's created_at.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, func, literal
+from app import db
+from models.cart import CartItem, CartActivity
+from models.archive import ArchivedCartItem
+from services.metrics import CARTS_COMPACTED, CART_ROWS_COMPACTED
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ['id', 'user_id', 'product_id', 'quantity', 'created_at']
+
+
+def touch_cart(user_id, now=None):
+    """Record cart activity; runs in the caller's transaction"""
+    now = now or datetime.utcnow()
+    table = CartActivity.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        statement = upsert(table).values(user_id=user_id, touched_at=now)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id'], set_={'touched_at': statement.excluded.touched_at}
+        ))
+        return
+    if db.session.execute(update(table).where(table.c.user_id == user_id).values(touched_at=now)).rowcount == 0:
+        db.session.execute(insert(table).values(user_id=user_id, touched_at=now))
+
+
+def backfill_activity():
+    """Give carts without an activity row one dated by their newest item"""
+    activity = CartActivity.__table__
+    items = CartItem.__table__
+    untracked = select(items.c.user_id, func.max(items.c.created_at)).where(
+        ~select(activity.c.user_id).where(activity.c.user_id == items.c.user_id).exists()
+    ).group_by(items.c.user_id)
+    result = db.session.execute(insert(activity).from_select(['user_id', 'touched_at'], untracked))
+    db.session.commit()
+    return result.rowcount
+
+
+def compact_batch(cutoff, batch_size, archive=False):
+    """Remove one batch of idle carts, returning (carts, item rows) removed"""
+    activity = CartActivity.__table__
+    items = CartItem.__table__
+
+    query = select(activity.c.user_id).where(activity.c.touched_at < cutoff).order_by(activity.c.touched_at).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    user_ids = [user_id for user_id, in db.session.execute(query)]
+    if not user_ids:
+        db.session.rollback()
+        return 0, 0
+
+    # Re-checked in every statement in case a cart was touched since it was picked
+    idle = select(activity.c.user_id).where(activity.c.user_id.in_(user_ids), activity.c.touched_at < cutoff)
+    if archive:
+        db.session.execute(insert(ArchivedCartItem.__table__).from_select(
+            ARCHIVE_COLUMNS + ['abandoned_at'],
+            select(*(items.c[name] for name in ARCHIVE_COLUMNS), literal(datetime.utcnow()))
+            .where(items.c.user_id.in_(idle))
+        ))
+    rows = db.session.execute(delete(items).where(items.c.user_id.in_(idle))).rowcount
+    carts = db.session.execute(
+        delete(activity).where(activity.c.user_id.in_(user_ids), activity.c.touched_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return carts, rows
+
+
+def compact_carts(ttl_days=30, batch_size=500, archive=False, max_batches=None, pause_seconds=0):
+    """Compact idle carts batch by batch and report what was reclaimed"""
+    started = time.monotonic()
+    report = {'backfilled': backfill_activity(), 'carts': 0, 'rows': 0, 'batches': 0}
+    cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+    while max_batches is None or report['batches'] < max_batches:
+        carts, rows = compact_batch(cutoff, batch_size, archive)
+        if not carts and not rows:
+            break
+        report['carts'] += carts
+        report['rows'] += rows
+        report['batches'] += 1
+        CARTS_COMPACTED.inc(carts)
+        CART_ROWS_COMPACTED.inc(rows)
+        if pause_seconds:
+            # Let other writers in between batches
+            time.sleep(pause_seconds)
+    report['seconds'] = round(time.monotonic() - started, 3)
+    return report
+
+
+def start_cart_compactor(app):
+    """Run compact_carts periodically in a daemon thread"""
+    interval = app.config['CART_COMPACTION_INTERVAL_SECONDS']
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    report = compact_carts(
+                        app.config['CART_TTL_DAYS'],
+                        app.config['CART_COMPACTION_BATCH_SIZE'],
+                        app.config['CART_COMPACTION_ARCHIVE']
+                    )
+                    logger.info('Cart compaction reclaimed %d rows from %d idle carts in %d batches (%.2fs)',
+                                report['rows'], report['carts'], report['batches'], report['seconds'])
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Cart compaction failed')
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='cart-compactor', daemon=True)
+    thread.start()
+    return stop
@@ -0,0 +1,159 @@
+"""
+Product listing queries
+
+Builds the SELECT behind GET /api/products for both the Flask and the
+ASGI handlers. Every sort is paired with a composite index on products
+that leads with is_active (and category when filtering by it). The
+database can then answer "cheapest 24 in-stock Electronics" by walking
+one index range in order and stopping after the limit. Pages continue
+from an opaque keyset cursor (the last row's sort value and id), never
+an OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import select, or_, tuple_
+from models.product import Product
+
+# Sort name -> (column, descending, parser for cursor values)
+SORTS = {
+    'price_asc': (Product.price, False, Decimal),
+    'price_desc': (Product.price, True, Decimal),
+    'rating': (Product.rating, True, Decimal),
+    'newest': (Product.created_at, True, datetime.fromisoformat)
+}
+
+DEFAULT_PAGE_SORT = 'newest'
+MAX_PAGE_SIZE = 100
+
+
+def search_clause(search):
+    return or_(
+        Product.name.ilike(f'%{search}%'),
+        Product.description.ilike(f'%{search}%'),
+        Product.category.ilike(f'%{search}%')
+    )
+
+
+def parse_price(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'{name} must be a number')
+    if price < 0:
+        raise ValueError(f'{name} must not be negative')
+    return price
+
+
+def encode_cursor(sort, product):
+    column, _, _ = SORTS[sort]
+    value = getattr(product, column.key)
+    payload = [sort, value.isoformat() if isinstance(value, datetime) else str(value), product.id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, product_id = json.loads(base64.urlsafe_b64decode(padded))
+        _, _, parse = SORTS[cursor_sort]
+        value = parse(value)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort:
+        raise ValueError('Cursor was issued for a different sort')
+    return value, product_id
+
+
+def page_sort(args):
+    """The requested sort; paged requests default to newest so cursors have an order"""
+    if args.get('sort'):
+        return args.get('sort')
+    if args.get('limit') is not None or args.get('cursor'):
+        return DEFAULT_PAGE_SORT
+    return None
+
+
+def listing_params(args):
+    """Validated listing filters, page size, sort and cursor position; raises ValueError"""
+    params = {
+        'category': args.get('category') or None,
+        'search': args.get('search') or None,
+        'in_stock': args.get('inStock') == 'true',
+        'min_price': parse_price(args.get('minPrice'), 'minPrice'),
+        'max_price': parse_price(args.get('maxPrice'), 'maxPrice'),
+        'limit': args.get('limit'),
+        'sort': page_sort(args),
+        'after': None
+    }
+    if params['min_price'] is not None and params['max_price'] is not None and params['min_price'] > params['max_price']:
+        raise ValueError('minPrice must not exceed maxPrice')
+
+    if params['limit'] is not None:
+        try:
+            params['limit'] = int(params['limit'])
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if not 1 <= params['limit'] <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    if params['sort'] is not None:
+        if params['sort'] not in SORTS:
+            raise ValueError(f'sort must be one of {", ".join(SORTS)}')
+        if args.get('cursor'):
+            # (sort value, id) of the last row already seen
+            params['after'] = decode_cursor(args.get('cursor'), params['sort'])
+    return params
+
+
+def listing_statement(args, columns=None):
+    """SELECT for the listing filters in args, plus the page size (None = unpaged)
+
+    Selects Product entities, or just the given table columns for Core
+    reads. Raises ValueError for malformed parameters.
+    """
+    params = listing_params(args)
+    statement = select(*columns) if columns is not None else select(Product)
+    statement = statement.where(Product.is_active == True)
+
+    if params['category']:
+        statement = statement.where(Product.category == params['category'])
+    if params['search']:
+        statement = statement.where(search_clause(params['search']))
+    if params['in_stock']:
+        statement = statement.where(Product.stock_quantity > 0)
+    if params['min_price'] is not None:
+        statement = statement.where(Product.price >= params['min_price'])
+    if params['max_price'] is not None:
+        statement = statement.where(Product.price <= params['max_price'])
+
+    limit = params['limit']
+    if params['sort'] is None:
+        return statement, limit
+
+    column, descending, _ = SORTS[params['sort']]
+    if params['after'] is not None:
+        position = tuple_(column, Product.id)
+        statement = statement.where(position < params['after'] if descending else position > params['after'])
+
+    # id breaks ties so the order, and therefore the cursor, is total
+    if descending:
+        statement = statement.order_by(column.desc(), Product.id.desc())
+    else:
+        statement = statement.order_by(column, Product.id)
+
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        statement = statement.limit(limit + 1)
+    return statement, limit
+
+
+def paginate(products, args, limit):
+    """Trim the look-ahead row and return (products, next cursor or None)"""
+    if limit is None or len(products) <= limit:
+        return products, None
+    products = products[:limit]
+    return products, encode_cursor(page_sort(args), products[-1])
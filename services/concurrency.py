@@ -0,0 +1,97 @@
+"""
+Optimistic concurrency for products and orders
+
+Product and Order carry a version column that SQLAlchemy maintains as
+a version counter. Every ORM UPDATE is issued as
+
+    UPDATE ... SET ..., version = :loaded + 1 WHERE id = :id AND version = :loaded
+
+and raises StaleDataError when another writer got there first, instead
+of silently overwriting it. Set-based Core updates bump the column
+themselves.
+
+API clients send the version they last read, either as If-Match (the
+ETag of the resource) or as "version" in the JSON body. A mismatch, or
+a write that loses the race, is answered with 409 and the current
+version.
+"""
+import random
+import time
+from flask import request, jsonify
+from sqlalchemy.orm.exc import StaleDataError
+from app import db
+
+
+class VersionConflict(Exception):
+    """The client's version no longer matches the stored one"""
+
+    def __init__(self, instance):
+        super().__init__(f'{type(instance).__name__} {instance.id} was modified by another request')
+        self.instance = instance
+
+
+def etag(instance):
+    return f'"{instance.version}"'
+
+
+def requested_version(data=None):
+    """The version the client expects, from If-Match or the body; None if unconditional
+
+    Raises ValueError for a malformed value.
+    """
+    header = request.headers.get('If-Match')
+    if header is not None and header.strip() != '*':
+        value = header.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        try:
+            return int(value.strip('"'))
+        except ValueError:
+            raise ValueError('If-Match must be a version ETag')
+    if data and data.get('version') is not None:
+        version = data['version']
+        if isinstance(version, bool) or not isinstance(version, int):
+            raise ValueError('version must be an integer')
+        return version
+    return None
+
+
+def check_version(instance, expected):
+    """Raise VersionConflict unless the loaded instance is at the expected version"""
+    if expected is not None and instance.version != expected:
+        raise VersionConflict(instance)
+
+
+def versioned_response(instance, status=200):
+    """The instance as JSON, with its version as the ETag"""
+    response = jsonify(instance.to_dict())
+    response.headers['ETag'] = etag(instance)
+    return response, status
+
+
+def conflict_response(model, current):
+    """409 with the stored version; current is the record reloaded after rolling back the failed write"""
+    body = {'error': f'{model.__name__} was modified by another request'}
+    if current is not None:
+        body['currentVersion'] = current.version
+    response = jsonify(body)
+    if current is not None:
+        response.headers['ETag'] = etag(current)
+    return response, 409
+
+
+def retry_on_conflict(operation, attempts=3, backoff_seconds=0.02):
+    """Run operation() until it commits without a version conflict
+
+    For internal callers that can simply redo their read-modify-write:
+    operation must load what it needs itself, since the session is
+    rolled back (and everything in it expired) between attempts.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except (StaleDataError, VersionConflict):
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5))
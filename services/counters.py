@@ -0,0 +1,40 @@
+"""Atomic increments of counter rows keyed by a composite primary key"""
+from sqlalchemy import update
+from app import db
+
+# Keeps multi-row VALUES under SQLite's bound parameter limit
+CHUNK_ROWS = 500
+
+
+def add_to_counters(table, key_columns, value_columns, rows, session=None):
+    """Add each row's values to the matching counter, creating missing ones
+
+    Uses INSERT ... ON CONFLICT DO UPDATE where the dialect has it, so
+    concurrent writers never lose increments; other databases fall back
+    to UPDATE, then INSERT when no row matched.
+    """
+    if not rows:
+        return
+    session = session or db.session
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        for start in range(0, len(rows), CHUNK_ROWS):
+            statement = insert(table).values(rows[start:start + CHUNK_ROWS])
+            session.execute(statement.on_conflict_do_update(
+                index_elements=key_columns,
+                set_={column: table.c[column] + statement.excluded[column] for column in value_columns}
+            ))
+        return
+
+    for row in rows:
+        result = session.execute(
+            update(table)
+            .where(*[table.c[column] == row[column] for column in key_columns])
+            .values({column: table.c[column] + row[column] for column in value_columns})
+        )
+        if result.rowcount == 0:
+            session.execute(table.insert().values(row))
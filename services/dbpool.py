@@ -0,0 +1,45 @@
+import threading
+import time
+from collections import deque
+from sqlalchemy.pool import QueuePool
+
+
+class PoolWaitMonitor:
+    """Rolling window of connection pool checkout wait times"""
+
+    def __init__(self, window_seconds=5.0, max_samples=2048):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.listeners = []
+
+    def record(self, wait_seconds):
+        """Record how long a checkout waited for a connection"""
+        with self._lock:
+            self._samples.append((time.monotonic(), wait_seconds))
+        for listener in self.listeners:
+            listener(wait_seconds)
+
+    def recent_wait(self):
+        """Average checkout wait over the window, 0 when the pool is idle"""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            if not self._samples:
+                return 0.0
+            return sum(wait for _, wait in self._samples) / len(self._samples)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_monitor.record(time.perf_counter() - start)
+
+
+pool_monitor = PoolWaitMonitor()
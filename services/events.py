@@ -0,0 +1,167 @@
+import json
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+
+class Subscription:
+    """A single stream subscriber with its own bounded queue and filter"""
+
+    def __init__(self, filters, max_queue):
+        self.filters = filters
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def matches(self, event):
+        """Check whether an event passes this subscriber's filters"""
+        topics = self.filters.get('topics')
+        if topics and event['type'].split('.', 1)[0] not in topics:
+            return False
+
+        data = event['data']
+        customer_id = self.filters.get('customer_id')
+        if customer_id and event['type'].startswith('order.') and data.get('customerId') != customer_id:
+            return False
+
+        statuses = self.filters.get('statuses')
+        if statuses and 'status' in data and data['status'] not in statuses:
+            return False
+
+        product_ids = self.filters.get('product_ids')
+        if product_ids and 'productId' in data and data['productId'] not in product_ids:
+            return False
+
+        return True
+
+    def push(self, event):
+        """Queue an event, flagging the subscriber if it cannot keep up"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventBroker:
+    """In-process fan-out of change events with a bounded replay buffer"""
+
+    def __init__(self, buffer_size=1000, max_queue=256):
+        self.buffer_size = buffer_size
+        self.max_queue = max_queue
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure buffer sizes from the app config"""
+        self.buffer_size = app.config.get('EVENT_BUFFER_SIZE', self.buffer_size)
+        self.max_queue = app.config.get('EVENT_SUBSCRIBER_QUEUE_SIZE', self.max_queue)
+        with self._lock:
+            self._buffer = deque(self._buffer, maxlen=self.buffer_size)
+        app.extensions['event_broker'] = self
+
+    def publish(self, event_type, data):
+        """Record an event and deliver it to every matching subscriber"""
+        with self._lock:
+            self._last_id += 1
+            event = {
+                'id': self._last_id,
+                'type': event_type,
+                'data': data,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            if subscription.matches(event):
+                subscription.push(event)
+
+        return event
+
+    def subscribe(self, filters, last_event_id=None):
+        """Register a subscriber and return it with any events it missed
+
+        The replay list is None when last_event_id has already fallen out of
+        the buffer, or is newer than any event published since this process
+        started (ids restart with the process), in which case the client has
+        to refetch its snapshot.
+        """
+        subscription = Subscription(filters, self.max_queue)
+        with self._lock:
+            replay = []
+            if last_event_id is not None:
+                oldest_id = self._buffer[0]['id'] if self._buffer else None
+                if last_event_id > self._last_id or (oldest_id is not None and last_event_id < oldest_id - 1):
+                    replay = None
+                else:
+                    replay = [
+                        event for event in self._buffer
+                        if event['id'] > last_event_id and subscription.matches(event)
+                    ]
+            self._subscribers.add(subscription)
+        return subscription, replay
+
+    def unsubscribe(self, subscription):
+        """Stop delivering events to a subscriber"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        """Number of currently connected subscribers"""
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event):
+    """Serialize an event in text/event-stream wire format"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def order_delta(order):
+    """Small payload describing an order's current state"""
+    return {
+        'orderId': order.id,
+        'orderNumber': order.order_number,
+        'customerId': order.customer_id,
+        'status': order.status,
+        'totalAmount': str(order.total_amount),
+        'updatedAt': order.updated_at.isoformat() if order.updated_at else None
+    }
+
+
+def stock_delta(product, threshold=10):
+    """Small payload describing a product's current stock level"""
+    return {
+        'productId': product.id,
+        'sku': product.sku,
+        'stockQuantity': product.stock_quantity,
+        'lowStock': product.is_low_stock(threshold),
+        'outOfStock': product.is_out_of_stock()
+    }
+
+
+def publish_order(event_type, order):
+    """Publish an order change event"""
+    return broker.publish(event_type, order_delta(order))
+
+
+def publish_stock(product):
+    """Publish a stock level change event"""
+    return broker.publish('inventory.stock_changed', stock_delta(product))
+
+
+def publish_stock_levels(rows, threshold=10):
+    """Publish stock changes for (id, sku, stock_quantity) rows updated outside the ORM"""
+    for row in rows:
+        broker.publish('inventory.stock_changed', {
+            'productId': row.id,
+            'sku': row.sku,
+            'stockQuantity': row.stock_quantity,
+            'lowStock': 0 < row.stock_quantity <= threshold,
+            'outOfStock': row.stock_quantity == 0
+        })
+
+
+broker = EventBroker()
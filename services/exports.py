@@ -0,0 +1,267 @@
+"""
+Streaming order and sales exports
+
+Rows come from server-side cursors (stream_results + yield_per) over the
+hot and archive tables, merged by created_at, and are encoded chunk by
+chunk so memory stays flat whatever the date range.
+"""
+import csv
+import heapq
+import io
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import select
+from app import db
+from models.order import Order, OrderItem
+from models.archive import ArchivedOrder, ArchivedOrderItem
+from services.tracing import tracer
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+ORDER_FIELDS = [
+    ('id', 'id'), ('orderNumber', 'order_number'), ('customerId', 'customer_id'),
+    ('customerName', 'customer_name'), ('customerEmail', 'customer_email'), ('status', 'status'),
+    ('totalAmount', 'total_amount'), ('shippingAddress', 'shipping_address'),
+    ('createdAt', 'created_at'), ('updatedAt', 'updated_at')
+]
+SALES_FIELDS = [
+    ('orderId', 'order_id'), ('orderNumber', 'order_number'), ('createdAt', 'created_at'), ('status', 'status'),
+    ('productId', 'product_id'), ('productSku', 'product_sku'), ('productName', 'product_name'),
+    ('quantity', 'quantity'), ('unitPrice', 'unit_price'), ('totalPrice', 'total_price')
+]
+
+
+def order_statement(order_model, start, end):
+    table = order_model.__table__
+    statement = select(*[table.c[column] for _, column in ORDER_FIELDS])
+    return date_range(statement, table, start, end).order_by(table.c.created_at)
+
+
+def sales_statement(order_model, item_model, start, end):
+    orders = order_model.__table__
+    items = item_model.__table__
+    columns = {
+        'order_id': orders.c.id, 'order_number': orders.c.order_number, 'created_at': orders.c.created_at,
+        'status': orders.c.status, 'product_id': items.c.product_id, 'product_sku': items.c.product_sku,
+        'product_name': items.c.product_name, 'quantity': items.c.quantity,
+        'unit_price': items.c.unit_price, 'total_price': items.c.total_price
+    }
+    statement = select(*[columns[column] for _, column in SALES_FIELDS]) \
+        .select_from(items.join(orders, items.c.order_id == orders.c.id))
+    return date_range(statement, orders, start, end).order_by(orders.c.created_at)
+
+
+def date_range(statement, table, start, end):
+    if start:
+        statement = statement.where(table.c.created_at >= start)
+    if end:
+        statement = statement.where(table.c.created_at < end)
+    return statement
+
+
+def stream_rows(statement, batch_size):
+    """Iterate rows through a server-side cursor"""
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    try:
+        for row in result:
+            yield tuple(row)
+    finally:
+        result.close()
+
+
+def export_rows(kind, start=None, end=None, batch_size=1000):
+    """Rows for an export from the hot and archive tables, ordered by created_at"""
+    if kind == 'orders':
+        statements = [order_statement(Order, start, end), order_statement(ArchivedOrder, start, end)]
+        fields = ORDER_FIELDS
+    else:
+        statements = [sales_statement(Order, OrderItem, start, end),
+                      sales_statement(ArchivedOrder, ArchivedOrderItem, start, end)]
+        fields = SALES_FIELDS
+    position = [column for _, column in fields].index('created_at')
+    streams = [stream_rows(statement, batch_size) for statement in statements]
+    return [name for name, _ in fields], heapq.merge(*streams, key=lambda row: row[position])
+
+
+def plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(header, rows, chunk_rows=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([plain(value) for value in row])
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode_ndjson(header, rows, chunk_rows=1000):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, (plain(value) for value in row)))))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+class ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def encode_parquet(header, rows, chunk_rows=50000):
+    """Encode rows as Parquet, yielding each row group as it is written"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export requires pyarrow')
+
+    sink = ChunkSink()
+    writer = None
+    batch = []
+
+    def write_batch():
+        nonlocal writer
+        columns = list(zip(*batch))
+        table = pa.table({name: [plain(value) for value in column] for name, column in zip(header, columns)})
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table.cast(writer.schema))
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_rows:
+            write_batch()
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_batch()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([(name, pa.string()) for name in header]))
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {'csv': encode_csv, 'ndjson': encode_ndjson, 'parquet': encode_parquet}
+
+
+def encode(fmt, header, rows):
+    return ENCODERS[fmt](header, rows)
+
+
+class ExportJobs:
+    """Background exports written to local files, tracked per process"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, app, kind, fmt, start, end, requested_by):
+        job_id = str(uuid.uuid4())
+        directory = app.config['EXPORT_DIR']
+        os.makedirs(directory, exist_ok=True)
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'format': fmt,
+            'from': start.isoformat() if start else None,
+            'to': end.isoformat() if end else None,
+            'status': 'running',
+            'rows': 0,
+            'requestedBy': requested_by,
+            'createdAt': datetime.utcnow().isoformat(),
+            'finishedAt': None,
+            'error': None,
+            'path': os.path.join(directory, f'{kind}-{job_id}.{FORMATS[fmt][1]}')
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+        # The job joins the trace of the request that started it
+        thread = threading.Thread(target=tracer.wrap(self.run), args=(app, job, start, end), daemon=True)
+        thread.start()
+        return job
+
+    def run(self, app, job, start, end):
+        with app.app_context(), tracer.span('export.write', job_id=job['id'], export_kind=job['kind'], format=job['format']) as span:
+            try:
+                header, rows = export_rows(job['kind'], start, end, app.config['EXPORT_BATCH_SIZE'])
+
+                def counted():
+                    for row in rows:
+                        job['rows'] += 1
+                        yield row
+
+                mode = 'wb' if job['format'] == 'parquet' else 'w'
+                with open(job['path'], mode, **({} if mode == 'wb' else {'newline': ''})) as f:
+                    for chunk in encode(job['format'], header, counted()):
+                        f.write(chunk)
+                job['status'] = 'completed'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+                span.set_error(e)
+            finally:
+                job['finishedAt'] = datetime.utcnow().isoformat()
+                span.set_attribute('rows', job['rows'])
+                db.session.remove()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+
+def public_job(job):
+    return {key: value for key, value in job.items() if key != 'path'}
+
+
+export_jobs = ExportJobs()
@@ -0,0 +1,309 @@
+"""
+Product facet counts
+
+Every active product falls into exactly one value of each facet:
+category, price band, rating band and availability.
+
+Unfiltered views read product_facet_counts, which a before_flush hook
+keeps current by applying +1/-1 deltas whenever a product is created,
+deleted or changes a facet-relevant column, in the same transaction.
+
+Filtered views use a per-process bitmap index: one Python int per
+facet value with a bit set for each matching product. Counts for a
+filter state are popcounts of ANDed masks. Each facet is counted with
+every filter except its own, so the UI can still offer alternatives.
+The index is rebuilt after local product commits and at most every
+FACET_INDEX_TTL_SECONDS otherwise.
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from sqlalchemy import event, inspect, select, delete
+from app import db
+from models.product import Product
+from models.facet import ProductFacetCount
+from services.counters import add_to_counters
+
+FACETS = ['category', 'priceBand', 'ratingBand', 'availability']
+
+# Lower bound, label; the last band is open-ended
+PRICE_BANDS = [
+    (Decimal('0'), '0-25'),
+    (Decimal('25'), '25-50'),
+    (Decimal('50'), '50-100'),
+    (Decimal('100'), '100-250'),
+    (Decimal('250'), '250+')
+]
+RATING_BANDS = ['0-1', '1-2', '2-3', '3-4', '4-5']
+
+FACET_COLUMNS = ['category', 'price', 'rating', 'stock_quantity', 'is_active']
+
+# Marks product_facet_counts as fully built, so partial tables are never served
+BUILT_MARKER = ('_meta', 'built')
+
+# Products per precomputed price-order prefix mask
+PRICE_BLOCK = 1024
+
+
+def price_band(price):
+    label = PRICE_BANDS[0][1]
+    for lower, band in PRICE_BANDS:
+        if Decimal(price) >= lower:
+            label = band
+    return label
+
+
+def rating_band(rating):
+    return RATING_BANDS[min(max(int(rating or 0), 0), len(RATING_BANDS) - 1)]
+
+
+def facet_values(category, price, rating, stock_quantity, is_active):
+    """The (facet, value) pairs a product counts towards; none if inactive"""
+    if is_active is False:
+        return []
+    return [
+        ('category', category),
+        ('priceBand', price_band(price)),
+        ('ratingBand', rating_band(rating)),
+        ('availability', 'inStock' if (stock_quantity or 0) > 0 else 'outOfStock')
+    ]
+
+
+def current_values(product):
+    return facet_values(*(getattr(product, column) for column in FACET_COLUMNS))
+
+
+def mask_of(positions, size):
+    """Bitmap with the given positions set"""
+    # OR-ing bits into an int copies it every time; a bytearray is set in place and converted once
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def committed_values(product):
+    """Facet values as of the last flush, from attribute history"""
+    state = inspect(product)
+    values = []
+    for column in FACET_COLUMNS:
+        history = state.attrs[column].history
+        values.append(history.deleted[0] if history.deleted else getattr(product, column))
+    return facet_values(*values)
+
+
+def track_product_changes(session, flush_context, instances):
+    """Apply facet count deltas for pending product writes in the same transaction"""
+    deltas = Counter()
+    for product in session.new:
+        if isinstance(product, Product):
+            deltas.update(current_values(product))
+    for product in session.dirty:
+        if isinstance(product, Product) and session.is_modified(product):
+            deltas.subtract(committed_values(product))
+            deltas.update(current_values(product))
+    for product in session.deleted:
+        if isinstance(product, Product):
+            deltas.subtract(committed_values(product))
+
+    rows = [{'facet': facet, 'value': value, 'count': count} for (facet, value), count in deltas.items() if count]
+    if rows:
+        session.info['products_changed'] = True
+        add_to_counters(ProductFacetCount.__table__, ['facet', 'value'], ['count'], rows, session=session)
+
+
+def record_stock_changes(changes, session=None):
+    """Availability deltas for stock changed outside the ORM, as (old, new) stock of active products
+
+    Returns whether any count changed. Callers writing on their own
+    connection pass it as session and mark facet_index stale after commit.
+    """
+    deltas = Counter()
+    for old, new in changes:
+        was, now = ('inStock' if old > 0 else 'outOfStock'), ('inStock' if new > 0 else 'outOfStock')
+        if was != now:
+            deltas[('availability', was)] -= 1
+            deltas[('availability', now)] += 1
+    rows = [{'facet': facet, 'value': value, 'count': count} for (facet, value), count in deltas.items() if count]
+    if rows:
+        if session is None:
+            db.session.info['products_changed'] = True
+        add_to_counters(ProductFacetCount.__table__, ['facet', 'value'], ['count'], rows, session=session)
+    return bool(rows)
+
+
+def mark_index_stale(session):
+    if session.info.pop('products_changed', False):
+        facet_index.stale = True
+
+
+def forget_changes(session):
+    session.info.pop('products_changed', None)
+
+
+def rebuild_counts():
+    """Recompute product_facet_counts from the products table"""
+    counts = Counter()
+    rows = db.session.execute(select(*(getattr(Product, column) for column in FACET_COLUMNS)))
+    for row in rows:
+        counts.update(facet_values(*row))
+
+    db.session.execute(delete(ProductFacetCount.__table__))
+    db.session.add_all([ProductFacetCount(facet=facet, value=value, count=count) for (facet, value), count in counts.items()])
+    db.session.add(ProductFacetCount(facet=BUILT_MARKER[0], value=BUILT_MARKER[1], count=1))
+    db.session.commit()
+    return len(counts)
+
+
+def stored_counts():
+    """Unfiltered counts from product_facet_counts, or None if it was never built"""
+    rows = ProductFacetCount.query.all()
+    if not any((row.facet, row.value) == BUILT_MARKER for row in rows):
+        return None
+    counts = {facet: {} for facet in FACETS}
+    for row in rows:
+        if row.facet in counts and row.count > 0:
+            counts[row.facet][row.value] = row.count
+    return counts
+
+
+class FacetIndex:
+    """Bitmaps over active products, one per facet value"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale = True
+        self.built_at = 0
+        self.positions = {}
+        self.masks = {}
+        self.prices = []
+        self.price_positions = []
+        self.price_prefixes = [0]
+        self.all = 0
+
+    def build(self):
+        rows = db.session.execute(
+            select(Product.id, *(getattr(Product, column) for column in FACET_COLUMNS))
+            .where(Product.is_active == True)
+            .order_by(Product.id)
+        ).all()
+        positions = {}
+        members = {facet: {} for facet in FACETS}
+        for position, (product_id, *values) in enumerate(rows):
+            positions[product_id] = position
+            for facet, value in facet_values(*values):
+                members[facet].setdefault(value, []).append(position)
+        size = len(rows)
+        by_price = sorted((Decimal(row.price), position) for position, row in enumerate(rows))
+        price_positions = [position for _, position in by_price]
+        # price_prefixes[k] holds the first k * PRICE_BLOCK products in price order
+        price_prefixes = [0]
+        for start in range(0, size, PRICE_BLOCK):
+            price_prefixes.append(price_prefixes[-1] | mask_of(price_positions[start:start + PRICE_BLOCK], size))
+        self.positions = positions
+        self.masks = {facet: {value: mask_of(bits, size) for value, bits in values.items()}
+                      for facet, values in members.items()}
+        self.prices = [price for price, _ in by_price]
+        self.price_positions = price_positions
+        self.price_prefixes = price_prefixes
+        self.all = (1 << size) - 1
+        self.built_at = time.monotonic()
+
+    def ensure_fresh(self, ttl_seconds):
+        if self.stale or time.monotonic() - self.built_at >= ttl_seconds:
+            with self.lock:
+                if self.stale or time.monotonic() - self.built_at >= ttl_seconds:
+                    self.stale = False
+                    self.build()
+
+    def mask_for_ids(self, product_ids):
+        positions = (self.positions.get(product_id) for product_id in product_ids)
+        return mask_of((position for position in positions if position is not None), len(self.positions))
+
+    def price_prefix(self, count):
+        """Mask of the count cheapest products"""
+        block = count // PRICE_BLOCK
+        rest = self.price_positions[block * PRICE_BLOCK:count]
+        return self.price_prefixes[block] | mask_of(rest, len(self.price_positions)) if rest else self.price_prefixes[block]
+
+    def price_mask(self, min_price=None, max_price=None):
+        """Products priced within [min_price, max_price], found by bisecting the price order"""
+        start = 0 if min_price is None else bisect.bisect_left(self.prices, min_price)
+        end = len(self.prices) if max_price is None else bisect.bisect_right(self.prices, max_price)
+        if start >= end:
+            return 0
+        return self.price_prefix(end) & ~self.price_prefix(start)
+
+    def value_mask(self, facet, value):
+        return self.masks[facet].get(value, 0)
+
+    def counts(self, filters, shared=None):
+        """Per-facet counts, each with every filter applied except its own
+
+        filters maps a facet to the mask its filter selects; shared is a
+        mask (e.g. text search) that applies to every facet.
+        """
+        result = {}
+        for facet in FACETS:
+            base = self.all if shared is None else shared
+            for other, mask in filters.items():
+                if other != facet:
+                    base &= mask
+            result[facet] = {
+                value: (base & mask).bit_count()
+                for value, mask in self.masks[facet].items()
+                if base & mask
+            }
+        return result
+
+
+facet_index = FacetIndex()
+
+
+# Bands are listed in range order rather than alphabetically
+VALUE_ORDER = {
+    'priceBand': [band for _, band in PRICE_BANDS],
+    'ratingBand': RATING_BANDS,
+    'availability': ['inStock', 'outOfStock']
+}
+
+
+def as_response(counts):
+    response = {}
+    for facet, values in counts.items():
+        order = VALUE_ORDER.get(facet)
+        ordered = sorted(values, key=order.index) if order else sorted(values)
+        response[facet] = [{'value': value, 'count': values[value]} for value in ordered]
+    return response
+
+
+def product_facets(category=None, in_stock=False, search_ids=None, min_price=None, max_price=None, ttl_seconds=30):
+    """Facet counts for the current filter state of GET /api/products"""
+    price_filtered = min_price is not None or max_price is not None
+    if category is None and not in_stock and search_ids is None and not price_filtered:
+        counts = stored_counts()
+        if counts is not None:
+            return as_response(counts)
+
+    facet_index.ensure_fresh(ttl_seconds)
+    filters = {}
+    if category is not None:
+        filters['category'] = facet_index.value_mask('category', category)
+    if in_stock:
+        filters['availability'] = facet_index.value_mask('availability', 'inStock')
+    if price_filtered:
+        filters['priceBand'] = facet_index.price_mask(min_price, max_price)
+    shared = facet_index.mask_for_ids(search_ids) if search_ids is not None else None
+    return as_response(facet_index.counts(filters, shared))
+
+
+def init_app(app):
+    for identifier, listener in (
+        ('before_flush', track_product_changes),
+        ('after_commit', mark_index_stale),
+        ('after_rollback', forget_changes)
+    ):
+        if not event.contains(db.session, identifier, listener):
+            event.listen(db.session, identifier, listener)
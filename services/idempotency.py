@@ -0,0 +1,211 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, current_app
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models.idempotency import IdempotencyRecord
+
+# Times a request tries to claim a key whose owners keep failing and releasing it
+CLAIM_ATTEMPTS = 3
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class ResponseCache:
+    """Small LRU of completed responses so retries skip the database"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= datetime.utcnow():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, entry):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+def request_fingerprint():
+    """Hash of the parts of a request that must match on replay"""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def replay_response(entry):
+    """Rebuild a stored response"""
+    response = make_response(entry['body'], entry['status'])
+    if entry['mimetype']:
+        response.mimetype = entry['mimetype']
+    if entry['etag']:
+        # Clients take their next If-Match from the replay as from the original
+        response.headers['ETag'] = entry['etag']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def record_entry(record):
+    return {
+        'request_hash': record.request_hash,
+        'status': record.response_status,
+        'body': record.response_body,
+        'mimetype': record.response_mimetype,
+        'etag': record.response_etag,
+        'expires_at': record.expires_at
+    }
+
+
+def claim_key(user_id, key, fingerprint, ttl):
+    """Insert an in-progress record, returning the existing one on conflict"""
+    record = IdempotencyRecord(
+        user_id=user_id,
+        key=key,
+        request_hash=fingerprint,
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+    )
+    db.session.add(record)
+    try:
+        db.session.commit()
+        return record, True
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = IdempotencyRecord.query.filter_by(user_id=user_id, key=key).first()
+    if existing and existing.is_expired():
+        db.session.delete(existing)
+        db.session.commit()
+        return claim_key(user_id, key, fingerprint, ttl)
+    return existing, False
+
+
+def wait_for_completion(user_id, key, timeout):
+    """Block until a concurrent request with the same key finishes"""
+    with _inflight_lock:
+        event = _inflight.get((user_id, key))
+    if event is not None:
+        event.wait(timeout)
+
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        db.session.expire_all()
+        record = IdempotencyRecord.query.filter_by(user_id=user_id, key=key).first()
+        if record is None or record.status == 'completed' or time.monotonic() >= deadline:
+            return record
+        # The owner may be another worker process, fall back to polling
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def idempotent(view):
+    """Replay the first response for repeated requests carrying an Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+
+        if len(key) > 255:
+            return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+        user_id = get_jwt_identity()
+        fingerprint = request_fingerprint()
+        cache_key = (user_id, key)
+
+        cached = response_cache.get(cache_key)
+        if cached:
+            if cached['request_hash'] != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was used for a different request'}), 422
+            return replay_response(cached)
+
+        ttl = current_app.config.get('IDEMPOTENCY_TTL_SECONDS', 86400)
+        for _ in range(CLAIM_ATTEMPTS):
+            record, claimed = claim_key(user_id, key, fingerprint, ttl)
+            if claimed:
+                break
+            if record is None:
+                # Owner failed and released the key between our insert and lookup
+                continue
+            if record.request_hash != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was used for a different request'}), 422
+            if record.status != 'completed':
+                record = wait_for_completion(user_id, key, current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+                if record is None:
+                    continue
+                if record.status != 'completed':
+                    return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+            entry = record_entry(record)
+            response_cache.put(cache_key, entry)
+            return replay_response(entry)
+        else:
+            # Every owner so far has failed; let the client retry later instead of racing again
+            return jsonify({'error': 'A request with this Idempotency-Key keeps failing, retry later'}), 409
+
+        event = threading.Event()
+        with _inflight_lock:
+            _inflight[cache_key] = event
+
+        try:
+            response = make_response(view(*args, **kwargs))
+            record = db.session.get(IdempotencyRecord, record.id)
+
+            if response.status_code >= 500:
+                # Let the client retry failures for real
+                db.session.delete(record)
+                db.session.commit()
+                return response
+
+            record.status = 'completed'
+            record.response_status = response.status_code
+            record.response_body = response.get_data(as_text=True)
+            record.response_mimetype = response.mimetype
+            record.response_etag = response.headers.get('ETag')
+            db.session.commit()
+            response_cache.put(cache_key, record_entry(record))
+            return response
+
+        except Exception:
+            db.session.rollback()
+            IdempotencyRecord.query.filter_by(user_id=user_id, key=key).delete()
+            db.session.commit()
+            raise
+
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cache_key, None)
+            event.set()
+
+    return wrapper
+
+
+def purge_expired():
+    """Delete idempotency records past their TTL"""
+    deleted = IdempotencyRecord.query.filter(
+        IdempotencyRecord.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,99 @@
+"""
+Conversion of existing VARCHAR(36) id columns to native UUID storage
+
+Run `flask migrate-uuid-keys` once, with the application stopped, and
+then start it with UUID_KEY_STORAGE=native.
+
+On PostgreSQL, foreign keys between the converted columns are dropped.
+Each column is then altered to uuid (indexes are rebuilt by the ALTER)
+and the foreign keys are re-created, all in one transaction.
+
+SQLite cannot change a column's declared type, but it stores whatever
+value it is given. Ids are rewritten in place as 16-byte BLOBs, which
+is exactly what native mode reads and writes there. VACUUM afterwards
+to reclaim the space.
+
+Columns that are already converted are skipped, so the command can be
+re-run.
+"""
+import uuid
+from sqlalchemy import inspect, text
+from app import db
+from models.types import UUIDKey
+
+
+def key_columns():
+    """(table name, column name) for every UUID key column in the models"""
+    return [
+        (table.name, column.name)
+        for table in db.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, UUIDKey)
+    ]
+
+
+def migrate_postgresql(connection, columns):
+    quote = connection.dialect.identifier_preparer.quote
+    tables = sorted({table for table, _ in columns})
+
+    pending = [
+        (table, column) for table, column in columns
+        if connection.execute(text(
+            'SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = :column'
+        ), {'table': table, 'column': column}).scalar() != 'uuid'
+    ]
+    if not pending:
+        return 0
+
+    inspector = inspect(connection)
+    foreign_keys = [(table, fk) for table in tables for fk in inspector.get_foreign_keys(table)]
+    for table, fk in foreign_keys:
+        connection.execute(text(f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(fk["name"])}'))
+
+    for table, column in pending:
+        connection.execute(text(
+            f'ALTER TABLE {quote(table)} ALTER COLUMN {quote(column)} TYPE uuid USING {quote(column)}::uuid'
+        ))
+
+    for table, fk in foreign_keys:
+        connection.execute(text(
+            f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(fk["name"])} '
+            f'FOREIGN KEY ({", ".join(quote(c) for c in fk["constrained_columns"])}) '
+            f'REFERENCES {quote(fk["referred_table"])} ({", ".join(quote(c) for c in fk["referred_columns"])})'
+        ))
+    return len(pending)
+
+
+def migrate_sqlite(connection, columns):
+    quote = connection.dialect.identifier_preparer.quote
+    connection.connection.driver_connection.create_function(
+        'uuid_to_blob', 1, lambda value: uuid.UUID(value).bytes, deterministic=True
+    )
+    converted = 0
+    for table, column in columns:
+        result = connection.execute(text(
+            f"UPDATE {quote(table)} SET {quote(column)} = uuid_to_blob({quote(column)}) "
+            f"WHERE typeof({quote(column)}) = 'text'"
+        ))
+        if result.rowcount:
+            converted += 1
+    return converted
+
+
+def migrate_to_native():
+    """Convert every existing UUID key column, returning how many were changed"""
+    engine = db.engine
+    existing = set(inspect(engine).get_table_names())
+    columns = [(table, column) for table, column in key_columns() if table in existing]
+
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as connection:
+            return migrate_postgresql(connection, columns)
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            # Parents and children are rewritten separately; check nothing mid-way
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
+            with connection.begin():
+                return migrate_sqlite(connection, columns)
+    raise RuntimeError(f'No UUID key migration for {engine.dialect.name}')
@@ -0,0 +1,533 @@
+"""
+In-memory storage backend
+
+Keeps users, products, orders and cart items as __slots__ records in
+dicts keyed by id, with secondary indexes for the lookups the routes
+make: users by username and email, products by SKU and category, orders
+by number, status and customer, cart lines by user. Index values are
+dicts used as insertion-ordered sets.
+
+Records are never changed in place. A write builds a replacement under
+the store's lock, swaps it in and fixes up the indexes, so a record a
+request holds is a consistent snapshot and to_dict can run without the
+lock. Versions follow the SQL backend: every write bumps them, and a
+write from a record that is no longer current raises VersionConflict
+just as StaleDataError would.
+
+Records borrow to_dict and the other read helpers from the models, so
+responses are the same JSON as with SQL.
+"""
+import threading
+from datetime import datetime
+from decimal import Decimal
+from models.types import new_id
+from models.user import User
+from models.product import Product
+from models.order import Order, OrderItem
+from models.cart import CartItem
+from services.catalog import SORTS, listing_params, paginate
+from services.concurrency import VersionConflict, check_version
+from services.events import broker, publish_stock_levels
+from services.facets import FACETS, FACET_COLUMNS, facet_values, as_response
+from services.metrics import ORDER_STATUS_CHANGES, ORDERS_CANCELLED
+from services.order_transitions import RESTOCKED, unique
+from services.storage import Storage, check_cancelled, check_transition
+from services.suggest import SUGGEST_COLUMNS, suggest_index
+from services.stock_reservations import StockLevel, InsufficientStock
+
+CENTS = Decimal('0.01')
+
+
+def columns(model):
+    return tuple(column.key for column in model.__table__.columns)
+
+
+class Record:
+    """Immutable-by-convention row; missing fields are None"""
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return type(self)(**fields)
+
+
+class UserRecord(Record):
+    __slots__ = columns(User)
+    check_password = User.check_password
+    to_dict = User.to_dict
+
+
+class ProductRecord(Record):
+    __slots__ = columns(Product)
+    to_dict = Product.to_dict
+    is_low_stock = Product.is_low_stock
+    is_out_of_stock = Product.is_out_of_stock
+
+
+class OrderRecord(Record):
+    __slots__ = columns(Order) + ('items',)
+    to_dict = Order.to_dict
+
+
+class OrderItemRecord(Record):
+    __slots__ = columns(OrderItem)
+    to_dict = OrderItem.to_dict
+
+
+class CartItemRecord(Record):
+    __slots__ = columns(CartItem) + ('product',)
+    to_dict = CartItem.to_dict
+
+
+def add_to_index(index, key, record_id):
+    index.setdefault(key, {})[record_id] = None
+
+
+def remove_from_index(index, key, record_id):
+    members = index.get(key)
+    if members is not None:
+        members.pop(record_id, None)
+        if not members:
+            del index[key]
+
+
+def money(value):
+    """Round as a Numeric(10, 2) column would"""
+    return Decimal(value).quantize(CENTS) if value is not None else None
+
+
+def matches_search(product, search):
+    search = search.lower()
+    return any(search in (value or '').lower() for value in (product.name, product.description, product.category))
+
+
+def price_filter(min_price, max_price):
+    return lambda product: (min_price is None or product.price >= min_price) and \
+        (max_price is None or product.price <= max_price)
+
+
+class MemoryStorage(Storage):
+    """Thread-safe, indexed storage in process memory; nothing is persisted"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.users = {}
+        self.users_by_username = {}
+        self.users_by_email = {}
+        self.products = {}
+        self.products_by_sku = {}
+        self.products_by_category = {}
+        self.orders = {}
+        self.orders_by_number = {}
+        self.orders_by_status = {}
+        self.orders_by_customer = {}
+        self.order_counts = {}
+        self.cart = {}  # user id -> {product id: CartItemRecord}
+
+    # Users
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def get_user_by_username(self, username):
+        with self.lock:
+            return self.users.get(self.users_by_username.get(username))
+
+    def get_user_by_email(self, email):
+        with self.lock:
+            return self.users.get(self.users_by_email.get(email))
+
+    def create_user(self, username, email, password_hash, first_name, last_name, role='customer'):
+        with self.lock:
+            if username in self.users_by_username or email in self.users_by_email:
+                raise ValueError('Username or email already exists')
+            user = UserRecord(
+                id=new_id(),
+                username=username,
+                email=email,
+                password_hash=password_hash,
+                first_name=first_name,
+                last_name=last_name,
+                role=role,
+                created_at=datetime.utcnow()
+            )
+            self.users[user.id] = user
+            self.users_by_username[username] = user.id
+            self.users_by_email[email] = user.id
+            return user
+
+    # Products
+
+    def put_product(self, product, previous=None):
+        """Store a product record and move it between index entries; call under the lock"""
+        if previous is not None:
+            if previous.sku != product.sku:
+                self.products_by_sku.pop(previous.sku, None)
+            if previous.category != product.category:
+                remove_from_index(self.products_by_category, previous.category, product.id)
+        self.products[product.id] = product
+        self.products_by_sku[product.sku] = product.id
+        add_to_index(self.products_by_category, product.category, product.id)
+        if previous is None or any(getattr(previous, column) != getattr(product, column) for column in SUGGEST_COLUMNS):
+            suggest_index.put(product)
+        return product
+
+    def candidates(self, category=None):
+        """Products to filter, narrowed by the category index"""
+        with self.lock:
+            if category is None:
+                return list(self.products.values())
+            return [self.products[product_id] for product_id in self.products_by_category.get(category, ())]
+
+    def list_products(self, args):
+        params = listing_params(args)
+        in_price = price_filter(params['min_price'], params['max_price'])
+        rows = [
+            product for product in self.candidates(params['category'])
+            if product.is_active
+            and (params['search'] is None or matches_search(product, params['search']))
+            and (not params['in_stock'] or product.stock_quantity > 0)
+            and in_price(product)
+        ]
+
+        limit = params['limit']
+        if params['sort'] is not None:
+            column, descending, _ = SORTS[params['sort']]
+            position = lambda product: (getattr(product, column.key), product.id)
+            rows.sort(key=position, reverse=descending)
+            if params['after'] is not None:
+                after = params['after']
+                rows = [row for row in rows if (position(row) < after if descending else position(row) > after)]
+            if limit is not None:
+                rows = rows[:limit + 1]
+
+        rows, next_cursor = paginate(rows, args, limit)
+        return [product.to_dict() for product in rows], next_cursor
+
+    def product_facets(self, args, ttl_seconds=30):
+        params = listing_params(args)
+        products = [
+            product for product in self.candidates()
+            if product.is_active and (params['search'] is None or matches_search(product, params['search']))
+        ]
+
+        # Each facet is counted with every filter except its own, as in services/facets.py
+        filters = {}
+        if params['category'] is not None:
+            filters['category'] = lambda product: product.category == params['category']
+        if params['in_stock']:
+            filters['availability'] = lambda product: product.stock_quantity > 0
+        if params['min_price'] is not None or params['max_price'] is not None:
+            filters['priceBand'] = price_filter(params['min_price'], params['max_price'])
+
+        counts = {facet: {} for facet in FACETS}
+        for product in products:
+            failed = [facet for facet, test in filters.items() if not test(product)]
+            if len(failed) > 1:
+                continue
+            for facet, value in facet_values(*(getattr(product, column) for column in FACET_COLUMNS)):
+                if not failed or failed == [facet]:
+                    counts[facet][value] = counts[facet].get(value, 0) + 1
+        return as_response(counts)
+
+    def get_product(self, product_id):
+        return self.products.get(product_id)
+
+    def get_product_by_sku(self, sku):
+        with self.lock:
+            return self.products.get(self.products_by_sku.get(sku))
+
+    def create_product(self, fields):
+        now = datetime.utcnow()
+        fields = dict(fields, id=new_id(), is_active=True, created_at=now, updated_at=now, version=1)
+        fields['price'] = money(fields['price'])
+        fields['original_price'] = money(fields.get('original_price'))
+        fields['rating'] = Decimal(fields.get('rating') or 0).quantize(Decimal('0.1'))
+        fields.setdefault('stock_quantity', 0)
+        with self.lock:
+            if fields['sku'] in self.products_by_sku:
+                raise ValueError('SKU already exists')
+            return self.put_product(ProductRecord(**fields))
+
+    def current(self, records, record):
+        """The stored version of a record a request loaded; VersionConflict if it has moved on"""
+        stored = records.get(record.id)
+        if stored is None or stored.version != record.version:
+            raise VersionConflict(stored or record)
+        return stored
+
+    def update_product(self, product, changes, expected_version=None):
+        check_version(product, expected_version)
+        changes = dict(changes)
+        for name in ('price', 'original_price'):
+            if name in changes:
+                changes[name] = money(changes[name])
+        with self.lock:
+            stored = self.current(self.products, product)
+            if 'sku' in changes and changes['sku'] != stored.sku and changes['sku'] in self.products_by_sku:
+                raise ValueError('SKU already exists')
+            return self.put_product(
+                stored.replace(**changes, updated_at=datetime.utcnow(), version=stored.version + 1),
+                previous=stored
+            )
+
+    def update_stock(self, product, quantity, expected_version=None):
+        return self.update_product(product, {'stock_quantity': quantity}, expected_version)
+
+    def low_stock_products(self, threshold=10):
+        return [product for product in self.candidates() if product.is_active and product.stock_quantity <= threshold]
+
+    def low_stock_count(self, threshold=10):
+        return len(self.low_stock_products(threshold))
+
+    def active_products(self):
+        return [product for product in self.candidates() if product.is_active]
+
+    # Orders
+
+    def order_metrics(self):
+        with self.lock:
+            revenue = sum((order.total_amount for order in self.orders.values()), Decimal('0'))
+            return {
+                'totalOrders': len(self.orders),
+                'totalRevenue': revenue,
+                'pendingOrders': len(self.orders_by_status.get('pending', ())),
+                'completedOrders': len(self.orders_by_status.get('delivered', ()))
+            }
+
+    def put_order(self, order, previous=None):
+        """Store an order record and move it between index entries; call under the lock"""
+        if previous is not None and previous.status != order.status:
+            remove_from_index(self.orders_by_status, previous.status, order.id)
+        self.orders[order.id] = order
+        self.orders_by_number[order.order_number] = order.id
+        add_to_index(self.orders_by_status, order.status, order.id)
+        add_to_index(self.orders_by_customer, order.customer_id, order.id)
+        return order
+
+    def list_orders(self, customer_id=None, status=None, include_archived=False):
+        with self.lock:
+            if customer_id and status:
+                by_status = self.orders_by_status.get(status, {})
+                ids = [order_id for order_id in self.orders_by_customer.get(customer_id, ()) if order_id in by_status]
+            elif customer_id:
+                ids = list(self.orders_by_customer.get(customer_id, ()))
+            elif status:
+                ids = list(self.orders_by_status.get(status, ()))
+            else:
+                ids = list(self.orders)
+            orders = [self.orders[order_id] for order_id in ids]
+        orders.sort(key=lambda order: order.created_at, reverse=True)
+        return [order.to_dict() for order in orders]
+
+    def get_order(self, order_id, include_archived=False):
+        return self.orders.get(order_id)
+
+    def get_order_by_number(self, order_number):
+        with self.lock:
+            return self.orders.get(self.orders_by_number.get(order_number))
+
+    def next_order_number(self, now):
+        """ORD-<date>-<n>, numbered per day as Order.generate_order_number does; call under the lock"""
+        date_str = now.strftime('%Y%m%d')
+        self.order_counts[date_str] = self.order_counts.get(date_str, 0) + 1
+        return f"ORD-{date_str}-{str(self.order_counts[date_str]).zfill(3)}"
+
+    def change_stock(self, product_id, delta, now):
+        """Add delta to a product's stock; returns the (old, new) record; call under the lock"""
+        product = self.products[product_id]
+        return product, self.put_product(
+            product.replace(stock_quantity=product.stock_quantity + delta, updated_at=now, version=product.version + 1),
+            previous=product
+        )
+
+    def create_order(self, customer, lines, total_amount, shipping_address, status='pending', clear_cart=False):
+        totals = {}
+        for line in lines:
+            totals[line['product'].id] = totals.get(line['product'].id, 0) + line['quantity']
+
+        now = datetime.utcnow()
+        with self.lock:
+            # All or nothing, like the SQL reservation
+            for product_id, quantity in totals.items():
+                product = self.products.get(product_id)
+                if product is None or not product.is_active or product.stock_quantity < quantity:
+                    raise InsufficientStock(product_id)
+            levels = {}
+            for product_id, quantity in totals.items():
+                _, product = self.change_stock(product_id, -quantity, now)
+                levels[product_id] = StockLevel(product.id, product.sku, product.stock_quantity)
+
+            order_id = new_id()
+            order = OrderRecord(
+                id=order_id,
+                order_number=self.next_order_number(now),
+                customer_id=customer.id,
+                customer_name=f"{customer.first_name} {customer.last_name}",
+                customer_email=customer.email,
+                status=status,
+                total_amount=money(total_amount),
+                shipping_address=shipping_address,
+                created_at=now,
+                updated_at=now,
+                version=1,
+                items=tuple(
+                    OrderItemRecord(
+                        id=new_id(),
+                        order_id=order_id,
+                        product_id=line['product'].id,
+                        product_name=line['product'].name,
+                        product_sku=line['product'].sku,
+                        quantity=line['quantity'],
+                        unit_price=money(line['unit_price']),
+                        total_price=money(line['total_price'])
+                    )
+                    for line in lines
+                )
+            )
+            self.put_order(order)
+            if clear_cart:
+                self.cart.pop(customer.id, None)
+        return order, [levels[line['product'].id] for line in lines]
+
+    def update_order_status(self, order, status, expected_version=None):
+        check_version(order, expected_version)
+        if status == order.status:
+            return order
+        check_transition(order, status)
+        if status == 'cancelled':
+            # The same path as POST /cancel, so the stock comes back too
+            with self.lock:
+                self.current(self.orders, order)
+                outcome, levels = self.cancel_order(order)
+            check_cancelled(order, outcome)
+            publish_stock_levels(levels)
+            return self.orders[order.id]
+        with self.lock:
+            stored = self.current(self.orders, order)
+            return self.put_order(
+                stored.replace(status=status, updated_at=datetime.utcnow(), version=stored.version + 1),
+                previous=stored
+            )
+
+    def restock(self, order, now):
+        """Put an order's quantities back; returns the StockLevels; call under the lock"""
+        levels = []
+        for item in order.items:
+            if item.product_id in self.products:
+                _, product = self.change_stock(item.product_id, item.quantity, now)
+                levels.append(StockLevel(product.id, product.sku, product.stock_quantity))
+        return levels
+
+    def transition_orders(self, order_ids, status, chunk_size=1000):
+        cancelling = status == 'cancelled'
+        now = datetime.utcnow()
+        results = []
+        updated = []
+        levels = []
+        with self.lock:
+            for order_id in unique(order_ids):
+                order = self.orders.get(order_id)
+                if order is None:
+                    results.append({'orderId': order_id, 'outcome': 'not_found'})
+                    continue
+                source = order.status
+                if source == status:
+                    results.append({'orderId': order_id, 'outcome': 'unchanged', 'from': source})
+                elif not Order.can_transition(source, status):
+                    results.append({'orderId': order_id, 'outcome': 'invalid_transition', 'from': source})
+                else:
+                    self.put_order(order.replace(status=status, updated_at=now, version=order.version + 1), previous=order)
+                    result = {'orderId': order_id, 'outcome': 'updated', 'from': source}
+                    if cancelling:
+                        result['restocked'] = source in RESTOCKED
+                        if result['restocked']:
+                            levels.extend(self.restock(order, now))
+                    results.append(result)
+                    updated.append(order_id)
+
+        if updated:
+            ORDER_STATUS_CHANGES.labels(status).inc(len(updated))
+            if cancelling:
+                ORDERS_CANCELLED.inc(len(updated))
+            broker.publish('order.bulk_cancelled' if cancelling else 'order.bulk_status_changed', {
+                'orderIds': updated,
+                'status': status,
+                'count': len(updated),
+                'updatedAt': now.isoformat()
+            })
+        publish_stock_levels(levels)
+        return results
+
+    def cancel_order(self, order):
+        now = datetime.utcnow()
+        with self.lock:
+            stored = self.orders.get(order.id)
+            if stored is None:
+                return {'orderId': order.id, 'outcome': 'not_found'}, []
+            if stored.status == 'cancelled':
+                return {'orderId': order.id, 'outcome': 'unchanged', 'from': stored.status}, []
+            if not Order.can_transition(stored.status, 'cancelled'):
+                return {'orderId': order.id, 'outcome': 'invalid_transition', 'from': stored.status}, []
+            self.put_order(stored.replace(status='cancelled', updated_at=now, version=stored.version + 1), previous=stored)
+            restocked = stored.status in RESTOCKED
+            levels = self.restock(stored, now) if restocked else []
+
+        ORDERS_CANCELLED.inc()
+        ORDER_STATUS_CHANGES.labels('cancelled').inc()
+        return {'orderId': order.id, 'outcome': 'updated', 'from': stored.status, 'restocked': restocked}, levels
+
+    # Cart
+
+    def with_product(self, item):
+        return item.replace(product=self.products.get(item.product_id)) if item is not None else None
+
+    def cart_items(self, user_id):
+        with self.lock:
+            items = [self.with_product(item) for item in self.cart.get(user_id, {}).values()]
+        return [item.to_dict() for item in items]
+
+    def get_cart_item(self, user_id, product_id):
+        with self.lock:
+            return self.with_product(self.cart.get(user_id, {}).get(product_id))
+
+    def add_to_cart(self, user_id, product_id, quantity):
+        with self.lock:
+            lines = self.cart.setdefault(user_id, {})
+            item = lines.get(product_id)
+            if item is not None:
+                lines[product_id] = item.replace(quantity=item.quantity + quantity)
+            else:
+                lines[product_id] = CartItemRecord(
+                    id=new_id(),
+                    user_id=user_id,
+                    product_id=product_id,
+                    quantity=quantity,
+                    created_at=datetime.utcnow()
+                )
+            return self.with_product(lines[product_id]), item is None
+
+    def update_cart_quantity(self, item, quantity):
+        with self.lock:
+            lines = self.cart.get(item.user_id, {})
+            stored = lines.get(item.product_id)
+            if stored is None:
+                raise LookupError('Cart item not found')
+            lines[item.product_id] = stored.replace(quantity=quantity)
+            return self.with_product(lines[item.product_id])
+
+    def remove_from_cart(self, item):
+        with self.lock:
+            lines = self.cart.get(item.user_id, {})
+            lines.pop(item.product_id, None)
+            if not lines:
+                self.cart.pop(item.user_id, None)
+
+    def clear_cart(self, user_id):
+        with self.lock:
+            self.cart.pop(user_id, None)
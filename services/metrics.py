@@ -0,0 +1,148 @@
+"""
+Prometheus metrics for requests, the database and business events
+
+Set PROMETHEUS_MULTIPROC_DIR to a writable, empty directory before the
+workers start to aggregate metrics across pre-forked processes. With
+gunicorn, also call mark_process_dead(worker.pid) from its child_exit hook.
+"""
+import os
+import time
+from flask import Blueprint, Response, request, g
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from services.dbpool import pool_monitor
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route',
+    ['blueprint', 'endpoint', 'method'], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Requests by route and status',
+    ['blueprint', 'endpoint', 'method', 'status']
+)
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests currently being handled',
+    ['blueprint'], multiprocess_mode='livesum'
+)
+
+POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection', buckets=DB_BUCKETS
+)
+POOL_SIZE = Gauge('db_pool_size', 'Configured connection pool size', multiprocess_mode='livemax')
+POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections currently checked out', multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections opened beyond the pool size', multiprocess_mode='livesum')
+QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Query latency by statement type', ['operation'], buckets=DB_BUCKETS
+)
+
+ORDERS_CREATED = Counter('orders_created_total', 'Orders successfully created')
+ORDER_STATUS_CHANGES = Counter('order_status_changes_total', 'Order status transitions', ['status'])
+ORDERS_CANCELLED = Counter('orders_cancelled_total', 'Orders cancelled')
+STOCK_OUT_REJECTIONS = Counter('stock_out_rejections_total', 'Order attempts rejected for insufficient stock')
+CARTS_COMPACTED = Counter('carts_compacted_total', 'Idle carts removed by compaction')
+CART_ROWS_COMPACTED = Counter('cart_rows_compacted_total', 'Cart item rows removed by compaction')
+STOCK_RESERVATIONS = Counter('stock_reservations_total', 'Checkout stock reservations by outcome', ['outcome'])
+STOCK_BATCH_SIZE = Histogram(
+    'stock_reservation_batch_size', 'Reservations applied per group commit',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+STOCK_BATCH_WAIT = Histogram(
+    'stock_reservation_wait_seconds', 'Time a reservation waited for its batch to be applied', buckets=DB_BUCKETS
+)
+STOCK_BATCH_WINDOW = Gauge(
+    'stock_reservation_window_seconds', 'Configured collection window for stock reservations', multiprocess_mode='livemax'
+)
+
+STATEMENT_TYPES = {'SELECT', 'INSERT', 'UPDATE', 'DELETE'}
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose metrics in the Prometheus text format"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges in multiprocess mode"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def statement_type(statement):
+    """First keyword of a SQL statement, bucketed to keep label cardinality low"""
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return keyword if keyword in STATEMENT_TYPES else 'OTHER'
+
+
+def before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_blueprint = request.blueprint or 'app'
+    IN_FLIGHT.labels(g.metrics_blueprint).inc()
+
+
+def after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def teardown_request(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    blueprint = g.pop('metrics_blueprint')
+    endpoint = request.endpoint or 'unmatched'
+    IN_FLIGHT.labels(blueprint).dec()
+    REQUEST_LATENCY.labels(blueprint, endpoint, request.method).observe(time.perf_counter() - start)
+    REQUESTS.labels(blueprint, endpoint, request.method, str(g.pop('metrics_status', 500))).inc()
+
+
+def instrument_engine(engine):
+    """Attach query timing and pool gauges to an engine"""
+    # The start time lives on the execution context, which is dropped with
+    # the statement even when it raises and after_cursor_execute never runs
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'metrics_query_start', None)
+        if start is not None:
+            QUERY_LATENCY.labels(statement_type(statement)).observe(time.perf_counter() - start)
+
+    pool = engine.pool
+
+    def update_pool_gauges(*args):
+        if hasattr(pool, 'checkedout'):
+            POOL_SIZE.set(pool.size())
+            POOL_CHECKED_OUT.set(pool.checkedout())
+            POOL_OVERFLOW.set(max(0, pool.overflow()))
+
+    event.listen(pool, 'checkout', update_pool_gauges)
+    event.listen(pool, 'checkin', update_pool_gauges)
+
+
+def init_app(app, db):
+    """Register request hooks, engine instrumentation and the /metrics route"""
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    app.register_blueprint(metrics_bp)
+
+    with app.app_context():
+        instrument_engine(db.engine)
+
+    if POOL_WAIT.observe not in pool_monitor.listeners:
+        pool_monitor.listeners.append(POOL_WAIT.observe)
@@ -0,0 +1,201 @@
+from datetime import datetime
+from sqlalchemy import update, select, func
+from app import db
+from models.order import Order, OrderItem
+from models.product import Product
+from services.events import broker, publish_stock_levels
+from services.metrics import ORDER_STATUS_CHANGES, ORDERS_CANCELLED
+from services.sales import record_cancellations
+from services.recommendations import record_pair_cancellations
+from services.facets import record_stock_changes
+
+CANCELLABLE = [status for status in Order.STATUSES if Order.can_transition(status, 'cancelled')]
+# Cancelling a shipped order does not restock it: the goods have left the warehouse
+RESTOCKED = ['pending', 'processing']
+
+def unique(order_ids):
+    seen = set()
+    return [order_id for order_id in order_ids if not (order_id in seen or seen.add(order_id))]
+
+def bulk_transition(order_ids, status, chunk_size=1000):
+    """Move many orders to a new status with one UPDATE per source status per chunk
+
+    Returns one outcome per requested id: updated, unchanged, not_found,
+    invalid_transition, or conflict when the order changed underneath us.
+    """
+    results = []
+    unique_ids = unique(order_ids)
+    
+    for offset in range(0, len(unique_ids), chunk_size):
+        chunk = unique_ids[offset:offset + chunk_size]
+        results.extend(transition_chunk(chunk, status))
+    
+    return results
+
+def transition_chunk(order_ids, status):
+    """Apply one chunk of a bulk transition in a single transaction"""
+    current = dict(db.session.query(Order.id, Order.status).filter(Order.id.in_(order_ids)).all())
+    
+    outcomes = {}
+    by_source = {}
+    for order_id in order_ids:
+        source = current.get(order_id)
+        if source is None:
+            outcomes[order_id] = {'orderId': order_id, 'outcome': 'not_found'}
+        elif source == status:
+            outcomes[order_id] = {'orderId': order_id, 'outcome': 'unchanged', 'from': source}
+        elif not Order.can_transition(source, status):
+            outcomes[order_id] = {'orderId': order_id, 'outcome': 'invalid_transition', 'from': source}
+        else:
+            by_source.setdefault(source, []).append(order_id)
+    
+    now = datetime.utcnow()
+    updated_ids = []
+    for source, ids in by_source.items():
+        # Guard on the source status so concurrent changes are not overwritten
+        statement = update(Order).where(Order.id.in_(ids), Order.status == source) \
+            .values(status=status, updated_at=now, version=Order.version + 1) \
+            .execution_options(synchronize_session=False)
+        
+        if db.engine.dialect.update_returning:
+            changed = set(db.session.execute(statement.returning(Order.id)).scalars())
+        else:
+            db.session.execute(statement)
+            changed = {order_id for order_id, in db.session.query(Order.id).filter(
+                Order.id.in_(ids), Order.status == status
+            )}
+        
+        for order_id in ids:
+            if order_id in changed:
+                outcomes[order_id] = {'orderId': order_id, 'outcome': 'updated', 'from': source}
+                updated_ids.append(order_id)
+            else:
+                outcomes[order_id] = {'orderId': order_id, 'outcome': 'conflict', 'from': source}
+    
+    db.session.commit()
+    
+    if updated_ids:
+        ORDER_STATUS_CHANGES.labels(status).inc(len(updated_ids))
+        broker.publish('order.bulk_status_changed', {
+            'orderIds': updated_ids,
+            'status': status,
+            'count': len(updated_ids),
+            'updatedAt': now.isoformat()
+        })
+    
+    return [outcomes[order_id] for order_id in order_ids]
+
+def cancel_orders(order_ids, chunk_size=1000):
+    """Cancel many orders, restoring stock with one grouped UPDATE per chunk
+
+    Returns one outcome per requested id, as bulk_transition does, with
+    restocked set on the cancelled ones.
+    """
+    results = []
+    unique_ids = unique(order_ids)
+    for offset in range(0, len(unique_ids), chunk_size):
+        chunk = unique_ids[offset:offset + chunk_size]
+        outcomes, stock = cancel_chunk(chunk)
+        cancelled = [result['orderId'] for result in outcomes if result['outcome'] == 'updated']
+        if cancelled:
+            broker.publish('order.bulk_cancelled', {
+                'orderIds': cancelled,
+                'status': 'cancelled',
+                'count': len(cancelled),
+                'updatedAt': datetime.utcnow().isoformat()
+            })
+        publish_stock_levels(stock)
+        results.extend(outcomes)
+    return results
+
+def restore_stock(order_ids, now):
+    """Add the quantities of the given orders back with one UPDATE; returns the changed products"""
+    items = OrderItem.__table__
+    products = Product.__table__
+    returned = select(items.c.product_id, func.sum(items.c.quantity).label('quantity')) \
+        .where(items.c.order_id.in_(order_ids)) \
+        .group_by(items.c.product_id)
+
+    # Read the per-product totals once so availability deltas can be derived
+    # from the new stock level (RETURNING cannot see the FROM subquery on SQLite)
+    quantities = dict(db.session.execute(returned).all())
+    if not quantities:
+        return []
+
+    returned = returned.subquery()
+    statement = update(products).where(products.c.id == returned.c.product_id) \
+        .values(stock_quantity=products.c.stock_quantity + returned.c.quantity, updated_at=now,
+                version=products.c.version + 1)
+    columns = (products.c.id, products.c.sku, products.c.stock_quantity, products.c.is_active)
+    if db.engine.dialect.update_returning:
+        rows = db.session.execute(statement.returning(*columns)).all()
+    else:
+        db.session.execute(statement)
+        rows = db.session.execute(select(*columns).where(products.c.id.in_(quantities))).all()
+
+    record_stock_changes([
+        (row.stock_quantity - quantities[row.id], row.stock_quantity)
+        for row in rows if row.is_active
+    ])
+    return rows
+
+def cancel_chunk(order_ids):
+    """Cancel one chunk in a single transaction: status, stock, sales counters and product pairs together
+
+    Returns (outcomes, restocked product rows).
+    """
+    current = {
+        row.id: row for row in db.session.execute(
+            select(Order.id, Order.status, Order.created_at).where(Order.id.in_(order_ids))
+        )
+    }
+
+    outcomes = {}
+    by_source = {}
+    for order_id in order_ids:
+        row = current.get(order_id)
+        if row is None:
+            outcomes[order_id] = {'orderId': order_id, 'outcome': 'not_found'}
+        elif row.status == 'cancelled':
+            outcomes[order_id] = {'orderId': order_id, 'outcome': 'unchanged', 'from': row.status}
+        elif row.status not in CANCELLABLE:
+            outcomes[order_id] = {'orderId': order_id, 'outcome': 'invalid_transition', 'from': row.status}
+        else:
+            by_source.setdefault(row.status, []).append(order_id)
+
+    now = datetime.utcnow()
+    cancelled = []
+    restock_ids = []
+    for source, ids in by_source.items():
+        statement = update(Order).where(Order.id.in_(ids), Order.status == source) \
+            .values(status='cancelled', updated_at=now, version=Order.version + 1) \
+            .execution_options(synchronize_session=False)
+
+        if db.engine.dialect.update_returning:
+            changed = set(db.session.execute(statement.returning(Order.id)).scalars())
+        else:
+            db.session.execute(statement)
+            changed = set(db.session.execute(select(Order.id).where(
+                Order.id.in_(ids), Order.status == 'cancelled', Order.updated_at == now
+            )).scalars())
+
+        for order_id in ids:
+            if order_id in changed:
+                outcomes[order_id] = {'orderId': order_id, 'outcome': 'updated', 'from': source, 'restocked': source in RESTOCKED}
+                cancelled.append(order_id)
+                if source in RESTOCKED:
+                    restock_ids.append(order_id)
+            else:
+                outcomes[order_id] = {'orderId': order_id, 'outcome': 'conflict', 'from': source}
+
+    stock = restore_stock(restock_ids, now) if restock_ids else []
+    if cancelled:
+        created = [(order_id, current[order_id].created_at) for order_id in cancelled]
+        record_cancellations(created)
+        record_pair_cancellations(created)
+    db.session.commit()
+
+    if cancelled:
+        ORDERS_CANCELLED.inc(len(cancelled))
+        ORDER_STATUS_CHANGES.labels('cancelled').inc(len(cancelled))
+    return [outcomes[order_id] for order_id in order_ids], stock
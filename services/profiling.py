@@ -0,0 +1,181 @@
+"""
+Sampling profiler for individual requests
+
+A single background thread walks the stacks of the request threads being
+profiled and counts collapsed stacks, the format flamegraph.pl and
+speedscope read. The thread sleeps while nothing is being profiled, so the
+only cost on unprofiled requests is a header lookup and a random draw.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import request, g
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+
+
+class StackSampler:
+    """Background thread that samples the stacks of registered threads"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id):
+        """Begin collecting samples for a thread"""
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._wakeup.set()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and return its stack counts"""
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                # Cleared together with the snapshot, so a start() after it
+                # sets the event again and the wait below returns at once
+                self._wakeup.clear()
+                targets = list(self._targets.items())
+            if not targets:
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, counts in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    counts[collapse(frame)] += 1
+            time.sleep(self.interval)
+
+
+def collapse(frame):
+    """Render a frame's stack root-first in collapsed flamegraph format"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class RequestProfiler:
+    """Profiles sampled or explicitly requested requests to a local directory"""
+
+    def __init__(self):
+        self.sampler = StackSampler()
+        self.sample_rate = 0.0
+        self.header = 'X-Profile'
+        self.directory = 'profiles'
+        self.max_files = 200
+
+    def init_app(self, app):
+        """Install request hooks using the profiling settings in the app config"""
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.header = app.config.get('PROFILE_HEADER', self.header)
+        self.directory = app.config.get('PROFILE_DIR', self.directory)
+        self.max_files = app.config.get('PROFILE_MAX_FILES', self.max_files)
+        self.sampler.interval = app.config.get('PROFILE_INTERVAL_SECONDS', self.sampler.interval)
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['request_profiler'] = self
+
+    def requested_by_admin(self):
+        """Only admins may force profiling with the header"""
+        from services.storage import storage
+        try:
+            verify_jwt_in_request(optional=True, locations=['headers'])
+            user_id = get_jwt_identity()
+        except Exception:
+            return False
+        user = storage.get_user(user_id) if user_id else None
+        return bool(user and user.role == 'admin')
+
+    def _before_request(self):
+        forced = self.header in request.headers
+        if not forced and (not self.sample_rate or random.random() >= self.sample_rate):
+            return None
+        if forced and not self.requested_by_admin():
+            return None
+
+        g.profile_thread = threading.get_ident()
+        g.profile_start = time.perf_counter()
+        self.sampler.start(g.profile_thread)
+        return None
+
+    def _teardown_request(self, exc):
+        thread_id = g.pop('profile_thread', None)
+        if thread_id is None:
+            return
+        counts = self.sampler.stop(thread_id)
+        duration_ms = (time.perf_counter() - g.pop('profile_start')) * 1000
+        try:
+            self.write(request.endpoint or 'unmatched', duration_ms, counts)
+        except OSError:
+            pass
+
+    def write(self, endpoint, duration_ms, counts):
+        """Save a profile as <timestamp>_<endpoint>_<duration>ms.folded"""
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        name = f"{timestamp}_{endpoint.replace('.', '-')}_{int(duration_ms)}ms.folded"
+        with open(os.path.join(self.directory, name), 'w') as f:
+            for stack, count in counts.most_common():
+                f.write(f'{stack} {count}\n')
+        self.prune()
+        return name
+
+    def prune(self):
+        """Keep only the newest max_files profiles"""
+        names = sorted(self.list_names())
+        for name in names[:-self.max_files] if len(names) > self.max_files else []:
+            os.remove(os.path.join(self.directory, name))
+
+    def list_names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory) if PROFILE_NAME.match(name)]
+
+    def list_profiles(self, endpoint=None, limit=50):
+        """Describe the most recent profiles, newest first"""
+        profiles = []
+        for name in sorted(self.list_names(), reverse=True):
+            timestamp, route, duration = PROFILE_NAME.match(name).groups()
+            route = route.replace('-', '.')
+            if endpoint and route != endpoint:
+                continue
+            profiles.append({
+                'name': name,
+                'endpoint': route,
+                'durationMs': int(duration),
+                'createdAt': datetime.strptime(timestamp, '%Y%m%dT%H%M%S%f').isoformat(),
+                'sizeBytes': os.path.getsize(os.path.join(self.directory, name))
+            })
+            if len(profiles) >= limit:
+                break
+        return profiles
+
+    def path_for(self, name):
+        """Resolve a profile name to a path, refusing anything unexpected"""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+PROFILE_NAME = re.compile(r'^(\d{8}T\d{12})_([\w-]+)_(\d+)ms\.folded$')
+
+profiler = RequestProfiler()
@@ -0,0 +1,198 @@
+"""
+Per-request SQL accounting
+
+Counts statements and database time for every request, flags statements
+repeated with different parameters (the N+1 signature), logs slow queries
+with their plan, and keeps per-route snapshots. Tests can wrap requests in
+capture_queries() and assert on the result.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import request, g, has_app_context, has_request_context, current_app
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """Statements and time spent in the database for one unit of work"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.executions = set()
+
+    def record(self, statement, duration, parameters=None):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+        self.executions.add((statement, repr(parameters)))
+
+    def repeated(self, threshold=2):
+        """Statements executed with at least threshold different parameter sets
+
+        Running the same statement again with the same parameters is a
+        redundant query, not a loop over rows, so it is not counted.
+        """
+        variants = Counter(statement for statement, _ in self.executions)
+        return {statement: count for statement, count in variants.items() if count >= threshold}
+
+
+class RouteSnapshots:
+    """Rolling per-endpoint query counts"""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, stats):
+        with self._lock:
+            route = self._routes.setdefault(endpoint, {
+                'requests': 0, 'lastCount': 0, 'maxCount': 0, 'totalCount': 0, 'maxTimeMs': 0.0
+            })
+            route['requests'] += 1
+            route['lastCount'] = stats.count
+            route['maxCount'] = max(route['maxCount'], stats.count)
+            route['totalCount'] += stats.count
+            route['maxTimeMs'] = max(route['maxTimeMs'], round(stats.duration * 1000, 2))
+
+    def snapshot(self):
+        """Copy of the current per-endpoint figures"""
+        with self._lock:
+            return {endpoint: dict(route) for endpoint, route in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+snapshots = RouteSnapshots()
+_captures = []
+_captures_lock = threading.Lock()
+
+
+@contextmanager
+def capture_queries():
+    """Collect every statement executed inside the block
+
+        with capture_queries() as stats:
+            client.get('/api/orders')
+        assert stats.count <= 3
+    """
+    stats = QueryStats()
+    with _captures_lock:
+        _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        with _captures_lock:
+            _captures.remove(stats)
+
+
+def explain(conn, statement, parameters):
+    """Fetch the plan for a statement through the raw DBAPI cursor
+
+    The statement's own transaction is still open, so the EXPLAIN runs
+    inside a savepoint: if it fails, only the savepoint is rolled back
+    instead of the transaction being left aborted for the request.
+    """
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute('SAVEPOINT querystats_explain')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        except Exception:
+            cursor.execute('ROLLBACK TO SAVEPOINT querystats_explain')
+            raise
+        finally:
+            cursor.execute('RELEASE SAVEPOINT querystats_explain')
+    finally:
+        cursor.close()
+
+
+def instrument_engine(engine):
+    """Attach statement accounting to an engine"""
+    # Timed on the execution context, as in services/metrics.py, so a
+    # statement that raises leaves nothing behind on the connection
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        context.querystats_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'querystats_start', None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+
+        if _captures:
+            with _captures_lock:
+                for stats in _captures:
+                    stats.record(statement, duration, parameters)
+
+        if not has_app_context():
+            return
+
+        stats = g.get('query_stats')
+        if stats is not None:
+            stats.record(statement, duration, parameters)
+
+        slow_threshold = current_app.config.get('SLOW_QUERY_SECONDS')
+        if slow_threshold is not None and duration >= slow_threshold:
+            plan = None
+            if not executemany and statement.lstrip().upper().startswith('SELECT'):
+                try:
+                    plan = explain(conn, statement, parameters)
+                except Exception as e:
+                    plan = f'unavailable: {e}'
+            logger.warning(
+                'Slow query (%.1fms) on %s: %s params=%r\nplan:\n%s',
+                duration * 1000, request.endpoint if has_request_context() else None,
+                statement, parameters, plan
+            )
+
+
+def before_request():
+    g.query_stats = QueryStats()
+
+
+def after_request(response):
+    stats = g.get('query_stats')
+    if stats is not None and current_app.config.get('QUERY_STATS_HEADERS'):
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time-Ms'] = f'{stats.duration * 1000:.2f}'
+    return response
+
+
+def teardown_request(exc):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return
+
+    endpoint = request.endpoint or 'unmatched'
+    snapshots.record(endpoint, stats)
+
+    config = current_app.config
+    threshold = config.get('N_PLUS_ONE_THRESHOLD', 5)
+    for statement, count in stats.repeated(threshold).items():
+        logger.warning('Possible N+1 on %s: statement ran with %d different parameters: %s', endpoint, count, statement)
+
+    budget = config.get('QUERY_BUDGETS', {}).get(endpoint)
+    if budget is not None and stats.count > budget:
+        logger.warning('Query budget exceeded on %s: %d statements (budget %d)', endpoint, stats.count, budget)
+
+
+def init_app(app, db):
+    """Register request hooks and instrument the app's engine"""
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+
+    with app.app_context():
+        instrument_engine(db.engine)
@@ -0,0 +1,179 @@
+import itertools
+import math
+import threading
+import time
+from flask import request, jsonify, g
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from services.dbpool import pool_monitor
+
+
+class MemoryStore:
+    """Per-process token buckets kept in a dict, least recently used first"""
+
+    # Buckets looked at per request once the store is over max_keys
+    PRUNE_STEP = 8
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, cost=1):
+        """Take tokens from a bucket, returning (allowed, retry_after)"""
+        now = time.monotonic()
+        with self._lock:
+            # Re-inserting moves the bucket to the end of the dict
+            tokens, updated, _ = self._buckets.pop(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0
+            else:
+                allowed, retry_after = False, (cost - tokens) / rate
+            # The bucket is indistinguishable from a new one once it has refilled
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+
+        return allowed, retry_after
+
+    def _prune(self, now):
+        """Drop refilled buckets among the least recently used few"""
+        for key in list(itertools.islice(self._buckets, self.PRUNE_STEP)):
+            bucket = self._buckets.pop(key)
+            if bucket[2] > now:
+                # Still refilling at its own rate; look at it again after the others
+                self._buckets[key] = bucket
+
+
+class RedisStore:
+    """Token buckets shared between workers through Redis"""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def consume(self, key, rate, burst, cost=1):
+        """Take tokens from a bucket, returning (allowed, retry_after)"""
+        allowed, tokens = self._script(keys=[f'ratelimit:{key}'], args=[rate, burst, cost, time.time()])
+        if allowed:
+            return True, 0
+        return False, (cost - float(tokens)) / rate
+
+
+class RateLimiter:
+    """Token bucket and concurrency admission control for every request"""
+
+    def __init__(self):
+        self.store = None
+        self.limits = {}
+        self.exempt = set()
+        self.pool_wait_limit = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Install request hooks and pick a bucket store from the app config"""
+        self.limits = app.config.get('RATE_LIMITS', {})
+        self.exempt = set(app.config.get('RATE_LIMIT_EXEMPT', []))
+        self.pool_wait_limit = app.config.get('DB_POOL_WAIT_SHED_SECONDS')
+
+        storage_url = app.config.get('RATE_LIMIT_STORAGE_URL', 'memory://')
+        if storage_url.startswith('redis'):
+            self.store = RedisStore(storage_url)
+        else:
+            self.store = MemoryStore()
+
+        if app.config.get('RATE_LIMIT_ENABLED', True):
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+        app.extensions['rate_limiter'] = self
+
+    def budget_for(self, endpoint, blueprint):
+        """Find the most specific budget: endpoint, then blueprint, then default"""
+        for scope in (endpoint, blueprint, 'default'):
+            if scope and scope in self.limits:
+                return scope, self.limits[scope]
+        return None, None
+
+    def client_key(self):
+        """Identify the caller by JWT identity, falling back to remote address"""
+        try:
+            verify_jwt_in_request(optional=True, locations=['headers'])
+            identity = get_jwt_identity()
+            if identity:
+                return f'user:{identity}'
+        except Exception:
+            pass
+        return f'ip:{request.remote_addr}'
+
+    def _reject(self, status, message, retry_after):
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _before_request(self):
+        endpoint = request.endpoint
+        if not endpoint or endpoint in self.exempt or request.method == 'OPTIONS':
+            return None
+
+        if self.pool_wait_limit and pool_monitor.recent_wait() > self.pool_wait_limit:
+            return self._reject(503, 'Server busy, please retry', self.pool_wait_limit)
+
+        scope, budget = self.budget_for(endpoint, request.blueprint)
+        if not budget:
+            return None
+
+        key = f'{scope}:{self.client_key()}'
+
+        if 'rate' in budget:
+            allowed, retry_after = self.store.consume(key, budget['rate'], budget.get('burst', budget['rate']))
+            if not allowed:
+                return self._reject(429, 'Too many requests', retry_after)
+
+        concurrency = budget.get('concurrency')
+        if concurrency:
+            with self._lock:
+                if self._in_flight.get(key, 0) >= concurrency:
+                    return self._reject(429, 'Too many concurrent requests', 1)
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            g.rate_limit_slot = key
+
+        return None
+
+    def _teardown_request(self, exc):
+        key = g.pop('rate_limit_slot', None)
+        if key is None:
+            return
+        with self._lock:
+            remaining = self._in_flight.get(key, 1) - 1
+            if remaining > 0:
+                self._in_flight[key] = remaining
+            else:
+                self._in_flight.pop(key, None)
+
+
+limiter = RateLimiter()
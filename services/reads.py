@@ -0,0 +1,99 @@
+"""
+Read-only Core query layer for the hot list endpoints
+
+GET /api/products, GET /api/orders and GET /api/cart/<user_id> only
+serialise what they load. Going through the ORM builds identity-mapped
+instances with change tracking for every row, just to throw them away
+after to_dict. These reads select plain table columns instead and hand
+the Row tuples straight to the models' to_dict functions. Those only
+read attributes, which a Row exposes by column name, so the JSON is
+identical.
+
+Fixed-shape statements are built once at import. Their SQL compiles
+once and is then served from the engine's compiled cache; the
+per-request filters only change bound parameters.
+"""
+from sqlalchemy import select, bindparam
+from app import db
+from models.product import Product
+from models.order import Order, OrderItem
+from models.cart import CartItem
+from models.archive import ArchivedOrder, ArchivedOrderItem
+from services.catalog import listing_statement, paginate
+
+products = Product.__table__
+cart_items = CartItem.__table__
+
+# (orders table, items table) for the hot and archived order history
+ORDER_TABLES = [
+    (Order.__table__, OrderItem.__table__),
+    (ArchivedOrder.__table__, ArchivedOrderItem.__table__)
+]
+
+CART_WITH_PRODUCTS = select(
+    *cart_items.c,
+    *(column.label(f'product__{column.name}') for column in products.c)
+).outerjoin(products, products.c.id == cart_items.c.product_id).where(cart_items.c.user_id == bindparam('user_id'))
+
+
+class Prefixed:
+    """Attribute view of the columns of a Row that carry a prefix"""
+    __slots__ = ('row', 'prefix')
+
+    def __init__(self, row, prefix):
+        self.row = row
+        self.prefix = prefix
+
+    def __getattr__(self, name):
+        return getattr(self.row, self.prefix + name)
+
+
+def execute(statement, parameters=None):
+    """Run on the request's connection, so reads see its transaction"""
+    return db.session.connection().execute(statement, parameters or {})
+
+
+def product_list(args):
+    """Product dicts and next cursor for the listing parameters; raises ValueError"""
+    statement, limit = listing_statement(args, columns=products.c)
+    rows, next_cursor = paginate(execute(statement).all(), args, limit)
+    return [Product.to_dict(row) for row in rows], next_cursor
+
+
+def order_list(customer_id=None, status=None, include_archived=False):
+    """Order dicts with their items, newest first"""
+    result = []
+    for orders, items in (ORDER_TABLES if include_archived else ORDER_TABLES[:1]):
+        criteria = []
+        if customer_id:
+            criteria.append(orders.c.customer_id == customer_id)
+        if status:
+            criteria.append(orders.c.status == status)
+        rows = execute(select(*orders.c).where(*criteria).order_by(orders.c.created_at.desc())).all()
+        if not rows:
+            continue
+
+        # Items for the same filter through a join, so there is no id list to bind
+        items_by_order = {}
+        for item in execute(select(*items.c).join(orders, orders.c.id == items.c.order_id).where(*criteria)):
+            items_by_order.setdefault(item.order_id, []).append(OrderItem.to_dict(item))
+
+        for row in rows:
+            order = Order.to_dict(row, include_items=False)
+            order['items'] = items_by_order.get(row.id, [])
+            result.append((row.created_at, order))
+
+    if include_archived:
+        result.sort(key=lambda entry: entry[0], reverse=True)
+    return [order for _, order in result]
+
+
+def cart_list(user_id):
+    """Cart item dicts with their products, in one joined query"""
+    result = []
+    for row in execute(CART_WITH_PRODUCTS, {'user_id': user_id}):
+        item = CartItem.to_dict(row, include_product=False)
+        if row.product__id is not None:
+            item['product'] = Product.to_dict(Prefixed(row, 'product__'))
+        result.append(item)
+    return result
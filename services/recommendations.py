@@ -0,0 +1,218 @@
+"""
+Frequently bought together
+
+product_pairs is the sparse product x product co-occurrence matrix
+(X^T X over the order x product incidence matrix), stored in COO form
+and computed by the database with a self-join of order_items on
+order_id. product_recommendations keeps only the top-N neighbours per
+product so a product page or a whole cart resolves in one indexed
+lookup.
+
+A full build recomputes everything from hot and archived order items.
+Incremental refreshes fold in orders created since the stored
+watermark, then re-rank only the products whose pairs changed.
+Cancelled orders are left out of both, and cancelling an order that was
+already folded in takes its pairs back out.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete, insert, func, union_all, and_
+from app import db
+from services.counters import add_to_counters
+from models.order import Order, OrderItem
+from models.archive import ArchivedOrder, ArchivedOrderItem
+from models.product import Product
+from models.cart import CartItem
+from models.recommendation import ProductPair, ProductRecommendation, RecommendationState
+
+logger = logging.getLogger(__name__)
+
+
+def pair_counts(items):
+    """Co-occurrence counts from a selectable of (order_id, product_id) rows"""
+    left = items.alias('left_items')
+    right = items.alias('right_items')
+    return select(
+        left.c.product_id,
+        right.c.product_id.label('related_id'),
+        func.count(func.distinct(left.c.order_id)).label('order_count')
+    ).join(right, and_(
+        right.c.order_id == left.c.order_id,
+        right.c.product_id != left.c.product_id
+    )).group_by(left.c.product_id, right.c.product_id)
+
+
+def rerank(product_ids, top_n):
+    """Rebuild the top-N rows for the given products (all products if None)"""
+    pairs = ProductPair.__table__
+    ranked = select(
+        pairs.c.product_id,
+        func.row_number().over(
+            partition_by=pairs.c.product_id,
+            order_by=(pairs.c.order_count.desc(), pairs.c.related_id)
+        ).label('rank'),
+        pairs.c.related_id,
+        pairs.c.order_count
+    )
+    recommendations = ProductRecommendation.__table__
+    if product_ids is None:
+        db.session.execute(delete(recommendations))
+    else:
+        ranked = ranked.where(pairs.c.product_id.in_(product_ids))
+        db.session.execute(delete(recommendations).where(recommendations.c.product_id.in_(product_ids)))
+    ranked = ranked.subquery()
+    db.session.execute(insert(recommendations).from_select(
+        ['product_id', 'rank', 'related_id', 'order_count'],
+        select(ranked).where(ranked.c.rank <= top_n)
+    ))
+
+
+def save_watermark(processed_until):
+    state = db.session.get(RecommendationState, 1)
+    if state is None:
+        state = RecommendationState(id=1)
+        db.session.add(state)
+    state.processed_until = processed_until
+    state.updated_at = datetime.utcnow()
+
+
+def build_full(top_n, lag_seconds=60):
+    """Recompute the co-occurrence matrix and rankings from every order"""
+    until = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    items = union_all(
+        select(OrderItem.order_id, OrderItem.product_id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.created_at < until, Order.status != 'cancelled'),
+        select(ArchivedOrderItem.order_id, ArchivedOrderItem.product_id)
+        .join(ArchivedOrder, ArchivedOrder.id == ArchivedOrderItem.order_id)
+        .where(ArchivedOrder.status != 'cancelled')
+    ).subquery()
+
+    db.session.execute(delete(ProductPair.__table__))
+    db.session.execute(insert(ProductPair.__table__).from_select(
+        ['product_id', 'related_id', 'order_count'], pair_counts(items)
+    ))
+    rerank(None, top_n)
+    save_watermark(until)
+    db.session.commit()
+    return db.session.query(func.count(ProductPair.product_id)).scalar()
+
+
+def refresh(top_n, lag_seconds=60, batch_size=1000):
+    """Fold orders created since the watermark into the matrix
+
+    Orders younger than lag_seconds are left for the next run so rows
+    still being committed are not skipped.
+    """
+    state = db.session.get(RecommendationState, 1)
+    if state is None:
+        return build_full(top_n, lag_seconds)
+
+    until = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    if until <= state.processed_until:
+        db.session.rollback()
+        return 0
+
+    items = select(OrderItem.order_id, OrderItem.product_id).join(Order, Order.id == OrderItem.order_id).where(
+        Order.created_at >= state.processed_until,
+        Order.created_at < until,
+        Order.status != 'cancelled'
+    ).subquery()
+    deltas = db.session.execute(pair_counts(items)).all()
+
+    add_to_counters(ProductPair.__table__, ['product_id', 'related_id'], ['order_count'], [
+        {'product_id': product_id, 'related_id': related_id, 'order_count': order_count}
+        for product_id, related_id, order_count in deltas
+    ])
+
+    rerank_changed(deltas, top_n, batch_size)
+    save_watermark(until)
+    db.session.commit()
+    return len(deltas)
+
+
+def rerank_changed(deltas, top_n, batch_size=1000):
+    """Re-rank the products named in (product_id, related_id, count) deltas, a batch at a time"""
+    changed = sorted({product_id for product_id, _, _ in deltas})
+    for start in range(0, len(changed), batch_size):
+        rerank(changed[start:start + batch_size], top_n)
+
+
+def record_pair_cancellations(orders):
+    """Subtract cancelled (order_id, created_at) pairs from the matrix in the caller's transaction
+
+    Only orders created before the watermark were folded in; refresh skips
+    the later ones now that they are cancelled.
+    """
+    state = db.session.get(RecommendationState, 1)
+    if state is None:
+        return
+    folded = [order_id for order_id, created_at in orders if created_at < state.processed_until]
+    if not folded:
+        return
+
+    items = select(OrderItem.order_id, OrderItem.product_id).where(OrderItem.order_id.in_(folded)).subquery()
+    deltas = db.session.execute(pair_counts(items)).all()
+    if not deltas:
+        return
+
+    pairs = ProductPair.__table__
+    add_to_counters(pairs, ['product_id', 'related_id'], ['order_count'], [
+        {'product_id': product_id, 'related_id': related_id, 'order_count': -order_count}
+        for product_id, related_id, order_count in deltas
+    ])
+    # Pairs no remaining order shares are dropped before ranking
+    changed = sorted({product_id for product_id, _, _ in deltas})
+    for start in range(0, len(changed), 1000):
+        db.session.execute(delete(pairs).where(
+            pairs.c.product_id.in_(changed[start:start + 1000]), pairs.c.order_count <= 0
+        ))
+    rerank_changed(deltas, current_app.config['RECOMMENDATIONS_TOP_N'])
+
+
+def recommended_products(criteria, limit):
+    """Active related products with their summed co-purchase counts"""
+    recommendations = ProductRecommendation.__table__
+    score = func.sum(recommendations.c.order_count).label('score')
+    rows = db.session.query(Product, score).join(
+        recommendations, recommendations.c.related_id == Product.id
+    ).filter(Product.is_active == True, *criteria).group_by(Product.id).order_by(score.desc(), Product.id).limit(limit).all()
+    return [dict(product.to_dict(), boughtTogether=int(score)) for product, score in rows]
+
+
+def for_product(product_id, limit):
+    return recommended_products([ProductRecommendation.__table__.c.product_id == product_id], limit)
+
+
+def for_cart(user_id, limit):
+    """Neighbours of everything in the cart, excluding what is already in it"""
+    in_cart = select(CartItem.product_id).where(CartItem.user_id == user_id)
+    return recommended_products([
+        ProductRecommendation.__table__.c.product_id.in_(in_cart),
+        Product.id.not_in(in_cart)
+    ], limit)
+
+
+def start_recommender(app):
+    """Run refresh periodically in a daemon thread"""
+    interval = app.config['RECOMMENDATIONS_REFRESH_SECONDS']
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    pairs = refresh(app.config['RECOMMENDATIONS_TOP_N'], app.config['RECOMMENDATIONS_LAG_SECONDS'])
+                    if pairs:
+                        logger.info('Folded %d product pair updates into recommendations', pairs)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Recommendation refresh failed')
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='recommender', daemon=True)
+    thread.start()
+    return stop
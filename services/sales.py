@@ -0,0 +1,195 @@
+"""
+Product and category sales counters
+
+Order creation adds each line's units and revenue to an hourly bucket
+for its product and its category; cancellation subtracts them from the
+bucket of the original order, so windows stay exact. The 24h/7d/30d
+windows are sums over the trailing buckets, and old buckets simply age
+out (and are pruned) as time moves on.
+
+Rankings are served from per-process heaps rebuilt from the counters at
+most every TOP_SELLERS_REFRESH_SECONDS, so the storefront rails never
+aggregate order_items.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import select, delete, func
+from app import db
+from services.counters import add_to_counters
+from models.order import Order, OrderItem
+from models.product import Product
+from models.sales import SalesCounter
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30)
+}
+RETENTION = max(WINDOWS.values()) + timedelta(hours=1)
+
+
+def bucket_for(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def upsert_counters(rows):
+    """Add units and revenue to counter rows, creating missing ones"""
+    add_to_counters(SalesCounter.__table__, ['scope', 'key', 'bucket'], ['units', 'revenue'], rows)
+
+
+def sales_rows(lines, created_at, sign=1):
+    """Counter deltas for (product_id, category, quantity, total_price) lines"""
+    bucket = bucket_for(created_at)
+    totals = {}
+    for product_id, category, quantity, total_price in lines:
+        for key in (('product', product_id), ('category', category)):
+            units, revenue = totals.get(key, (0, Decimal('0')))
+            totals[key] = (units + sign * quantity, revenue + sign * Decimal(total_price))
+    return [
+        {'scope': scope, 'key': key, 'bucket': bucket, 'units': units, 'revenue': revenue}
+        for (scope, key), (units, revenue) in sorted(totals.items())
+    ]
+
+
+def record_sale(order, lines):
+    """Count a new order; runs in the order's transaction"""
+    upsert_counters(sales_rows(lines, order.created_at or datetime.utcnow()))
+
+
+def record_cancellation(order):
+    """Take a cancelled order back out of the bucket it was counted in"""
+    record_cancellations([(order.id, order.created_at)])
+
+
+def record_cancellations(orders):
+    """Set-based record_cancellation for (order_id, created_at) pairs"""
+    created = {order_id: created_at for order_id, created_at in orders if created_at >= datetime.utcnow() - RETENTION}
+    if not created:
+        return
+    lines_by_order = {}
+    for order_id, *line in db.session.execute(
+        select(OrderItem.order_id, OrderItem.product_id, Product.category, OrderItem.quantity, OrderItem.total_price)
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id.in_(created))
+    ):
+        lines_by_order.setdefault(order_id, []).append(line)
+
+    totals = {}
+    for order_id, lines in lines_by_order.items():
+        for row in sales_rows(lines, created[order_id], sign=-1):
+            key = (row['scope'], row['key'], row['bucket'])
+            units, revenue = totals.get(key, (0, Decimal('0')))
+            totals[key] = (units + row['units'], revenue + row['revenue'])
+    upsert_counters([
+        {'scope': scope, 'key': key, 'bucket': bucket, 'units': units, 'revenue': revenue}
+        for (scope, key, bucket), (units, revenue) in sorted(totals.items())
+    ])
+
+
+def prune_counters(now=None):
+    """Drop buckets older than the largest window"""
+    cutoff = bucket_for((now or datetime.utcnow()) - RETENTION)
+    result = db.session.execute(delete(SalesCounter.__table__).where(SalesCounter.bucket < cutoff))
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_counters(now=None):
+    """Recompute all counters from order_items, e.g. after a restore or on first deploy"""
+    now = now or datetime.utcnow()
+    lines = db.session.execute(
+        select(Order.created_at, OrderItem.product_id, Product.category, OrderItem.quantity, OrderItem.total_price)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(Order.created_at >= now - RETENTION, Order.status != 'cancelled')
+        .execution_options(yield_per=1000)
+    )
+    totals = {}
+    for created_at, product_id, category, quantity, total_price in lines:
+        for row in sales_rows([(product_id, category, quantity, total_price)], created_at):
+            key = (row['scope'], row['key'], row['bucket'])
+            units, revenue = totals.get(key, (0, Decimal('0')))
+            totals[key] = (units + row['units'], revenue + row['revenue'])
+
+    db.session.execute(delete(SalesCounter.__table__))
+    rows = [
+        {'scope': scope, 'key': key, 'bucket': bucket, 'units': units, 'revenue': revenue}
+        for (scope, key, bucket), (units, revenue) in totals.items()
+    ]
+    if rows:
+        db.session.execute(SalesCounter.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+class TopSellers:
+    """Per-process top-k rankings per window, rebuilt from the counters"""
+
+    def __init__(self):
+        self.rankings = {}
+        self.lock = threading.Lock()
+
+    def window_totals(self, scope, since):
+        return db.session.execute(
+            select(SalesCounter.key, func.sum(SalesCounter.units), func.sum(SalesCounter.revenue))
+            .where(SalesCounter.scope == scope, SalesCounter.bucket >= since)
+            .group_by(SalesCounter.key)
+        ).all()
+
+    def build(self, window, max_k):
+        since = bucket_for(datetime.utcnow() - WINDOWS[window])
+        product_totals = {key: (units, revenue) for key, units, revenue in self.window_totals('product', since) if units > 0}
+        products = Product.query.filter(Product.id.in_(product_totals), Product.is_active == True).all() if product_totals else []
+
+        overall = []
+        by_category = {}
+        for product in products:
+            units, revenue = product_totals[product.id]
+            entry = (units, revenue, product.id, product.to_dict())
+            overall.append(entry)
+            by_category.setdefault(product.category, []).append(entry)
+
+        categories = [(units, revenue, key) for key, units, revenue in self.window_totals('category', since) if units > 0]
+        return {
+            'products': heapq.nlargest(max_k, overall),
+            'byCategory': {category: heapq.nlargest(max_k, entries) for category, entries in by_category.items()},
+            'categories': heapq.nlargest(max_k, categories),
+            'builtAt': time.monotonic()
+        }
+
+    def ranking(self, window, refresh_seconds, max_k):
+        ranking = self.rankings.get(window)
+        if ranking is None or time.monotonic() - ranking['builtAt'] >= refresh_seconds:
+            with self.lock:
+                ranking = self.rankings.get(window)
+                if ranking is None or time.monotonic() - ranking['builtAt'] >= refresh_seconds:
+                    ranking = self.rankings[window] = self.build(window, max_k)
+        return ranking
+
+    def top_products(self, window, limit, category=None, refresh_seconds=60, max_k=100):
+        ranking = self.ranking(window, refresh_seconds, max_k)
+        entries = ranking['byCategory'].get(category, []) if category else ranking['products']
+        return [
+            dict(product, unitsSold=int(units), revenue=str(revenue))
+            for units, revenue, _, product in entries[:limit]
+        ]
+
+    def top_categories(self, window, limit, refresh_seconds=60, max_k=100):
+        ranking = self.ranking(window, refresh_seconds, max_k)
+        return [
+            {'category': key, 'unitsSold': int(units), 'revenue': str(revenue)}
+            for units, revenue, key in ranking['categories'][:limit]
+        ]
+
+    def clear(self):
+        with self.lock:
+            self.rankings.clear()
+
+
+top_sellers = TopSellers()
@@ -0,0 +1,358 @@
+"""
+Group commit for checkout stock decrements
+
+During flash sales thousands of checkouts decrement the same few
+product rows. Done in each request's own transaction, they queue on
+that row's lock one commit at a time, so a hot SKU tops out at about
+one checkout per commit latency.
+
+create_order hands its lines to stock_reserver and waits instead. One
+flusher thread per process collects reservations for up to
+STOCK_RESERVATION_WINDOW_MS, or until STOCK_RESERVATION_MAX_BATCH are
+queued, and applies each SKU's as a single conditional UPDATE:
+
+    UPDATE products SET stock_quantity = stock_quantity - :total
+    WHERE id = :id AND is_active AND stock_quantity >= :total
+
+with every SKU of the batch in one transaction. When the total does
+not fit, the row is read under lock and reservations are admitted in
+arrival order while they fit. Each waiting request is then told
+whether its quantity was granted.
+
+Reservations commit before the order does; create_order releases them
+if the order cannot be written after all. A checkout that dies in
+between cannot, so each grant also writes a stock_holds row in the
+flush transaction, which the order's own transaction deletes. Holds
+older than STOCK_HOLD_LEAK_SECONDS were leaked, and `flask
+reconcile-stock` puts their stock back.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, update, select, insert, delete
+from sqlalchemy.pool import NullPool
+from app import db
+from models.product import Product
+from models.reservation import StockHold
+from services.facets import record_stock_changes, facet_index
+from services.metrics import STOCK_RESERVATIONS, STOCK_BATCH_SIZE, STOCK_BATCH_WAIT, STOCK_BATCH_WINDOW
+from services.tracing import tracer
+
+products = Product.__table__
+stock_holds = StockHold.__table__
+
+# Stock left after a reservation or release, for inventory events
+StockLevel = namedtuple('StockLevel', ['id', 'sku', 'stock_quantity'])
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f'Insufficient stock for product {product_id}')
+        self.product_id = product_id
+
+
+class Reservation:
+    """One order line waiting for its batch"""
+    __slots__ = ('product_id', 'quantity', 'hold', 'queued_at', 'done', 'granted', 'error', 'level', 'abandoned', 'span')
+
+    def __init__(self, product_id, quantity, hold=None):
+        self.product_id = product_id
+        self.quantity = quantity
+        # The checkout's hold id, journalled with the grant
+        self.hold = hold
+        self.queued_at = time.monotonic()
+        # The requesting span, under which the flush is reported
+        self.span = tracer.current_span()
+        self.done = threading.Event()
+        self.granted = False
+        self.error = None
+        self.level = None
+        self.abandoned = False
+
+
+def change_stock(connection, product_id, delta, now):
+    """Add delta to a product's stock unless that would go negative; returns (sku, stock, is_active) or None"""
+    statement = update(products).where(products.c.id == product_id) \
+        .values(stock_quantity=products.c.stock_quantity + delta, version=products.c.version + 1, updated_at=now)
+    if delta < 0:
+        statement = statement.where(products.c.is_active == True, products.c.stock_quantity >= -delta)
+    columns = (products.c.sku, products.c.stock_quantity, products.c.is_active)
+    if connection.dialect.update_returning:
+        return connection.execute(statement.returning(*columns)).first()
+    if connection.execute(statement).rowcount == 0:
+        return None
+    return connection.execute(select(*columns).where(products.c.id == product_id)).first()
+
+
+class StockReserver:
+    """Per-process aggregator that applies concurrent reservations per SKU in one transaction"""
+
+    def __init__(self):
+        self.app = None
+        self.window = 0.002
+        self.max_batch = 256
+        self.timeout = 5.0
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.pending = []
+        self.pid = None
+        self.engine = None
+
+    def init_app(self, app):
+        self.app = app
+        self.window = app.config['STOCK_RESERVATION_WINDOW_MS'] / 1000
+        self.max_batch = app.config['STOCK_RESERVATION_MAX_BATCH']
+        self.timeout = app.config['STOCK_RESERVATION_TIMEOUT_SECONDS']
+        STOCK_BATCH_WINDOW.set(self.window)
+
+    def ensure_flusher(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.pending = []
+            threading.Thread(target=self.run, name='stock-reserver', daemon=True).start()
+
+    def reserve(self, lines, hold=None):
+        """Reserve (product_id, quantity) lines all or nothing; returns the StockLevel after each
+
+        Grants are journalled under hold until the caller deletes them with
+        its order, or releases them. Raises InsufficientStock for the first
+        line that was not granted, after putting back any that were.
+        """
+        reservations = [Reservation(product_id, quantity, hold) for product_id, quantity in lines]
+        with self.ready:
+            self.ensure_flusher()
+            self.pending.extend(reservations)
+            self.ready.notify()
+
+        deadline = time.monotonic() + self.timeout
+        for reservation in reservations:
+            if not reservation.done.wait(max(deadline - time.monotonic(), 0)):
+                self.abandon(reservations)
+                raise TimeoutError('Timed out waiting for a stock reservation')
+
+        granted = [reservation for reservation in reservations if reservation.granted]
+        refused = next((reservation for reservation in reservations if not reservation.granted), None)
+        if refused is not None:
+            self.release([(reservation.product_id, reservation.quantity) for reservation in granted], holds=[hold])
+            if refused.error is not None:
+                raise refused.error
+            raise InsufficientStock(refused.product_id)
+        return [reservation.level for reservation in reservations]
+
+    def abandon(self, reservations):
+        """Give up on reservations; the flusher puts back any it grants later"""
+        granted = []
+        with self.lock:
+            for reservation in reservations:
+                if reservation.done.is_set():
+                    if reservation.granted:
+                        granted.append((reservation.product_id, reservation.quantity))
+                else:
+                    reservation.abandoned = True
+                    if reservation in self.pending:
+                        self.pending.remove(reservation)
+        self.release(granted, holds={reservation.hold for reservation in reservations})
+
+    def release(self, lines, connection=None, holds=()):
+        """Put reserved quantities back and drop their holds, e.g. when the order could not be written; returns the StockLevels"""
+        totals = {}
+        for product_id, quantity in lines:
+            totals[product_id] = totals.get(product_id, 0) + quantity
+        if not totals:
+            return []
+
+        if connection is None:
+            with db.engine.connect() as connection:
+                return self.release(lines, connection, holds)
+
+        holds = [hold for hold in holds if hold is not None]
+        with connection.begin():
+            if holds:
+                connection.execute(delete(stock_holds).where(stock_holds.c.hold_id.in_(holds)))
+            levels, changed = self.restock(connection, totals)
+        if changed:
+            facet_index.stale = True
+        return levels
+
+    def restock(self, connection, totals):
+        """Add {product_id: quantity} back in the caller's transaction; returns (StockLevels, facet counts changed)"""
+        levels = []
+        changes = []
+        now = datetime.utcnow()
+        for product_id in sorted(totals):
+            row = change_stock(connection, product_id, totals[product_id], now)
+            if row is not None:
+                levels.append(StockLevel(product_id, row.sku, row.stock_quantity))
+                if row.is_active:
+                    changes.append((row.stock_quantity - totals[product_id], row.stock_quantity))
+        return levels, record_stock_changes(changes, session=connection)
+
+    def reconcile(self, older_than_seconds):
+        """Put back the stock of holds older than older_than_seconds, whose checkouts died before their order committed
+
+        Returns (holds, units) put back. The hold rows are locked and
+        deleted first, so a late order commit either wins and keeps its
+        stock, or finds its holds gone after they were put back.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+        with db.engine.connect() as connection:
+            with connection.begin():
+                rows = connection.execute(
+                    select(stock_holds.c.id, stock_holds.c.hold_id, stock_holds.c.product_id, stock_holds.c.quantity)
+                    .where(stock_holds.c.created_at < cutoff)
+                    .with_for_update()
+                ).all()
+                if not rows:
+                    return 0, 0
+                connection.execute(delete(stock_holds).where(stock_holds.c.id.in_([row.id for row in rows])))
+                totals = {}
+                for row in rows:
+                    totals[row.product_id] = totals.get(row.product_id, 0) + row.quantity
+                _, changed = self.restock(connection, totals)
+        if changed:
+            facet_index.stale = True
+        return len({row.hold_id for row in rows}), sum(totals.values())
+
+    def connect(self):
+        """A connection outside the shared pool, which the requests waiting on the flusher may hold entirely"""
+        url = db.engine.url
+        if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+            return db.engine.connect()
+        if self.engine is None:
+            self.engine = create_engine(url, poolclass=NullPool)
+        return self.engine.connect()
+
+    def run(self):
+        with self.app.app_context():
+            connection = None
+            while True:
+                with self.ready:
+                    while not self.pending:
+                        self.ready.wait()
+                    # Hold the batch open for the window so concurrent checkouts can join it
+                    deadline = self.pending[0].queued_at + self.window
+                    while self.pending and len(self.pending) < self.max_batch:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.ready.wait(remaining)
+                    batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+                if not batch:
+                    continue
+                if connection is None:
+                    try:
+                        connection = self.connect()
+                    except Exception as e:
+                        self.fail(batch, e)
+                        continue
+                if not self.flush(batch, connection):
+                    # Reconnect for the next batch in case the connection broke
+                    connection.close()
+                    connection = None
+
+    def fail(self, batch, error):
+        for reservation in batch:
+            reservation.granted = False
+            reservation.error = error
+        self.complete(batch)
+
+    def flush(self, batch, connection):
+        """Apply a batch in one transaction and wake its requests; returns False if it failed"""
+        started = time.monotonic()
+        started_ns = time.time_ns()
+        STOCK_BATCH_SIZE.observe(len(batch))
+        for reservation in batch:
+            STOCK_BATCH_WAIT.observe(started - reservation.queued_at)
+
+        by_product = {}
+        for reservation in batch:
+            by_product.setdefault(reservation.product_id, []).append(reservation)
+
+        try:
+            now = datetime.utcnow()
+            changes = []
+            with connection.begin():
+                # A fixed lock order keeps flushers in different processes from deadlocking
+                for product_id in sorted(by_product):
+                    change = self.apply(connection, product_id, by_product[product_id], now)
+                    if change is not None:
+                        changes.append(change)
+                self.journal(connection, batch, now)
+                changed = record_stock_changes(changes, session=connection)
+        except Exception as e:
+            self.trace(batch, started_ns, len(by_product), e)
+            self.fail(batch, e)
+            return False
+        if changed:
+            facet_index.stale = True
+        self.trace(batch, started_ns, len(by_product))
+        self.complete(batch, connection)
+        return True
+
+    def trace(self, batch, started_ns, product_count, error=None):
+        """Report the flush in the trace of every request that had a reservation in it"""
+        ended_ns = time.time_ns()
+        attributes = {'batch.size': len(batch), 'batch.products': product_count}
+        if error is not None:
+            attributes['error.type'] = type(error).__name__
+        for span in {reservation.span for reservation in batch}:
+            tracer.record('stock_reserver.flush', span, started_ns, ended_ns, **attributes)
+
+    def journal(self, connection, batch, now):
+        """Record the batch's grants as stock holds in the flush transaction"""
+        rows = [
+            {'hold_id': reservation.hold, 'product_id': reservation.product_id,
+             'quantity': reservation.quantity, 'created_at': now}
+            for reservation in batch if reservation.granted and reservation.hold is not None
+        ]
+        if rows:
+            connection.execute(insert(stock_holds), rows)
+
+    def apply(self, connection, product_id, reservations, now):
+        """One conditional UPDATE for a SKU's reservations; returns (old, new) stock if it changed"""
+        total = sum(reservation.quantity for reservation in reservations)
+        row = change_stock(connection, product_id, -total, now)
+        if row is None:
+            # Not enough for all of them: admit in arrival order while stock lasts
+            current = connection.execute(
+                select(products.c.stock_quantity, products.c.is_active)
+                .where(products.c.id == product_id)
+                .with_for_update()
+            ).first()
+            available = current.stock_quantity if current is not None and current.is_active else 0
+            admitted = []
+            for reservation in reservations:
+                if reservation.quantity <= available:
+                    admitted.append(reservation)
+                    available -= reservation.quantity
+            total = sum(reservation.quantity for reservation in admitted)
+            row = change_stock(connection, product_id, -total, now) if admitted else None
+            reservations = admitted if row is not None else []
+
+        level = StockLevel(product_id, row.sku, row.stock_quantity) if row is not None else None
+        for reservation in reservations:
+            reservation.granted = True
+            reservation.level = level
+        return (row.stock_quantity + total, row.stock_quantity) if row is not None else None
+
+    def complete(self, batch, connection=None):
+        """Wake the waiting requests, putting back grants nobody is waiting for any more"""
+        orphaned = []
+        with self.lock:
+            for reservation in batch:
+                STOCK_RESERVATIONS.labels('granted' if reservation.granted else 'refused').inc()
+                if reservation.abandoned and reservation.granted:
+                    orphaned.append(reservation)
+                reservation.done.set()
+        if orphaned:
+            try:
+                self.release([(reservation.product_id, reservation.quantity) for reservation in orphaned], connection,
+                             {reservation.hold for reservation in orphaned})
+            except Exception:
+                self.app.logger.exception('Could not put back %d abandoned stock reservations', len(orphaned))
+
+
+stock_reserver = StockReserver()
@@ -0,0 +1,518 @@
+"""
+Storage backends behind the core API
+
+The auth, product, order and cart blueprints load and save users,
+products, orders and cart items through `storage` instead of
+Model.query, in the manner of IStorage in server/storage.ts.
+STORAGE_BACKEND picks the implementation:
+
+  sql      SqlStorage: the SQLAlchemy models and the services built on
+           them (Core list reads, facet counts, group-committed stock
+           reservations, set-based cancellation, sales counters)
+  memory   MemoryStorage (services/memory_storage.py): indexed records in
+           process memory, so tests and load tests run without a
+           database server and measure only the application layer
+
+Both hand back objects with the model attributes and to_dict, and raise
+the same errors: ValueError for malformed listing parameters,
+VersionConflict when the expected version is stale, InsufficientStock
+when checkout cannot reserve a line.
+
+The order and low-stock figures of GET /api/analytics/metrics come from
+either backend. The other aggregates over order history stay on SQL:
+top sellers, recommendations, exports, archival and cart compaction.
+Their endpoints are wrapped in requires_history and answer 501 under a
+backend without it, rather than an empty 200 from the in-memory SQLite
+database the memory backend runs beside.
+"""
+from abc import ABC, abstractmethod
+from functools import wraps
+from flask import current_app, jsonify
+from werkzeug.local import LocalProxy
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models.user import User
+from models.product import Product
+from models.order import Order, OrderItem
+from models.cart import CartItem
+from models.reservation import StockHold
+from models.types import new_id
+from services.archival import find_order, archived_totals
+from services.cart_compaction import touch_cart
+from services.catalog import search_clause, parse_price
+from services.concurrency import VersionConflict, check_version, retry_on_conflict
+from services.events import publish_stock_levels
+from services.facets import product_facets
+from services.order_transitions import bulk_transition, cancel_orders, cancel_chunk
+from services.reads import product_list, order_list, cart_list
+from services.sales import record_sale
+from services.stock_reservations import stock_reserver
+from services.tracing import tracer
+
+BACKENDS = ['sql', 'memory']
+
+# Concurrent checkouts can count the same orders and pick the same order number
+ORDER_NUMBER_ATTEMPTS = 5
+
+
+def check_cancelled(order, outcome):
+    """Raise for a cancel_order outcome other than updated, as a single-order status change reports it"""
+    if outcome['outcome'] == 'invalid_transition':
+        raise ValueError(f"Cannot cancel a {outcome['from']} order")
+    if outcome['outcome'] != 'updated':
+        raise VersionConflict(order)
+
+
+def check_transition(order, status):
+    """Raise ValueError unless Order.TRANSITIONS allows the order to move to status"""
+    if not Order.can_transition(order.status, status):
+        raise ValueError(f'Cannot move a {order.status} order to {status}')
+
+
+class Storage(ABC):
+    """Operations the core routes need from a backend"""
+
+    # Whether the SQL-only order history aggregates (see the module docstring) see this backend's writes
+    has_history = False
+
+    def rollback(self):
+        """Discard the current request's unsaved changes"""
+
+    # Users
+
+    @abstractmethod
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_by_username(self, username):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_user(self, username, email, password_hash, first_name, last_name, role='customer'):
+        raise NotImplementedError
+
+    # Products
+
+    @abstractmethod
+    def list_products(self, args):
+        """Product dicts and next cursor for the listing parameters of GET /api/products"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def product_facets(self, args, ttl_seconds=30):
+        """Facet counts for the listing filters in args"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_product(self, product_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_product_by_sku(self, sku):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_product(self, fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_product(self, product, changes, expected_version=None):
+        """Apply attribute changes to a product loaded from this backend; returns the product"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_stock(self, product, quantity, expected_version=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def low_stock_products(self, threshold=10):
+        raise NotImplementedError
+
+    @abstractmethod
+    def low_stock_count(self, threshold=10):
+        raise NotImplementedError
+
+    @abstractmethod
+    def active_products(self):
+        """Every active product, for building in-process indexes"""
+        raise NotImplementedError
+
+    # Orders
+
+    @abstractmethod
+    def list_orders(self, customer_id=None, status=None, include_archived=False):
+        """Order dicts with their items, newest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_order(self, order_id, include_archived=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_order_by_number(self, order_number):
+        raise NotImplementedError
+
+    @abstractmethod
+    def order_metrics(self):
+        """Counts and revenue for GET /api/analytics/metrics: totalOrders, totalRevenue, pendingOrders, completedOrders"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_order(self, customer, lines, total_amount, shipping_address, status='pending', clear_cart=False):
+        """Reserve stock for the validated lines and write the order; returns (order, stock levels)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_order_status(self, order, status, expected_version=None):
+        """Move an order to a status Order.TRANSITIONS allows from its current one
+
+        Returns the order unchanged when it already has the status; raises
+        ValueError for any other move TRANSITIONS does not list.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def transition_orders(self, order_ids, status, chunk_size=1000):
+        """Move many orders to a status; returns one outcome per id (see services/order_transitions.py)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def cancel_order(self, order):
+        """Cancel one order and restock it; returns (outcome, stock levels)"""
+        raise NotImplementedError
+
+    # Cart
+
+    @abstractmethod
+    def cart_items(self, user_id):
+        """Cart item dicts with their products"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_cart_item(self, user_id, product_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_to_cart(self, user_id, product_id, quantity):
+        """Add quantity to the user's line for the product; returns (item, created)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_cart_quantity(self, item, quantity):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_from_cart(self, item):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear_cart(self, user_id):
+        raise NotImplementedError
+
+
+class SqlStorage(Storage):
+    """The SQLAlchemy models, through the request's session"""
+
+    has_history = True
+
+    def rollback(self):
+        db.session.rollback()
+
+    def get_user(self, user_id):
+        return db.session.get(User, user_id)
+
+    def get_user_by_username(self, username):
+        return User.query.filter_by(username=username).first()
+
+    def get_user_by_email(self, email):
+        return User.query.filter_by(email=email).first()
+
+    def create_user(self, username, email, password_hash, first_name, last_name, role='customer'):
+        user = User(
+            username=username,
+            email=email,
+            password_hash=password_hash,
+            first_name=first_name,
+            last_name=last_name,
+            role=role
+        )
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def list_products(self, args):
+        return product_list(args)
+
+    def product_facets(self, args, ttl_seconds=30):
+        # Search is the one filter without a bitmap, so resolve it to ids
+        search = args.get('search')
+        search_ids = None
+        if search:
+            search_ids = [product_id for product_id, in db.session.query(Product.id).filter(search_clause(search))]
+
+        return product_facets(
+            category=args.get('category') or None,
+            in_stock=args.get('inStock') == 'true',
+            search_ids=search_ids,
+            min_price=parse_price(args.get('minPrice'), 'minPrice'),
+            max_price=parse_price(args.get('maxPrice'), 'maxPrice'),
+            ttl_seconds=ttl_seconds
+        )
+
+    def get_product(self, product_id):
+        return db.session.get(Product, product_id)
+
+    def get_product_by_sku(self, sku):
+        return Product.query.filter_by(sku=sku).first()
+
+    def create_product(self, fields):
+        product = Product(**fields)
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def versioned_write(self, instance, expected_version, write):
+        """Run write(instance), which commits; returns the instance written
+
+        A conditional write fails with the conflict. An unconditional one
+        only lost to a concurrent version bump, such as a checkout's stock
+        decrement, so it is redone on a fresh load instead.
+        """
+        if expected_version is not None:
+            check_version(instance, expected_version)
+            write(instance)
+            return instance
+
+        model, instance_id = type(instance), instance.id
+
+        def attempt():
+            current = db.session.get(model, instance_id)
+            if current is None:
+                raise VersionConflict(instance)
+            write(current)
+            return current
+        return retry_on_conflict(attempt)
+
+    def update_product(self, product, changes, expected_version=None):
+        def write(product):
+            for name, value in changes.items():
+                setattr(product, name, value)
+            db.session.commit()
+        return self.versioned_write(product, expected_version, write)
+
+    def update_stock(self, product, quantity, expected_version=None):
+        return self.versioned_write(product, expected_version, lambda product: product.update_stock(quantity))
+
+    def low_stock_products(self, threshold=10):
+        return Product.query.filter(
+            Product.is_active == True,
+            Product.stock_quantity <= threshold
+        ).all()
+
+    def low_stock_count(self, threshold=10):
+        return Product.query.filter(
+            Product.is_active == True,
+            Product.stock_quantity <= threshold
+        ).count()
+
+    def active_products(self):
+        # Plain rows: the index builds read a few columns of every product
+        return db.session.execute(select(*Product.__table__.c).where(Product.is_active == True)).all()
+
+    def list_orders(self, customer_id=None, status=None, include_archived=False):
+        return order_list(customer_id=customer_id, status=status, include_archived=include_archived)
+
+    def get_order(self, order_id, include_archived=False):
+        if include_archived:
+            return find_order(order_id=order_id)
+        return db.session.get(Order, order_id)
+
+    def get_order_by_number(self, order_number):
+        return find_order(order_number=order_number)
+
+    def order_metrics(self):
+        total_orders = Order.query.count()
+        total_revenue = db.session.query(func.sum(Order.total_amount)).scalar() or 0
+        pending_orders = Order.query.filter_by(status='pending').count()
+        completed_orders = Order.query.filter_by(status='delivered').count()
+
+        # Archived orders are closed, so they only add to the totals
+        for status, (count, amount) in archived_totals().items():
+            total_orders += count
+            total_revenue += amount
+            if status == 'delivered':
+                completed_orders += count
+        return {
+            'totalOrders': total_orders,
+            'totalRevenue': total_revenue,
+            'pendingOrders': pending_orders,
+            'completedOrders': completed_orders
+        }
+
+    def create_order(self, customer, lines, total_amount, shipping_address, status='pending', clear_cart=False):
+        # Decrement stock through the per-SKU group commit; it is put back if the order fails below
+        reserved = [(line['product'].id, line['quantity']) for line in lines]
+        hold = new_id()
+        with tracer.span('checkout.reserve_stock', item_count=len(reserved)):
+            stock_levels = stock_reserver.reserve(reserved, hold)
+
+        try:
+            # The stock is the order's once this transaction commits. Writing
+            # first also opens the transaction on SQLite, whose driver would
+            # otherwise commit insert_order's savepoint on its own.
+            db.session.execute(delete(StockHold).where(StockHold.hold_id == hold))
+
+            with tracer.span('checkout.insert_order'):
+                order = self.insert_order(customer, status, total_amount, shipping_address)
+
+            with tracer.span('checkout.insert_items', item_count=len(lines)):
+                for line in lines:
+                    product = line['product']
+                    db.session.add(OrderItem(
+                        order_id=order.id,
+                        product_id=product.id,
+                        product_name=product.name,
+                        product_sku=product.sku,
+                        quantity=line['quantity'],
+                        unit_price=line['unit_price'],
+                        total_price=line['total_price']
+                    ))
+                db.session.flush()
+
+            with tracer.span('checkout.record_sales'):
+                record_sale(order, [
+                    (line['product'].id, line['product'].category, line['quantity'], line['total_price'])
+                    for line in lines
+                ])
+
+            if clear_cart:
+                with tracer.span('checkout.clear_cart'):
+                    CartItem.query.filter_by(user_id=customer.id).delete()
+
+            with tracer.span('checkout.commit'):
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            stock_reserver.release(reserved, holds=[hold])
+            raise
+        return order, stock_levels
+
+    def insert_order(self, customer, status, total_amount, shipping_address):
+        """Insert an order under the next order number, counting again if another checkout took it"""
+        for attempt in range(ORDER_NUMBER_ATTEMPTS):
+            with tracer.span('checkout.allocate_order_number'):
+                order_number = Order.generate_order_number()
+            order = Order(
+                order_number=order_number,
+                customer_id=customer.id,
+                customer_name=f"{customer.first_name} {customer.last_name}",
+                customer_email=customer.email,
+                status=status,
+                total_amount=total_amount,
+                shipping_address=shipping_address
+            )
+            try:
+                # A savepoint, so a taken number does not abort the checkout's transaction
+                with db.session.begin_nested():
+                    db.session.add(order)
+                    db.session.flush()  # Get order ID
+                return order
+            except IntegrityError:
+                if attempt == ORDER_NUMBER_ATTEMPTS - 1:
+                    raise
+
+    def update_order_status(self, order, status, expected_version=None):
+        check_version(order, expected_version)
+        if status == order.status:
+            return order
+        check_transition(order, status)
+        if status == 'cancelled':
+            # The same path as POST /cancel, so the stock comes back too
+            outcome, stock = self.cancel_order(order)
+            check_cancelled(order, outcome)
+            publish_stock_levels(stock)
+            return order
+        order.update_status(status)
+        return order
+
+    def transition_orders(self, order_ids, status, chunk_size=1000):
+        if status == 'cancelled':
+            # Cancelling also restores stock and takes the orders out of the sales counters
+            return cancel_orders(order_ids, chunk_size)
+        return bulk_transition(order_ids, status, chunk_size)
+
+    def cancel_order(self, order):
+        # Status, stock restore and sales counters change in one transaction
+        outcomes, stock = cancel_chunk([order.id])
+        return outcomes[0], stock
+
+    def cart_items(self, user_id):
+        return cart_list(user_id)
+
+    def get_cart_item(self, user_id, product_id):
+        return CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
+
+    def add_to_cart(self, user_id, product_id, quantity):
+        with tracer.span('cart.lookup_item'):
+            item = self.get_cart_item(user_id, product_id)
+
+        if item:
+            with tracer.span('cart.update_item'):
+                item.quantity += quantity
+                touch_cart(user_id)
+                db.session.commit()
+            return item, False
+
+        with tracer.span('cart.insert_item'):
+            item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
+            db.session.add(item)
+            touch_cart(user_id)
+            db.session.commit()
+        return item, True
+
+    def update_cart_quantity(self, item, quantity):
+        item.quantity = quantity
+        touch_cart(item.user_id)
+        db.session.commit()
+        return item
+
+    def remove_from_cart(self, item):
+        db.session.delete(item)
+        touch_cart(item.user_id)
+        db.session.commit()
+
+    def clear_cart(self, user_id):
+        CartItem.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+
+def init_app(app):
+    backend = app.config['STORAGE_BACKEND']
+    if backend == 'sql':
+        app.extensions['storage'] = SqlStorage()
+    elif backend == 'memory':
+        from services.memory_storage import MemoryStorage
+        app.extensions['storage'] = MemoryStorage()
+    else:
+        raise ValueError(f'STORAGE_BACKEND must be one of {", ".join(BACKENDS)}')
+
+
+# The current app's backend
+storage = LocalProxy(lambda: current_app.extensions['storage'])
+
+
+def requires_history(view):
+    """Answer 501 from a view over the SQL-only order history when the backend has none"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not storage.has_history:
+            backend = current_app.config['STORAGE_BACKEND']
+            return jsonify({'error': f'Not supported by the {backend} storage backend'}), 501
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,388 @@
+"""
+Typeahead suggestions for the storefront search box
+
+The search box asks for suggestions on every keystroke. Sending those
+through GET /api/products?search= would run the listing's triple ILIKE
+scan each time, so GET /api/products/suggest answers from a per-process
+prefix index instead.
+
+The index is one sorted list of (term, product id) pairs, where the
+terms are the lower-cased words of each active product's name, SKU and
+category. All terms starting with a prefix form one contiguous run,
+found with two bisects. A query matches a product when every query
+word is a prefix of one of its terms. Matches are ranked by
+popularity: units sold over the trailing 30 days according to the
+sales counters, then rating, then name.
+
+The index is built in the background when the app starts; until the
+first build finishes, suggestions are empty. ORM product writes are
+applied incrementally once their transaction commits, and the memory
+storage backend applies its own writes. Every SUGGEST_INDEX_TTL_SECONDS
+a background rebuild picks up writes from other processes and
+refreshes popularity, while requests keep using the current index.
+
+Short prefixes match a large share of the catalog, so ranking their
+matches on every keystroke would be slow. The best MAX_LIMIT matches of
+each single-word prefix are therefore kept once computed, and product
+writes update them in place instead of discarding them.
+
+An uncached query never looks at more than SCAN_LIMIT products. When
+its narrowest word's run is that short, the run is ranked. Otherwise
+every word is common, so the products are walked in rank order from
+the top until enough match. If neither finishes within its limit, the
+suggestions are the best of what both looked at; they become exact as
+the query grows more specific.
+"""
+import bisect
+import heapq
+import itertools
+import re
+import threading
+import time
+from datetime import datetime
+from operator import itemgetter
+from flask import current_app
+from sqlalchemy import event, inspect, select, func
+from app import db
+from models.product import Product
+from models.sales import SalesCounter
+from services.sales import WINDOWS, bucket_for
+
+WORD = re.compile(r'[^\W_]+')
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+POPULARITY_WINDOW = '30d'
+HEAD_CACHE_SIZE = 4096
+# Heads of prefixes up to this long are computed with the index rather than on first use
+WARM_PREFIX_LENGTH = 2
+# Products an uncached query looks at, in the narrowest run and in rank order each
+SCAN_LIMIT = 1000
+
+# Columns a suggestion shows or is found by
+SUGGEST_COLUMNS = ['id', 'name', 'sku', 'category', 'price', 'image_url', 'rating', 'is_active']
+
+
+def words(text):
+    return WORD.findall((text or '').lower())
+
+
+def product_terms(product):
+    return frozenset(words(product.name) + words(product.sku) + words(product.category))
+
+
+def suggestion(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'sku': product.sku,
+        'category': product.category,
+        'price': f'{product.price:.2f}',
+        'imageUrl': product.image_url
+    }
+
+
+class Entry:
+    """What the index keeps per product"""
+    __slots__ = ('terms', 'text', 'name', 'rating', 'suggestion')
+
+    def __init__(self, product):
+        self.terms = product_terms(product)
+        # ' ' + word is in text exactly when word is a prefix of a term
+        self.text = ''.join(' ' + term for term in self.terms)
+        self.name = product.name.lower()
+        self.rating = float(product.rating or 0)
+        self.suggestion = suggestion(product)
+
+
+def load_popularity():
+    """Units sold per product over the popularity window"""
+    since = bucket_for(datetime.utcnow() - WINDOWS[POPULARITY_WINDOW])
+    return {
+        key: int(units) for key, units in db.session.execute(
+            select(SalesCounter.key, func.sum(SalesCounter.units))
+            .where(SalesCounter.scope == 'product', SalesCounter.bucket >= since)
+            .group_by(SalesCounter.key)
+        ) if units > 0
+    }
+
+
+def ranking(entries, popularity):
+    """Sort key of a product id: most units sold, then best rated, then by name"""
+    def rank(product_id):
+        entry = entries[product_id]
+        return (-popularity.get(product_id, 0), -entry.rating, entry.name, product_id)
+    return rank
+
+
+class Head:
+    """Best-ranked matches of one single-word prefix; complete when it holds all of them"""
+    __slots__ = ('ranked', 'complete')
+
+    def __init__(self, ranked, complete):
+        self.ranked = ranked
+        self.complete = complete
+
+
+class SuggestIndex:
+    """Sorted (term, product id) array over active products, with popularity for ranking"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.terms = []
+        self.entries = {}
+        self.rank = ranking(self.entries, {})
+        # Each indexed product's rank, and all of them best first with their texts alongside
+        self.ranks = {}
+        self.order = []
+        self.order_texts = []
+        self.heads = {}
+        self.built_at = None
+        self.built = threading.Event()
+        self.refreshing = False
+        self.building = False
+        self.replay = []
+
+    def build(self, products, popularity):
+        """Replace the index with the given products; writes that arrive meanwhile are replayed on top"""
+        with self.lock:
+            self.building = True
+            self.replay = []
+        try:
+            entries = {product.id: Entry(product) for product in products if product.is_active}
+            terms = sorted((term, product_id) for product_id, entry in entries.items() for term in entry.terms)
+            rank = ranking(entries, popularity)
+            ranks = {product_id: rank(product_id) for product_id in entries}
+            order = sorted(ranks.values())
+            order_texts = [entries[rank[-1]].text for rank in order]
+            heads = {}
+            for length in range(1, WARM_PREFIX_LENGTH + 1):
+                # Terms are sorted, so each prefix's terms are one consecutive group
+                long_enough = (pair for pair in terms if len(pair[0]) >= length)
+                for prefix, group in itertools.groupby(long_enough, key=lambda pair: pair[0][:length]):
+                    matched = set(map(itemgetter(1), group))
+                    heads[prefix] = Head(heapq.nsmallest(MAX_LIMIT, map(ranks.__getitem__, matched)),
+                                         len(matched) <= MAX_LIMIT)
+        finally:
+            with self.lock:
+                self.building = False
+                replay, self.replay = self.replay, []
+        with self.lock:
+            self.terms = terms
+            self.entries = entries
+            self.rank = rank
+            self.ranks = ranks
+            self.order = order
+            self.order_texts = order_texts
+            self.heads = heads
+            self.built_at = time.monotonic()
+            for product_id, product in replay:
+                self.apply(product_id, product)
+        self.built.set()
+
+    def load(self):
+        from services.storage import storage
+        self.build(storage.active_products(), load_popularity())
+
+    def ensure_fresh(self, ttl_seconds, app=None):
+        """Build in the background if never built or older than the TTL; requests keep using the current index"""
+        with self.lock:
+            if self.refreshing or (self.built_at is not None and time.monotonic() - self.built_at < ttl_seconds):
+                return
+            self.refreshing = True
+        threading.Thread(target=self.refresh, args=(app or current_app._get_current_object(),),
+                         name='suggest-index', daemon=True).start()
+
+    def refresh(self, app):
+        try:
+            with app.app_context():
+                self.load()
+        except Exception:
+            app.logger.exception('Could not rebuild the suggest index')
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def put(self, product):
+        """Index a created or changed product, or drop it if inactive"""
+        with self.lock:
+            if self.building:
+                self.replay.append((product.id, product))
+            self.apply(product.id, product)
+
+    def remove(self, product_id):
+        with self.lock:
+            if self.building:
+                self.replay.append((product_id, None))
+            self.apply(product_id, None)
+
+    def apply(self, product_id, product):
+        # Caller holds the lock
+        old_rank = self.ranks.pop(product_id, None)
+        if old_rank is not None:
+            position = bisect.bisect_left(self.order, old_rank)
+            if position < len(self.order) and self.order[position] == old_rank:
+                del self.order[position]
+                del self.order_texts[position]
+        old = self.entries.pop(product_id, None)
+        new = Entry(product) if product is not None and product.is_active else None
+        if old is not None:
+            for term in old.terms:
+                position = bisect.bisect_left(self.terms, (term, product_id))
+                if position < len(self.terms) and self.terms[position] == (term, product_id):
+                    del self.terms[position]
+        if new is not None:
+            self.entries[product_id] = new
+            for term in new.terms:
+                bisect.insort(self.terms, (term, product_id))
+            rank = self.ranks[product_id] = self.rank(product_id)
+            position = bisect.bisect_left(self.order, rank)
+            self.order.insert(position, rank)
+            self.order_texts.insert(position, new.text)
+        self.update_heads(product_id, old, new)
+
+    def update_heads(self, product_id, old, new):
+        """Keep the cached heads of every prefix of the old and new terms in step"""
+        prefixes = {term[:length] for entry in (old, new) if entry is not None
+                    for term in entry.terms for length in range(1, len(term) + 1)}
+        rank = self.ranks.get(product_id)
+        for prefix in prefixes:
+            head = self.heads.get(prefix)
+            if head is None:
+                continue
+            ranked = [entry for entry in head.ranked if entry[-1] != product_id]
+            if len(ranked) < len(head.ranked) and not head.complete:
+                # Something below the cut may now belong in it
+                del self.heads[prefix]
+                continue
+            if rank is not None and any(term.startswith(prefix) for term in new.terms):
+                if head.complete or rank < ranked[-1]:
+                    bisect.insort(ranked, rank)
+                if len(ranked) > MAX_LIMIT:
+                    ranked.pop()
+                    head.complete = False
+            head.ranked = ranked
+
+    def prefix_range(self, prefix):
+        start = bisect.bisect_left(self.terms, (prefix,))
+        end = bisect.bisect_left(self.terms, (prefix + '\U0010ffff',), start)
+        return start, end
+
+    def search(self, query_words, limit):
+        """Best-ranked products matching every query word; returns (ranks, exact, complete)
+
+        exact means the ranks are the true best `limit` matches, complete
+        that they are all of the matches.
+        """
+        # Narrowest run first, so each pass below filters the fewest products
+        runs = sorted((end - start, start, end, word) for word, (start, end) in
+                      ((word, self.prefix_range(word)) for word in query_words))
+        length, start, end, _ = runs[0]
+        needles = [' ' + word for _, _, _, word in runs]
+
+        def scan_run(stop):
+            product_ids = set(map(itemgetter(1), self.terms[start:stop]))
+            for needle in needles[1:]:
+                # One plain pass per word is much cheaper than all() per product
+                product_ids = [product_id for product_id in product_ids if needle in self.entries[product_id].text]
+            return list(map(self.ranks.__getitem__, product_ids))
+
+        if length <= SCAN_LIMIT:
+            matched = scan_run(end)
+            return heapq.nsmallest(limit, matched), True, len(matched) <= limit
+
+        # Every word is common, so matches should turn up near the top of the ranking
+        texts = self.order_texts
+        positions = range(min(SCAN_LIMIT, len(texts)))
+        for needle in needles:
+            positions = [position for position in positions if needle in texts[position]]
+        found = [self.order[position] for position in positions[:limit]]
+        if len(found) == limit or len(texts) <= SCAN_LIMIT:
+            return found, True, len(texts) <= SCAN_LIMIT
+
+        # A rare combination of common words: the best of both bounded looks
+        return heapq.nsmallest(limit, set(found).union(scan_run(start + SCAN_LIMIT))), False, False
+
+    def head(self, prefix):
+        """Top MAX_LIMIT matches of a single-word prefix, kept once known and then maintained"""
+        head = self.heads.get(prefix)
+        if head is not None:
+            return head.ranked
+        ranked, exact, complete = self.search([prefix], MAX_LIMIT)
+        if exact:
+            if len(self.heads) >= HEAD_CACHE_SIZE:
+                self.heads = {key: kept for key, kept in self.heads.items() if len(key) <= WARM_PREFIX_LENGTH}
+            self.heads[prefix] = Head(ranked, complete)
+        return ranked
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Suggestions for a partial query, most popular first"""
+        query_words = sorted(set(words(query)))
+        if not query_words:
+            return []
+        with self.lock:
+            if len(query_words) == 1:
+                ranked = self.head(query_words[0])[:limit]
+            else:
+                # A word whose cached head holds all its matches bounds the candidates
+                complete = next((self.heads[word].ranked for word in query_words
+                                 if word in self.heads and self.heads[word].complete), None)
+                if complete is not None:
+                    needles = [' ' + word for word in query_words]
+                    ranked = [rank for rank in complete
+                              if all(needle in self.entries[rank[-1]].text for needle in needles)][:limit]
+                else:
+                    ranked, _, _ = self.search(query_words, limit)
+            return [self.entries[rank[-1]].suggestion for rank in ranked]
+
+
+suggest_index = SuggestIndex()
+
+
+class Snapshot:
+    """A product's indexed values as flushed; the instance itself is expired by the commit"""
+    __slots__ = SUGGEST_COLUMNS
+
+    def __init__(self, product):
+        for column in SUGGEST_COLUMNS:
+            setattr(self, column, getattr(product, column))
+
+
+def track_product_writes(session, flush_context):
+    """Remember products written in this transaction until it commits"""
+    changed = session.info.setdefault('suggest_changed', {})
+    for product in session.new:
+        if isinstance(product, Product):
+            changed[product.id] = Snapshot(product)
+    for product in session.dirty:
+        if isinstance(product, Product) and any(
+            inspect(product).attrs[column].history.has_changes() for column in SUGGEST_COLUMNS
+        ):
+            changed[product.id] = Snapshot(product)
+    for product in session.deleted:
+        if isinstance(product, Product):
+            changed[product.id] = None
+
+
+def apply_product_writes(session):
+    for product_id, product in session.info.pop('suggest_changed', {}).items():
+        if product is None:
+            suggest_index.remove(product_id)
+        else:
+            suggest_index.put(product)
+
+
+def forget_product_writes(session):
+    session.info.pop('suggest_changed', None)
+
+
+def init_app(app):
+    for identifier, listener in (
+        ('after_flush', track_product_writes),
+        ('after_commit', apply_product_writes),
+        ('after_rollback', forget_product_writes)
+    ):
+        if not event.contains(db.session, identifier, listener):
+            event.listen(db.session, identifier, listener)
+    # Built off the request path; ensure_fresh rebuilds it if this fails
+    suggest_index.ensure_fresh(app.config['SUGGEST_INDEX_TTL_SECONDS'], app)
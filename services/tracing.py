@@ -0,0 +1,336 @@
+"""
+Lightweight tracing spans
+
+Spans nest through a context variable, so a span opened anywhere inside a
+request becomes a child of that request's root span. Use tracer.wrap() to
+carry the current context into threads or background workers, or
+tracer.record() for a shared worker that acts for several requests at
+once. Finished
+spans are batched and exported off the request path to an NDJSON file or
+an OTLP/HTTP JSON collector.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from functools import wraps
+from flask import request, g
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """A timed operation with attributes, linked to its parent by trace id"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'status', '_token')
+
+    def __init__(self, name, trace_id, parent_id, kind='internal', attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, exc):
+        self.status = 'error'
+        self.attributes['error.type'] = type(exc).__name__
+        self.attributes['error.message'] = str(exc)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'kind': self.kind,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'durationMs': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': self.status
+        }
+
+
+class NoopSpan:
+    """Stand-in returned while tracing is disabled"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, exc):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class SpanContext:
+    """Context manager that activates a span for the duration of a block"""
+
+    def __init__(self, tracer, span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        self.span._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.set_error(exc)
+        self.tracer.finish(self.span)
+        return False
+
+
+class JsonFileExporter:
+    """Append finished spans to a newline-delimited JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + '\n')
+
+
+class OtlpHttpExporter:
+    """Send spans to an OTLP/HTTP collector using the JSON encoding"""
+
+    KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+
+    def __init__(self, endpoint, service_name, timeout=5):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def encode_value(self, value):
+        if isinstance(value, bool):
+            return {'boolValue': value}
+        if isinstance(value, int):
+            return {'intValue': str(value)}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+    def encode_span(self, span):
+        encoded = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': self.KINDS.get(span.kind, 1),
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns),
+            'attributes': [{'key': key, 'value': self.encode_value(value)} for key, value in span.attributes.items()],
+            'status': {'code': 2 if span.status == 'error' else 1}
+        }
+        if span.parent_id:
+            encoded['parentSpanId'] = span.parent_id
+        return encoded
+
+    def export(self, spans):
+        payload = {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{'scope': {'name': 'ecommerce.tracing'}, 'spans': [self.encode_span(s) for s in spans]}]
+            }]
+        }
+        req = urllib.request.Request(
+            self.endpoint, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}
+        )
+        urllib.request.urlopen(req, timeout=self.timeout).close()
+
+
+class BatchProcessor:
+    """Queue finished spans and export them in batches from a worker thread"""
+
+    def __init__(self, exporter, max_batch=512, interval=1.0, max_queue=10000):
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+        self._thread.start()
+
+    def on_end(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def _export(self, batch):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning('Failed to export %d spans: %s', len(batch), e)
+
+    def flush(self):
+        """Export everything queued so far on the calling thread"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._export(batch)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the configured processor"""
+
+    def __init__(self):
+        self.processor = None
+
+    @property
+    def enabled(self):
+        return self.processor is not None
+
+    def init_app(self, app):
+        """Pick an exporter from the app config and trace every request"""
+        exporter_name = app.config.get('TRACING_EXPORTER', 'none')
+        if exporter_name == 'json':
+            exporter = JsonFileExporter(app.config['TRACING_FILE'])
+        elif exporter_name == 'otlp':
+            exporter = OtlpHttpExporter(app.config['TRACING_OTLP_ENDPOINT'], app.config.get('TRACING_SERVICE_NAME', 'ecommerce-api'))
+        else:
+            exporter = None
+
+        if exporter is not None:
+            self.processor = BatchProcessor(exporter)
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+        app.extensions['tracer'] = self
+
+    def span(self, name, kind='internal', **attributes):
+        """Open a child of the current span (or a new trace)"""
+        if self.processor is None:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is None:
+            span = Span(name, f'{random.getrandbits(128):032x}', None, kind, attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+        return SpanContext(self, span)
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def record(self, name, parent, start_ns, end_ns, kind='internal', **attributes):
+        """Export a finished span under parent, for work another thread did on its behalf"""
+        if self.processor is None or not isinstance(parent, Span):
+            return
+        span = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+        span.start_ns = start_ns
+        span.end_ns = end_ns
+        self.processor.on_end(span)
+
+    def finish(self, span):
+        span.end_ns = time.time_ns()
+        if span._token is not None:
+            _current_span.reset(span._token)
+            span._token = None
+        self.processor.on_end(span)
+
+    def traced(self, name=None):
+        """Decorator that wraps a function call in a span"""
+        def decorator(func):
+            span_name = name or f'{func.__module__}.{func.__qualname__}'
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def wrap(self, func):
+        """Bind func to the current context so spans it opens join this trace"""
+        context = contextvars.copy_context()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return context.run(func, *args, **kwargs)
+        return wrapper
+
+    def _before_request(self):
+        trace_id, parent_id = parse_traceparent(request.headers.get('traceparent'))
+        span = Span(f'{request.method} {request.url_rule.rule if request.url_rule else request.path}',
+                    trace_id or f'{random.getrandbits(128):032x}', parent_id, 'server', {
+                        'http.method': request.method,
+                        'http.target': request.path
+                    })
+        span._token = _current_span.set(span)
+        g.trace_span = span
+
+    def _after_request(self, response):
+        span = g.get('trace_span')
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.status = 'error'
+            response.headers['traceparent'] = f'00-{span.trace_id}-{span.span_id}-01'
+        return response
+
+    def _teardown_request(self, exc):
+        span = g.pop('trace_span', None)
+        if span is None:
+            return
+        span.set_attribute('http.route', request.endpoint or 'unmatched')
+        if exc is not None:
+            span.set_error(exc)
+        self.finish(span)
+
+
+def parse_traceparent(header):
+    """Extract trace and parent span ids from a W3C traceparent header"""
+    if not header:
+        return None, None
+    parts = header.split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+tracer = Tracer()
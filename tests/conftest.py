@@ -0,0 +1,86 @@
+import itertools
+import pytest
+from app import create_app, db
+from services.suggest import suggest_index
+
+_names = itertools.count()
+
+
+def unique_name(prefix):
+    """A name no other test uses, since one database serves the whole session"""
+    return f'{prefix}{next(_names)}'
+
+
+@pytest.fixture(scope='session', params=['memory', 'sql'])
+def app(request, tmp_path_factory):
+    """The app once per storage backend; sql runs on a SQLite file"""
+    database = tmp_path_factory.mktemp(request.param) / 'shop.db'
+    app = create_app({
+        'TESTING': True,
+        'STORAGE_BACKEND': request.param,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        'RATE_LIMIT_ENABLED': False,
+        'JWT_SECRET_KEY': 'test-secret-that-is-long-enough-for-hs256'
+    })
+    # The suggest index is built in the background
+    assert suggest_index.built.wait(10)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def unique():
+    return unique_name
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def register(client, role='customer'):
+    username = unique_name(role)
+    response = client.post('/api/auth/register', json={
+        'username': username,
+        'email': f'{username}@example.com',
+        'password': 'secret123',
+        'firstName': 'Test',
+        'lastName': role.title(),
+        'role': role
+    })
+    assert response.status_code == 201, response.get_json()
+    body = response.get_json()
+    return {'id': body['user']['id'], 'headers': {'Authorization': f"Bearer {body['access_token']}"}}
+
+
+@pytest.fixture
+def admin(client):
+    return register(client, 'admin')
+
+
+@pytest.fixture
+def customer(client):
+    return register(client)
+
+
+@pytest.fixture
+def make_product(client, admin):
+    """Create a product through the API; keyword arguments override the defaults"""
+    def make(**fields):
+        body = {
+            'name': unique_name('Widget '),
+            'description': 'A test product',
+            'sku': unique_name('SKU-'),
+            'price': '19.99',
+            'category': 'Testing',
+            'imageUrl': 'https://example.com/widget.png',
+            'stockQuantity': 10,
+            'rating': '4.0'
+        }
+        body.update(fields)
+        response = client.post('/api/products', json=body, headers=admin['headers'])
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()
+    return make
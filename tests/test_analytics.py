@@ -0,0 +1,40 @@
+import pytest
+
+SQL_ONLY = [
+    '/api/products/top-sellers',
+    '/api/products/top-categories',
+    '/api/exports/orders',
+]
+
+
+def metrics(client, admin):
+    response = client.get('/api/analytics/metrics', headers=admin['headers'])
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_metrics_follow_orders_and_stock(client, admin, customer, make_product):
+    before = metrics(client, admin)
+    product = make_product(stockQuantity=5, price='10.00')
+
+    response = client.post('/api/orders', json={
+        'order': {'shippingAddress': '1 Test Street'},
+        'items': [{'productId': product['id'], 'quantity': 2}]
+    }, headers=customer['headers'])
+    assert response.status_code == 201
+
+    after = metrics(client, admin)
+    assert after['totalOrders'] == before['totalOrders'] + 1
+    assert after['pendingOrders'] == before['pendingOrders'] + 1
+    assert after['totalRevenue'] == pytest.approx(before['totalRevenue'] + 20)
+    assert after['lowStockCount'] == before['lowStockCount'] + 1
+
+
+@pytest.mark.parametrize('url', SQL_ONLY)
+def test_sql_only_endpoints_refuse_other_backends(app, client, admin, url):
+    response = client.get(url, headers=admin['headers'])
+    if app.config['STORAGE_BACKEND'] == 'sql':
+        assert response.status_code == 200
+    else:
+        assert response.status_code == 501
+        assert 'not supported' in response.get_json()['error'].lower()
@@ -0,0 +1,153 @@
+def stock_of(client, product_id):
+    return client.get(f'/api/products/{product_id}').get_json()['stockQuantity']
+
+
+def checkout(client, customer, product_id, quantity, **headers):
+    return client.post('/api/orders', json={
+        'order': {'shippingAddress': '1 Test Street'},
+        'items': [{'productId': product_id, 'quantity': quantity}]
+    }, headers={**customer['headers'], **headers})
+
+
+def test_checkout_reserves_stock(client, customer, make_product):
+    product = make_product(stockQuantity=5)
+
+    response = checkout(client, customer, product['id'], 2)
+    assert response.status_code == 201
+    order = response.get_json()
+    assert order['status'] == 'pending'
+    assert order['totalAmount'] == '39.98'
+    assert stock_of(client, product['id']) == 3
+
+
+def test_checkout_refuses_more_than_in_stock(client, customer, make_product):
+    product = make_product(stockQuantity=1)
+
+    response = checkout(client, customer, product['id'], 2)
+    assert response.status_code == 400
+    assert stock_of(client, product['id']) == 1
+
+
+def test_cancel_restores_stock(client, customer, make_product):
+    product = make_product(stockQuantity=5)
+    order = checkout(client, customer, product['id'], 3).get_json()
+
+    response = client.post(f"/api/orders/{order['id']}/cancel", headers=customer['headers'])
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'cancelled'
+    assert stock_of(client, product['id']) == 5
+
+    assert client.post(f"/api/orders/{order['id']}/cancel", headers=customer['headers']).status_code == 400
+    assert stock_of(client, product['id']) == 5
+
+
+def test_status_cancel_restores_stock(client, admin, customer, make_product):
+    product = make_product(stockQuantity=5)
+    order = checkout(client, customer, product['id'], 2).get_json()
+
+    response = client.put(f"/api/orders/{order['id']}/status", json={'status': 'cancelled'}, headers=admin['headers'])
+    assert response.status_code == 200
+    assert stock_of(client, product['id']) == 5
+
+
+def test_idempotent_checkout_replays(client, customer, make_product, unique):
+    product = make_product(stockQuantity=5)
+    key = unique('checkout-')
+
+    first = checkout(client, customer, product['id'], 1, **{'Idempotency-Key': key})
+    second = checkout(client, customer, product['id'], 1, **{'Idempotency-Key': key})
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json()['id'] == first.get_json()['id']
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert stock_of(client, product['id']) == 4
+
+    reused = checkout(client, customer, product['id'], 2, **{'Idempotency-Key': key})
+    assert reused.status_code == 422
+    assert stock_of(client, product['id']) == 4
+
+
+def test_stale_if_match_conflicts(client, admin, make_product):
+    product = make_product(stockQuantity=5)
+    etag = client.get(f"/api/products/{product['id']}").headers['ETag']
+
+    response = client.put(f"/api/products/{product['id']}/stock", json={'quantity': 7},
+                          headers={**admin['headers'], 'If-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    response = client.put(f"/api/products/{product['id']}/stock", json={'quantity': 9},
+                          headers={**admin['headers'], 'If-Match': etag})
+    assert response.status_code == 409
+    assert response.get_json()['currentVersion'] == product['version'] + 1
+    assert stock_of(client, product['id']) == 7
+
+
+def test_stale_order_version_conflicts(client, admin, customer, make_product):
+    product = make_product(stockQuantity=5)
+    order = checkout(client, customer, product['id'], 1).get_json()
+    etag = client.get(f"/api/orders/{order['id']}", headers=admin['headers']).headers['ETag']
+    assert client.get(f"/api/orders/number/{order['orderNumber']}", headers=admin['headers']).headers['ETag'] == etag
+
+    assert client.put(f"/api/orders/{order['id']}/status", json={'status': 'processing'},
+                      headers={**admin['headers'], 'If-Match': etag}).status_code == 200
+    response = client.put(f"/api/orders/{order['id']}/status", json={'status': 'cancelled'},
+                          headers={**admin['headers'], 'If-Match': etag})
+    assert response.status_code == 409
+    assert stock_of(client, product['id']) == 4
+
+
+def test_idempotent_checkout_gives_up_when_owners_keep_failing(client, customer, make_product, unique, monkeypatch):
+    product = make_product(stockQuantity=5)
+    claims = []
+    # Every claim loses to an owner that fails and releases the key before the lookup
+    monkeypatch.setattr('services.idempotency.claim_key', lambda *args: claims.append(args) or (None, False))
+
+    response = checkout(client, customer, product['id'], 1, **{'Idempotency-Key': unique('checkout-')})
+    assert response.status_code == 409
+    assert len(claims) == 3
+    assert stock_of(client, product['id']) == 5
+
+
+def test_shipped_orders_cancel_without_restock(client, admin, customer, make_product):
+    product = make_product(stockQuantity=5)
+    order = checkout(client, customer, product['id'], 2).get_json()
+    for status in ('processing', 'shipped'):
+        client.put(f"/api/orders/{order['id']}/status", json={'status': status}, headers=admin['headers'])
+
+    response = client.put('/api/orders/bulk/status', json={'status': 'cancelled', 'orderIds': [order['id']]},
+                          headers=admin['headers'])
+    assert response.status_code == 200
+    assert response.get_json()['results'] == [
+        {'orderId': order['id'], 'outcome': 'updated', 'from': 'shipped', 'restocked': False}
+    ]
+    assert stock_of(client, product['id']) == 3
+
+
+def test_cancelled_orders_cannot_reopen(client, admin, customer, make_product):
+    product = make_product(stockQuantity=5)
+    order = checkout(client, customer, product['id'], 2).get_json()
+
+    def move(status):
+        return client.put(f"/api/orders/{order['id']}/status", json={'status': status}, headers=admin['headers'])
+
+    assert move('cancelled').status_code == 200
+    assert stock_of(client, product['id']) == 5
+    for status in ('pending', 'processing'):
+        assert move(status).status_code == 400
+    assert move('cancelled').status_code == 200
+    assert client.get(f"/api/orders/{order['id']}", headers=admin['headers']).get_json()['status'] == 'cancelled'
+    assert stock_of(client, product['id']) == 5
+
+
+def test_delivered_orders_are_final(client, admin, customer, make_product):
+    product = make_product(stockQuantity=5)
+    order = checkout(client, customer, product['id'], 1).get_json()
+    for status in ('processing', 'shipped', 'delivered'):
+        assert client.put(f"/api/orders/{order['id']}/status", json={'status': status},
+                          headers=admin['headers']).status_code == 200
+
+    for status in ('shipped', 'cancelled'):
+        assert client.put(f"/api/orders/{order['id']}/status", json={'status': status},
+                          headers=admin['headers']).status_code == 400
+    assert stock_of(client, product['id']) == 4
@@ -0,0 +1,169 @@
+from collections import Counter
+from decimal import Decimal
+from services.facets import FACETS, facet_values, as_response
+
+
+def all_pages(client, **params):
+    """Follow X-Next-Cursor until the last page; returns the pages"""
+    pages = []
+    cursor = None
+    while True:
+        response = client.get('/api/products', query_string={**params, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return pages
+
+
+def test_keyset_paging_covers_every_product_once(client, make_product, unique):
+    category = unique('Paging')
+    prices = ['5.00', '7.50', '7.50', '7.50', '12.00', '3.25', '7.50']
+    created = [make_product(category=category, price=price) for price in prices]
+
+    pages = all_pages(client, category=category, sort='price_asc', limit=2)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    listed = [product['id'] for page in pages for product in page]
+    # Equal prices are ordered by id, so no page repeats or skips one
+    expected = sorted(created, key=lambda product: (float(product['price']), product['id']))
+    assert listed == [product['id'] for product in expected]
+
+
+def test_keyset_paging_rejects_a_cursor_for_another_sort(client, make_product, unique):
+    category = unique('Paging')
+    for price in ('1.00', '2.00', '3.00'):
+        make_product(category=category, price=price)
+    cursor = client.get('/api/products', query_string={'category': category, 'sort': 'price_asc', 'limit': 1}) \
+        .headers['X-Next-Cursor']
+
+    response = client.get('/api/products', query_string={'category': category, 'sort': 'rating', 'cursor': cursor})
+    assert response.status_code == 400
+
+
+def expected_facets(products, category=None):
+    """Count from scratch, each facet with every filter but its own"""
+    counts = {facet: Counter() for facet in FACETS}
+    for product in products:
+        in_category = category is None or product['category'] == category
+        for facet, value in facet_values(product['category'], Decimal(product['price']), Decimal(product['rating']),
+                                         product['stockQuantity'], product['isActive']):
+            if in_category or facet == 'category':
+                counts[facet][value] += 1
+    return as_response(counts)
+
+
+def facets(client, **params):
+    response = client.get('/api/products', query_string={'facets': 'true', **params})
+    assert response.status_code == 200
+    return response.get_json()['facets']
+
+
+def test_facet_counts_match_a_rebuild(app, client, admin, make_product, unique):
+    if app.config['STORAGE_BACKEND'] == 'sql':
+        from services.facets import rebuild_counts
+        with app.app_context():
+            rebuild_counts()
+
+    category = unique('Facets')
+    cheap = make_product(category=category, price='9.99', rating='2.5')
+    make_product(category=category, price='60.00', rating='4.5')
+    gone = make_product(category=category, price='300.00', stockQuantity=3)
+    retired = make_product(category=category, price='30.00')
+    client.put(f"/api/products/{cheap['id']}", json={'price': '120.00'}, headers=admin['headers'])
+    client.put(f"/api/products/{gone['id']}/stock", json={'quantity': 0}, headers=admin['headers'])
+    client.put(f"/api/products/{retired['id']}", json={'isActive': False}, headers=admin['headers'])
+
+    products = client.get('/api/products').get_json()
+    assert facets(client) == expected_facets(products)
+    assert facets(client, category=category) == expected_facets(products, category)
+    assert {entry['value']: entry['count'] for entry in facets(client, category=category)['availability']} == \
+        {'inStock': 2, 'outOfStock': 1}
+
+    if app.config['STORAGE_BACKEND'] == 'sql':
+        incremental = facets(client)
+        with app.app_context():
+            rebuild_counts()
+        assert facets(client) == incremental
+
+
+def suggested(client, query, **params):
+    response = client.get('/api/products/suggest', query_string={'q': query, **params})
+    assert response.status_code == 200
+    return [suggestion['name'] for suggestion in response.get_json()['suggestions']]
+
+
+def test_suggest_ranks_by_rating_then_name(client, make_product, unique):
+    word = unique('zephyr')
+    make_product(name=f'{word} Lamp', rating='3.0')
+    make_product(name=f'{word} Chair', rating='4.5')
+    make_product(name=f'{word} Desk', rating='4.5')
+    make_product(name=f'Plain {word} Rug', rating='1.0', category='Rugs')
+
+    assert suggested(client, word[:-1]) == [f'{word} Chair', f'{word} Desk', f'{word} Lamp', f'Plain {word} Rug']
+    assert suggested(client, word, limit=2) == [f'{word} Chair', f'{word} Desk']
+    assert suggested(client, f'{word} rug') == [f'Plain {word} Rug']
+    assert suggested(client, f'ru {word[:-1]}') == [f'Plain {word} Rug']
+
+
+def test_suggest_follows_product_writes(client, admin, make_product, unique):
+    word = unique('quokka')
+    product = make_product(name=f'{word} Kettle', sku=unique('QK-'))
+
+    client.put(f"/api/products/{product['id']}", json={'name': 'Renamed Kettle'}, headers=admin['headers'])
+    assert suggested(client, word) == []
+    assert suggested(client, 'renamed kett') == ['Renamed Kettle']
+
+    client.put(f"/api/products/{product['id']}", json={'isActive': False}, headers=admin['headers'])
+    assert suggested(client, 'renamed kett') == []
+
+
+def test_suggest_prices_have_two_decimals(client, make_product, unique):
+    word = unique('wombat')
+    make_product(name=f'{word} Mug', price=12.5)
+
+    response = client.get('/api/products/suggest', query_string={'q': word})
+    assert [suggestion['price'] for suggestion in response.get_json()['suggestions']] == ['12.50']
+
+
+def bought_together(client, product):
+    response = client.get(f"/api/products/{product['id']}/bought-together")
+    assert response.status_code == 200, response.get_json()
+    return {related['id']: related['boughtTogether'] for related in response.get_json()}
+
+
+def test_bought_together_leaves_out_cancelled_orders(app, client, customer, make_product):
+    lamp, shade, bulb = (make_product(stockQuantity=10) for _ in range(3))
+    if app.config['STORAGE_BACKEND'] != 'sql':
+        assert client.get(f"/api/products/{lamp['id']}/bought-together").status_code == 501
+        return
+    from services.recommendations import build_full, refresh
+
+    def checkout(*products):
+        return client.post('/api/orders', json={
+            'order': {'shippingAddress': '1 Test Street'},
+            'items': [{'productId': product['id'], 'quantity': 1} for product in products]
+        }, headers=customer['headers']).get_json()
+
+    def cancel(order):
+        assert client.post(f"/api/orders/{order['id']}/cancel", headers=customer['headers']).status_code == 200
+
+    checkout(lamp, shade)
+    cancel(checkout(lamp, bulb))
+    with app.app_context():
+        build_full(app.config['RECOMMENDATIONS_TOP_N'], lag_seconds=0)
+    assert bought_together(client, lamp) == {shade['id']: 1}
+
+    # Folded in by the build, so cancelling takes the pair back out
+    folded = checkout(lamp, shade)
+    with app.app_context():
+        refresh(app.config['RECOMMENDATIONS_TOP_N'], lag_seconds=0)
+    assert bought_together(client, lamp) == {shade['id']: 2}
+    cancel(folded)
+    assert bought_together(client, lamp) == {shade['id']: 1}
+
+    # Cancelled before the next refresh, so it is never counted
+    cancel(checkout(lamp, bulb))
+    with app.app_context():
+        refresh(app.config['RECOMMENDATIONS_TOP_N'], lag_seconds=0)
+    assert bought_together(client, lamp) == {shade['id']: 1}
+    assert bought_together(client, bulb) == {}
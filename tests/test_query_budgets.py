@@ -0,0 +1,62 @@
+import logging
+import pytest
+from services.querystats import QueryStats, capture_queries
+
+
+@pytest.fixture
+def sql_app(app):
+    if app.config['STORAGE_BACKEND'] != 'sql':
+        pytest.skip('statement budgets apply to the sql backend')
+    return app
+
+
+@pytest.fixture
+def requests_by_endpoint(client, admin, customer, make_product):
+    """One request per budgeted endpoint, against a few rows of each kind"""
+    products = [make_product(stockQuantity=20) for _ in range(3)]
+    order = client.post('/api/orders', json={
+        'order': {'shippingAddress': '1 Test Street'},
+        'items': [{'productId': product['id'], 'quantity': 1} for product in products]
+    }, headers=customer['headers']).get_json()
+    for product in products:
+        client.post('/api/cart', json={'userId': customer['id'], 'productId': product['id'], 'quantity': 1},
+                    headers=customer['headers'])
+    return {
+        'products.get_products': ('/api/products?limit=20', {}),
+        'products.get_product': (f"/api/products/{products[0]['id']}", {}),
+        'orders.get_order': (f"/api/orders/{order['id']}", customer['headers']),
+        'orders.get_order_by_number': (f"/api/orders/number/{order['orderNumber']}", customer['headers']),
+        'cart.get_cart_items': (f"/api/cart/{customer['id']}", customer['headers']),
+        'analytics.get_metrics': ('/api/analytics/metrics', admin['headers'])
+    }
+
+
+def test_budgeted_endpoints_stay_within_budget(sql_app, client, requests_by_endpoint):
+    budgets = sql_app.config['QUERY_BUDGETS']
+    assert set(requests_by_endpoint) == set(budgets)
+    for endpoint, (url, headers) in requests_by_endpoint.items():
+        with capture_queries() as stats:
+            response = client.get(url, headers=headers)
+        assert response.status_code == 200, (endpoint, response.get_json())
+        assert stats.count <= budgets[endpoint], (endpoint, list(stats.statements))
+
+
+def test_repeated_counts_distinct_parameters():
+    stats = QueryStats()
+    for product_id in ('a', 'b', 'c'):
+        stats.record('SELECT * FROM products WHERE id = ?', 0.001, (product_id,))
+    for _ in range(3):
+        stats.record('SELECT * FROM users WHERE id = ?', 0.001, ('same',))
+
+    assert stats.repeated(3) == {'SELECT * FROM products WHERE id = ?': 3}
+
+
+def test_slow_query_plan_leaves_the_request_usable(sql_app, client, make_product, caplog, monkeypatch):
+    product = make_product()
+    monkeypatch.setitem(sql_app.config, 'SLOW_QUERY_SECONDS', 0)
+
+    with caplog.at_level(logging.WARNING, logger='services.querystats'):
+        response = client.get(f"/api/products/{product['id']}")
+    assert response.status_code == 200
+    plans = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Slow query')]
+    assert plans and not any('unavailable' in plan for plan in plans)